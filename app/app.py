@@ -1,18 +1,53 @@
 import os
 import re
-from glob import glob
+from functools import lru_cache
 
 import gradio as gr
+from docx_translation import translate_docx
+from export_store import EXPORT_FORMATS, ExportStore
+from file_utils import extract_pdf, iter_pdf_pages
+import src.translation_agent.cancellation as cancellation
+import src.translation_agent.jobs as jobs
+import src.translation_agent.planner as planner
+import src.translation_agent.preprocessing as preprocessing
+import src.translation_agent.resources as resources
+import src.translation_agent.segmenter as segmenter
+import src.translation_agent.streaming as streaming
+import src.translation_agent.subtitles as subtitles
+import process
 from process import (
+    TranslationError,
     diff_texts,
     extract_docx,
-    extract_pdf,
     extract_text,
+    iter_diff,
+    metrics,
     model_load,
     translator,
     translator_sec,
 )
 
+exports = ExportStore()
+
+
+@lru_cache(maxsize=None)
+def job_store() -> jobs.JobStore:
+    """The translations reused between uploads, in one shared connection."""
+    return jobs.JobStore()
+
+
+# Report the translation's stages and glossary warnings in the page
+process.progress = gr.Progress()
+process.warn = gr.Warning
+
+# The UI serves several sessions at once, so tokenizing, glossary marking,
+# diffing and parsing run in worker processes unless configured otherwise
+if "TRANSLATION_AGENT_PREPROCESS_WORKERS" not in os.environ:
+    preprocessing.set_workers(os.cpu_count())
+
+# Tokens in the first partial diff shown; each later update doubles it
+DIFF_BATCH_TOKENS = 2000
+
 
 def huanik(
     endpoint: str,
@@ -31,6 +66,7 @@ def huanik(
     max_tokens: int,
     temperature: int,
     rpm: int,
+    request: gr.Request,
 ):
     if not source_text or source_lang == target_lang:
         raise gr.Error(
@@ -44,40 +80,140 @@ def huanik(
 
     source_text = re.sub(r"(?m)^\s*$\n?", "", source_text)
 
-    if choice:
-        init_translation, reflect_translation, final_translation = (
-            translator_sec(
-                endpoint2=endpoint2,
-                base2=base2,
-                model2=model2,
-                api_key2=api_key2,
-                source_lang=source_lang,
-                target_lang=target_lang,
-                source_text=source_text,
-                country=country,
-                max_tokens=max_tokens,
-            )
-        )
+    # Stop and the tab closing cancel this session's job between chunks
+    try:
+        with cancellation.sessions.job(request.session_hash):
+            if choice:
+                init_translation, reflect_translation, final_translation = (
+                    translator_sec(
+                        endpoint2=endpoint2,
+                        base2=base2,
+                        model2=model2,
+                        api_key2=api_key2,
+                        source_lang=source_lang,
+                        target_lang=target_lang,
+                        source_text=source_text,
+                        country=country,
+                        max_tokens=max_tokens,
+                    )
+                )
 
+            else:
+                init_translation, reflect_translation, final_translation = (
+                    translator(
+                        source_lang=source_lang,
+                        target_lang=target_lang,
+                        source_text=source_text,
+                        country=country,
+                        max_tokens=max_tokens,
+                    )
+                )
+    except cancellation.TranslationCancelledError as e:
+        raise gr.Error(f"Translation stopped: {e}") from e
+    except TranslationError as e:
+        raise gr.Error(str(e)) from e
+
+    return init_translation, reflect_translation, final_translation
+
+
+def show_diff(init_translation: str, final_translation: str):
+    # Runs as its own event after the translation and streams the diff in
+    # growing batches, so a long document shows its first paragraphs early
+    size = len(init_translation) + len(final_translation)
+    if preprocessing.offloads(size):
+        # A worker computes it without holding up the other sessions
+        tokens = preprocessing.run(
+            diff_texts, init_translation, final_translation, size=size
+        )
     else:
-        init_translation, reflect_translation, final_translation = translator(
-            source_lang=source_lang,
-            target_lang=target_lang,
-            source_text=source_text,
-            country=country,
-            max_tokens=max_tokens,
+        tokens = iter_diff(init_translation, final_translation)
+    highlighted = []
+    batch = DIFF_BATCH_TOKENS
+    for token in tokens:
+        highlighted.append(token)
+        if len(highlighted) >= batch:
+            yield gr.update(value=list(highlighted), visible=True)
+            batch *= 2
+    yield gr.update(value=highlighted, visible=True)
+
+
+def translate_file(
+    endpoint: str,
+    base: str,
+    model: str,
+    api_key: str,
+    source_lang: str,
+    target_lang: str,
+    temperature: int,
+    rpm: int,
+    path: str,
+    request: gr.Request,
+):
+    if source_lang == target_lang:
+        raise gr.Error(
+            "Please check that the content or options are entered correctly."
         )
 
-    final_diff = gr.HighlightedText(
-        diff_texts(init_translation, final_translation),
-        label="Diff translation",
-        combine_adjacent=True,
-        show_legend=True,
-        visible=True,
-        color_map={"removed": "red", "added": "green"},
-    )
+    try:
+        model_load(endpoint, base, model, api_key, temperature, rpm)
+    except Exception as e:
+        raise gr.Error(f"An unexpected error occurred: {e}") from e
 
-    return init_translation, reflect_translation, final_translation, final_diff
+    # Translate into a copy that keeps the file's structure, ready to download
+    stem, ext = os.path.splitext(os.path.basename(path))
+    ext = ext.lower()
+    # A PDF's layout can't be rebuilt, so its translation is plain text
+    name = f"{stem}.{target_lang}{'.txt' if ext == '.pdf' else ext}"
+    try:
+        with cancellation.sessions.job(request.session_hash), exports.open(
+            name
+        ) as (temp_path, output_path):
+            if ext == ".docx":
+                translate_docx(path, temp_path, source_lang, target_lang)
+            elif ext == ".pdf":
+                # Pages are translated as they are read and each chunk is
+                # written once done, so a long PDF is never held in memory
+                chunks = streaming.translate_stream(
+                    source_lang, target_lang, iter_pdf_pages(path), 3
+                )
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    for translation in chunks:
+                        f.write(translation)
+            else:
+                content = extract_text(path)
+                if ext == ".srt":
+                    translated = subtitles.translate_srt(
+                        source_lang, target_lang, content
+                    )
+                elif ext.lstrip(".") in segmenter.SEGMENTERS:
+                    # Code stays as it is; comments and prose are translated
+                    translated = segmenter.translate_segmented(
+                        source_lang,
+                        target_lang,
+                        content,
+                        store=job_store(),
+                        file_format=ext,
+                    )
+                else:
+                    # Strings unchanged since an earlier upload are reused
+                    translate = (
+                        resources.translate_json
+                        if ext == ".json"
+                        else resources.translate_po
+                    )
+                    translated = translate(
+                        source_lang,
+                        target_lang,
+                        content,
+                        store=job_store(),
+                    )
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.write(translated)
+    except cancellation.TranslationCancelledError as e:
+        raise gr.Error(f"Translation stopped: {e}") from e
+    except TranslationError as e:
+        raise gr.Error(str(e)) from e
+    return gr.update(value=output_path, visible=True)
 
 
 def update_model(endpoint):
@@ -99,17 +235,33 @@ def read_doc(path):
     file_type = path.split(".")[-1]
     print(file_type)
     if file_type in ["pdf", "txt", "py", "docx", "json", "cpp", "md"]:
+        # The text box needs the whole text, so documents are read in one
+        # step, in the shared preprocessing pool rather than a pool per upload
         if file_type.endswith("pdf"):
-            content = extract_pdf(path)
+            content = preprocessing.run(
+                extract_pdf, path, size=os.path.getsize(path)
+            )
         elif file_type.endswith("docx"):
-            content = extract_docx(path)
+            content = preprocessing.run(
+                extract_docx, path, size=os.path.getsize(path)
+            )
         else:
-            content = extract_text(path)
+            # Drop blank lines while reading rather than over a full copy
+            return "".join(
+                streaming.drop_blank_lines(streaming.iter_file(path))
+            )
         return re.sub(r"(?m)^\s*$\n?", "", content)
     else:
         raise gr.Error("Oops, unsupported files.")
 
 
+def estimate(source_text, max_tokens, rpm):
+    if not source_text:
+        return gr.update(value="", visible=False)
+    estimated = planner.plan(source_text, max_tokens=max_tokens, rpm=rpm)
+    return gr.update(value=f"Estimated: {estimated.summary()}", visible=True)
+
+
 def enable_sec(choice):
     if choice:
         return gr.update(visible=True)
@@ -121,16 +273,27 @@ def update_menu(visible):
     return not visible, gr.update(visible=not visible)
 
 
-def export_txt(strings):
-    if strings:
-        os.makedirs("outputs", exist_ok=True)
-        base_count = len(glob(os.path.join("outputs", "*.txt")))
-        file_path = os.path.join("outputs", f"{base_count:06d}.txt")
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(strings)
-        return gr.update(value=file_path, visible=True)
-    else:
+def export_translation(
+    export_format, source_lang, target_lang, source_text, output_final
+):
+    if not output_final:
         return gr.update(visible=False)
+    if export_format == "docx":
+        path = exports.write_docx(output_final)
+    elif export_format == "jsonl":
+        path = exports.write_jsonl(
+            [
+                {
+                    "source_lang": source_lang,
+                    "target_lang": target_lang,
+                    "source_text": source_text,
+                    "translation": output_final,
+                }
+            ]
+        )
+    else:
+        path = exports.write_text(output_final)
+    return gr.update(value=path, visible=True)
 
 
 def switch(source_lang, source_text, target_lang, output_final):
@@ -150,12 +313,16 @@ def switch(source_lang, source_text, target_lang, output_final):
         )
 
 
+def stop_translation(request: gr.Request):
+    cancellation.sessions.cancel(request.session_hash)
+
+
 def close_btn_show():
     return gr.update(visible=False), gr.update(visible=True)
 
 
-def close_btn_hide(output_diff):
-    if output_diff:
+def close_btn_hide(output_final):
+    if output_final:
         return gr.update(visible=True), gr.update(visible=False)
     else:
         return gr.update(visible=False), gr.update(visible=True)
@@ -311,6 +478,11 @@ with gr.Blocks(theme="soft", css=CSS, fill_height=True) as demo:
                     value=60,
                     step=1,
                 )
+                export_format = gr.Radio(
+                    label="Export Format",
+                    choices=list(EXPORT_FORMATS),
+                    value="txt",
+                )
 
         with gr.Column(scale=4):
             source_text = gr.Textbox(
@@ -318,6 +490,7 @@ with gr.Blocks(theme="soft", css=CSS, fill_height=True) as demo:
                 value="If one advances confidently in the direction of his dreams, and endeavors to live the life which he has imagined, he will meet with a success unexpected in common hours.",
                 lines=12,
             )
+            plan_info = gr.Markdown(visible=False)
             with gr.Tab("Final"):
                 output_final = gr.Textbox(
                     label="Final Translation", lines=12, show_copy_button=True
@@ -331,10 +504,30 @@ with gr.Blocks(theme="soft", css=CSS, fill_height=True) as demo:
                     label="Reflection", lines=12, show_copy_button=True
                 )
             with gr.Tab("Diff"):
-                output_diff = gr.HighlightedText(visible=False)
+                output_diff = gr.HighlightedText(
+                    label="Diff translation",
+                    combine_adjacent=True,
+                    show_legend=True,
+                    visible=False,
+                    color_map={"removed": "red", "added": "green"},
+                )
     with gr.Row():
         submit = gr.Button(value="Translate")
         upload = gr.UploadButton(label="Upload", file_types=["text"])
+        upload_file = gr.UploadButton(
+            label="Translate File",
+            file_types=[
+                ".docx",
+                ".pdf",
+                ".srt",
+                ".json",
+                ".po",
+                ".pot",
+                ".md",
+                ".py",
+                ".cpp",
+            ],
+        )
         export = gr.DownloadButton(visible=False)
         clear = gr.ClearButton(
             [source_text, output_init, output_reflect, output_final]
@@ -377,16 +570,58 @@ with gr.Blocks(theme="soft", css=CSS, fill_height=True) as demo:
             temperature,
             rpm,
         ],
-        outputs=[output_init, output_reflect, output_final, output_diff],
+        outputs=[output_init, output_reflect, output_final],
+    )
+    diff_ta = start_ta.success(
+        fn=show_diff, inputs=[output_init, output_final], outputs=[output_diff]
     )
     upload.upload(fn=read_doc, inputs=upload, outputs=source_text)
-    output_diff.change(fn=export_txt, inputs=output_final, outputs=[export])
+    file_ta = upload_file.upload(
+        fn=translate_file,
+        inputs=[
+            endpoint,
+            base,
+            model,
+            api_key,
+            source_lang,
+            target_lang,
+            temperature,
+            rpm,
+            upload_file,
+        ],
+        outputs=[export],
+    )
+    # Re-plan when editing pauses rather than on every keystroke or drag
+    gr.on(
+        triggers=[
+            source_text.blur,
+            source_text.submit,
+            max_tokens.release,
+            rpm.release,
+        ],
+        fn=estimate,
+        inputs=[source_text, max_tokens, rpm],
+        outputs=[plan_info],
+    )
+    start_ta.success(
+        fn=export_translation,
+        inputs=[
+            export_format,
+            source_lang,
+            target_lang,
+            source_text,
+            output_final,
+        ],
+        outputs=[export],
+    )
 
     submit.click(fn=close_btn_show, outputs=[clear, close])
-    output_diff.change(
-        fn=close_btn_hide, inputs=output_diff, outputs=[clear, close]
+    start_ta.then(
+        fn=close_btn_hide, inputs=output_final, outputs=[clear, close]
     )
-    close.click(fn=None, cancels=start_ta)
+    close.click(fn=stop_translation, cancels=[start_ta, file_ta, diff_ta])
+    demo.unload(stop_translation)
 
 if __name__ == "__main__":
+    metrics.start_from_env()
     demo.queue(api_open=False).launch(show_api=False, share=False)
@@ -0,0 +1,249 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+
+import docx
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.hyperlink import Hyperlink
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from icecream import ic
+
+import src.translation_agent.batching as batching
+
+
+# Run children that hold text only; a run with anything else (a picture, a
+# field, a page break) is left untouched, since setting its text drops them
+_TEXT_TAGS = {qn("w:t"), qn("w:tab"), qn("w:cr"), qn("w:rPr")}
+_RUN_TAG = re.compile(r"<r(\d+)>(.*?)</r\1>", re.DOTALL)
+_ANY_RUN_TAG = re.compile(r"</?r\d+>")
+_RUN_TAG_INSTRUCTIONS = """
+The segments are the paragraphs of a Word document, in document order. \
+Some of them mix formatting, and mark each differently formatted span with \
+tags such as <r0>...</r0>. Keep every tag, and put the translation of each \
+span inside its tag, reordering the tagged spans if word order needs it.
+"""
+
+
+@dataclass
+class Segment:
+    """The text runs of one paragraph, translated as a unit."""
+
+    runs: List[Run]
+
+    @property
+    def source(self) -> str:
+        if len(self.runs) == 1:
+            return self.runs[0].text
+        # Tag each run so the translation can be split back along them
+        return "".join(
+            f"<r{i}>{run.text}</r{i}>" for i, run in enumerate(self.runs)
+        )
+
+    def write(self, translation: str) -> None:
+        """Put translation back into the runs, keeping their formatting."""
+        if len(self.runs) == 1:
+            self.runs[0].text = translation
+            return
+
+        texts = [""] * len(self.runs)
+        matches = list(_RUN_TAG.finditer(translation))
+        ids = sorted(int(match.group(1)) for match in matches)
+        if ids != list(range(len(self.runs))):
+            ic("Run tags lost in translation, keeping the first run's format")
+            texts[0] = _ANY_RUN_TAG.sub("", translation)
+        else:
+            end = 0
+            previous = 0
+            for match in matches:
+                # Text between tags (usually a space) joins the run before it
+                texts[previous] += translation[end : match.start()]
+                previous = int(match.group(1))
+                texts[previous] += match.group(2)
+                end = match.end()
+            texts[previous] += translation[end:]
+        for run, text in zip(self.runs, texts):
+            run.text = text
+
+
+def _is_text_run(run: Run) -> bool:
+    for child in run._r:
+        if child.tag not in _TEXT_TAGS and not (
+            child.tag == qn("w:br")
+            and child.get(qn("w:type"), "textWrapping") == "textWrapping"
+        ):
+            return False
+    return True
+
+
+def _run_format(run: Run) -> bytes:
+    run_props = run._r.rPr
+    return run_props.xml.encode() if run_props is not None else b""
+
+
+def _merge_runs(runs: List[Run]) -> List[Run]:
+    # Word splits text into many runs with the same formatting (spell check,
+    # revision marks); merge adjacent ones so they are translated as one
+    merged: List[Run] = []
+    for run in runs:
+        previous = merged[-1] if merged else None
+        if (
+            previous is not None
+            and previous._r.getnext() is run._r
+            and _run_format(previous) == _run_format(run)
+        ):
+            previous.text = previous.text + run.text
+            run._r.getparent().remove(run._r)
+        else:
+            merged.append(run)
+    return merged
+
+
+def _paragraph_segments(paragraph: Paragraph) -> Iterator[Segment]:
+    # A picture or field between runs ends one segment and starts the next
+    runs: List[Run] = []
+    for item in paragraph.iter_inner_content():
+        for run in item.runs if isinstance(item, Hyperlink) else [item]:
+            if _is_text_run(run):
+                runs.append(run)
+            elif runs:
+                yield Segment(_merge_runs(runs))
+                runs = []
+    if runs:
+        yield Segment(_merge_runs(runs))
+
+
+def _iter_block_paragraphs(container) -> Iterator[Paragraph]:
+    for block in container.iter_inner_content():
+        if isinstance(block, Table):
+            yield from _iter_table_paragraphs(block)
+        else:
+            yield block
+
+
+def _iter_table_paragraphs(table: Table) -> Iterator[Paragraph]:
+    seen = set()
+    for row in table.rows:
+        for cell in row.cells:
+            # A merged cell is returned once for each grid cell it spans
+            if id(cell._tc) in seen:
+                continue
+            seen.add(id(cell._tc))
+            yield from _iter_block_paragraphs(cell)
+
+
+def iter_paragraphs(document) -> Iterator[Paragraph]:
+    """
+    Yield every paragraph of a document: the body, including table cells and
+    nested tables, then the headers and footers of each section.
+    """
+    yield from _iter_block_paragraphs(document)
+    seen = set()
+    for section in document.sections:
+        for part in (
+            section.header,
+            section.first_page_header,
+            section.even_page_header,
+            section.footer,
+            section.first_page_footer,
+            section.even_page_footer,
+        ):
+            # Linked parts are the previous section's, already translated
+            if part.is_linked_to_previous or id(part._element) in seen:
+                continue
+            seen.add(id(part._element))
+            yield from _iter_block_paragraphs(part)
+
+
+def extract_segments(document) -> List[Segment]:
+    """Return the translatable segments of a document, in reading order."""
+    return [
+        segment
+        for paragraph in iter_paragraphs(document)
+        for segment in _paragraph_segments(paragraph)
+        if segment.source.strip()
+    ]
+
+
+def translate_texts(
+    source_lang: str,
+    target_lang: str,
+    texts: List[str],
+    tone: int = 3,
+    max_batch_tokens: int = batching.MAX_TOKENS_PER_BATCH,
+) -> List[str]:
+    """
+    Translate document segments with the batched translate, reflect and
+    improve pipeline, keeping the <rN> run tags of multi-run segments.
+
+    Args:
+        source_lang (str): The source language of the text.
+        target_lang (str): The target language for translation.
+        texts (List[str]): The segments, in document order.
+        tone (int): Formality level (1-5).
+        max_batch_tokens (int): The maximum number of tokens per request.
+
+    Returns:
+        List[str]: The translation of each segment.
+    """
+
+    # Segments are sent without the whole document as context, which would
+    # be repeated in every request
+    return batching.batched_translation(
+        source_lang,
+        target_lang,
+        texts,
+        tone,
+        max_batch_tokens=max_batch_tokens,
+        independent=True,
+        instructions=_RUN_TAG_INSTRUCTIONS,
+    )
+
+
+def translate_docx(
+    source_path,
+    output_path,
+    source_lang: str,
+    target_lang: str,
+    tone: int = 3,
+    max_batch_tokens: int = batching.MAX_TOKENS_PER_BATCH,
+    translate: Optional[Callable[..., List[str]]] = None,
+) -> int:
+    """
+    Translate a Word document into a copy that keeps its formatting.
+
+    Paragraphs, table cells, headers and footers are read with their runs,
+    repeated segments are translated once, and the translations are written
+    back into the same runs, so styles, tables, pictures and page layout are
+    untouched. The source file is not modified.
+
+    Args:
+        source_path: The .docx to translate, as a path or file-like object.
+        output_path: Where to save the translated copy.
+        source_lang (str): The source language of the text.
+        target_lang (str): The target language for translation.
+        tone (int): Formality level (1-5).
+        max_batch_tokens (int): The maximum number of tokens per request.
+        translate (Optional[Callable]): Replaces translate_texts, with the
+            same (source_lang, target_lang, texts, tone, max_batch_tokens)
+            arguments.
+
+    Returns:
+        int: The number of segments translated.
+    """
+
+    document = docx.Document(source_path)
+    segments = extract_segments(document)
+    unique: Dict[str, int] = {}
+    for segment in segments:
+        unique.setdefault(segment.source, len(unique))
+    ic(f"{len(segments)} segments, {len(unique)} unique")
+
+    translations = (translate or translate_texts)(
+        source_lang, target_lang, list(unique), tone, max_batch_tokens
+    )
+    for segment in segments:
+        segment.write(translations[unique[segment.source]])
+    document.save(output_path)
+    return len(segments)
@@ -0,0 +1,183 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import docx
+
+
+EXPORT_DIR = os.getenv("TRANSLATION_AGENT_EXPORT_DIR", "outputs")
+
+# Exports untouched for this long are deleted
+RETENTION_SECONDS = float(
+    os.getenv("TRANSLATION_AGENT_EXPORT_RETENTION", 7 * 24 * 3600)
+)
+
+# The most often a cleanup pass is started, in the background
+CLEANUP_INTERVAL_SECONDS: Optional[float] = 3600
+
+EXPORT_FORMATS = ("txt", "docx", "jsonl")
+
+
+class ExportStore:
+    """
+    Keep exported files under unique names, written atomically.
+
+    Each export gets its own directory, named by the hash of its content or
+    by a UUID, in one of 256 shards: root/ab/abcdef.../name.ext. Files are
+    written to a temporary file in that directory and renamed into place, so
+    a download never sees half a file and concurrent exports never share a
+    name. Exports not written or re-exported for retention seconds are
+    deleted by a background cleanup pass, started by a write at most every
+    cleanup_interval seconds; with cleanup_interval None, only explicit
+    cleanup() calls delete them.
+    """
+
+    def __init__(
+        self,
+        root: str = EXPORT_DIR,
+        retention: Optional[float] = RETENTION_SECONDS,
+        cleanup_interval: Optional[float] = CLEANUP_INTERVAL_SECONDS,
+    ):
+        self.root = root
+        self.retention = retention
+        self.cleanup_interval = cleanup_interval
+        self._lock = threading.Lock()
+        self._last_cleanup: Optional[float] = None
+
+    def _directory(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    @contextmanager
+    def open(
+        self, name: str, key: Optional[str] = None
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        Give a temporary path to write an export to, and move it into place
+        as name once the block exits without an error.
+
+        Args:
+            name (str): The file name the download gets, e.g. "doc.es.docx".
+            key (Optional[str]): The export's directory name; a new UUID by
+                default.
+
+        Yields:
+            Tuple[str, str]: The temporary path and the final path.
+        """
+        directory = self._directory(key or uuid.uuid4().hex)
+        while True:
+            os.makedirs(directory, exist_ok=True)
+            try:
+                fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                break
+            except FileNotFoundError:
+                # A cleanup pass removed the expired directory meanwhile
+                continue
+        os.close(fd)
+        path = os.path.join(directory, name)
+        try:
+            yield temp_path, path
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._maybe_cleanup()
+
+    def write_bytes(self, data: bytes, name: str) -> str:
+        """
+        Export data as name, under the hash of its content.
+
+        Exporting the same content again returns the existing file and
+        restarts its retention period.
+
+        Returns:
+            str: The path of the exported file.
+        """
+        key = hashlib.sha256(data).hexdigest()[:32]
+        path = os.path.join(self._directory(key), name)
+        try:
+            os.utime(path)
+            os.utime(os.path.dirname(path))
+        except FileNotFoundError:
+            # Not exported yet, or deleted by a cleanup pass meanwhile
+            pass
+        else:
+            self._maybe_cleanup()
+            return path
+        with self.open(name, key) as (temp_path, path):
+            with open(temp_path, "wb") as f:
+                f.write(data)
+        return path
+
+    def write_text(self, text: str, name: str = "translation.txt") -> str:
+        """Export text as a UTF-8 .txt file and return its path."""
+        return self.write_bytes(text.encode("utf-8"), name)
+
+    def write_docx(self, text: str, name: str = "translation.docx") -> str:
+        """Export text as a .docx file, a paragraph per line."""
+        document = docx.Document()
+        for line in text.split("\n"):
+            document.add_paragraph(line)
+        buffer = io.BytesIO()
+        document.save(buffer)
+        return self.write_bytes(buffer.getvalue(), name)
+
+    def write_jsonl(
+        self, records: Iterable[Dict], name: str = "translation.jsonl"
+    ) -> str:
+        """Export records as JSON Lines, one record per line."""
+        data = "".join(
+            json.dumps(record, ensure_ascii=False) + "\n" for record in records
+        )
+        return self.write_bytes(data.encode("utf-8"), name)
+
+    def cleanup(self, now: Optional[float] = None) -> int:
+        """
+        Delete the exports older than the retention period.
+
+        Returns:
+            int: The number of exports deleted.
+        """
+        if self.retention is None:
+            return 0
+        cutoff = (time.time() if now is None else now) - self.retention
+        deleted = 0
+        try:
+            shards = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0
+        for shard in shards:
+            if not shard.is_dir() or len(shard.name) != 2:
+                continue
+            for export in os.scandir(shard.path):
+                try:
+                    if export.stat().st_mtime < cutoff:
+                        shutil.rmtree(export.path)
+                        deleted += 1
+                except FileNotFoundError:
+                    # Deleted by another process's cleanup
+                    continue
+        return deleted
+
+    def _maybe_cleanup(self) -> None:
+        # Scan for old exports off the request, and only once in a while
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self.retention is None
+                or self.cleanup_interval is None
+                or (
+                    self._last_cleanup is not None
+                    and now - self._last_cleanup < self.cleanup_interval
+                )
+            ):
+                return
+            self._last_cleanup = now
+        threading.Thread(target=self.cleanup, daemon=True).start()
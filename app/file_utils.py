@@ -1,20 +1,72 @@
-import streamlit as st
-import docx
-import pymupdf
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+# pymupdf, docx and streamlit are imported by the functions that use them,
+# so that importing this module stays cheap
+
+# Documents with at least this many pages are read in parallel when workers
+# are given
+PARALLEL_PDF_MIN_PAGES = 64
+PDF_PAGES_PER_TASK = 16
 
 def extract_text(path):
     with open(path) as f:
         file_text = f.read()
     return file_text
 
-def extract_pdf(path):
-    doc = pymupdf.open(path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+def _extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    import pymupdf
+
+    with pymupdf.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+def iter_pdf_pages(path, workers: Optional[int] = None) -> Iterator[str]:
+    """
+    Yield the text of a PDF page by page, without holding the whole document.
+
+    With workers, a file path of at least PARALLEL_PDF_MIN_PAGES pages is read
+    by a process pool in ranges of PDF_PAGES_PER_TASK pages, a few ranges
+    ahead of the consumer, and pages are still yielded in order.
+
+    Args:
+        path: A file path, or a file-like object as accepted by pymupdf.open.
+        workers (Optional[int]): Processes for parallel extraction.
+    """
+    import pymupdf
+
+    with pymupdf.open(path) as doc:
+        page_count = doc.page_count
+        if (
+            not workers
+            or not isinstance(path, str)
+            or page_count < PARALLEL_PDF_MIN_PAGES
+        ):
+            for page in doc:
+                yield page.get_text()
+            return
+
+    ranges = [
+        (start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start, stop in ranges:
+            pending.append(
+                executor.submit(_extract_page_range, path, start, stop)
+            )
+            if len(pending) > 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def extract_pdf(path, workers: Optional[int] = None):
+    return "".join(iter_pdf_pages(path, workers))
 
 def extract_docx(path):
+    import docx
+
     doc = docx.Document(path)
     data = []
     for paragraph in doc.paragraphs:
@@ -34,5 +86,7 @@ def read_doc(file):
         else:
             return file.read().decode("utf-8")
     else:
+        import streamlit as st
+
         st.error("Unsupported file type.")
         return "" 
\ No newline at end of file
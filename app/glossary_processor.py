@@ -1,6 +1,5 @@
 import os
 import json
-import pandas as pd
 from pathlib import Path
 from typing import Dict, Optional, List, Tuple
 
@@ -26,6 +25,9 @@ class GlossaryProcessor:
         if not self.csv_dir.exists():
             raise FileNotFoundError(f"CSV directory not found: {self.csv_dir}")
 
+        # Only converting CSV glossaries needs pandas
+        import pandas as pd
+
         for csv_file in self.csv_dir.glob("*.csv"):
             try:
                 # Read CSV file
@@ -1,20 +1,23 @@
 import os
-import time
-from functools import wraps
-from threading import Lock
 from typing import Optional, Union
 
-import gradio as gr
-import openai
+import src.translation_agent.cancellation as cancellation
 import src.translation_agent.utils as utils
 
 
+class TranslationError(Exception):
+    """A failed call or model setup, with a message to show the user."""
+
+
 RPM = 60
 MODEL = ""
 TEMPERATURE = 0.3
 # Hide js_mode in UI now, update in plan.
 JS_MODE = False
 ENDPOINT = ""
+# The routes file, its modification time and the rate store the current
+# router was built from
+_router_config = None
 
 
 # Add your LLMs here
@@ -26,8 +29,14 @@ def model_load(
     temperature: float = TEMPERATURE,
     rpm: int = RPM,
     js_mode: bool = JS_MODE,
+    adaptive_rpm: bool = True,
+    max_rpm: Optional[int] = None,
 ):
-    global client, RPM, MODEL, TEMPERATURE, JS_MODE, ENDPOINT
+    # openai is imported with the first model, not with the app
+    import openai
+    import src.translation_agent.router as router
+
+    global client, RPM, MODEL, TEMPERATURE, JS_MODE, ENDPOINT, _router_config
     ENDPOINT = endpoint
     RPM = rpm
     MODEL = model
@@ -58,33 +67,32 @@ def model_load(
                 api_key=api_key if api_key else os.getenv("OPENAI_API_KEY")
             )
 
+    # Route the library's calls and its rate limiter through this endpoint
+    utils.client = client
+    # The limiter backs off from rpm on the provider's rate limit headers
+    # and 429s, but never goes above max_rpm, by default rpm itself
+    utils.set_rate_limit(rpm, adaptive=adaptive_rpm, max_rpm=max_rpm or rpm)
+    # A pool of backends in TRANSLATION_AGENT_ROUTES takes over from it.
+    # The router is rebuilt only when its configuration changes, so its
+    # backends keep their latency and health history between requests
+    config = _router_config_key()
+    if config != _router_config:
+        utils.set_router(router.load_router_from_env())
+        _router_config = config
 
-def rate_limit(get_max_per_minute):
-    def decorator(func):
-        lock = Lock()
-        last_called = [0.0]
-
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            with lock:
-                max_per_minute = get_max_per_minute()
-                min_interval = 60.0 / max_per_minute
-                elapsed = time.time() - last_called[0]
-                left_to_wait = min_interval - elapsed
 
-                if left_to_wait > 0:
-                    time.sleep(left_to_wait)
+def _router_config_key():
+    path = os.getenv("TRANSLATION_AGENT_ROUTES")
+    try:
+        modified = os.path.getmtime(path) if path else None
+    except OSError:
+        modified = None
+    return path, modified, os.getenv("TRANSLATION_AGENT_RATE_STORE")
 
-                ret = func(*args, **kwargs)
-                last_called[0] = time.time()
-                return ret
 
-        return wrapper
+_get_completion = utils.get_completion
 
-    return decorator
 
-
-@rate_limit(lambda: RPM)
 def get_completion(
     prompt: str,
     system_message: str = "You are a helpful assistant.",
@@ -93,16 +101,14 @@ def get_completion(
     json_mode: bool = False,
 ) -> Union[str, dict]:
     """
-        Generate a completion using the OpenAI API.
+        Generate a completion using the endpoint configured with model_load.
 
     Args:
         prompt (str): The user's prompt or query.
         system_message (str, optional): The system message to set the context for the assistant.
             Defaults to "You are a helpful assistant.".
-        model (str, optional): The name of the OpenAI model to use for generating the completion.
-            Defaults to "gpt-4-turbo".
-        temperature (float, optional): The sampling temperature for controlling the randomness of the generated text.
-            Defaults to 0.3.
+        model (str, optional): Ignored, the model set with model_load is used.
+        temperature (float, optional): Ignored, the temperature set with model_load is used.
         json_mode (bool, optional): Whether to return the response in JSON format.
             Defaults to False.
 
@@ -112,39 +118,18 @@ def get_completion(
             If json_mode is False, returns the generated text as a string.
     """
 
-    model = MODEL
-    temperature = TEMPERATURE
-    json_mode = JS_MODE
-
-    if json_mode:
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                temperature=temperature,
-                top_p=1,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            raise gr.Error(f"An unexpected error occurred: {e}") from e
-    else:
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                temperature=temperature,
-                top_p=1,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            raise gr.Error(f"An unexpected error occurred: {e}") from e
+    try:
+        return _get_completion(
+            prompt,
+            system_message,
+            model=MODEL,
+            temperature=TEMPERATURE,
+            json_mode=json_mode or JS_MODE,
+        )
+    except cancellation.TranslationCancelledError:
+        raise
+    except Exception as e:
+        raise TranslationError(f"An unexpected error occurred: {e}") from e
 
 
 utils.get_completion = get_completion
@@ -159,3 +144,4 @@ multichunk_reflect_on_translation = utils.multichunk_reflect_on_translation
 multichunk_improve_translation = utils.multichunk_improve_translation
 multichunk_translation = utils.multichunk_translation
 calculate_chunk_size = utils.calculate_chunk_size
+count_and_split = utils.count_and_split
@@ -1,28 +1,33 @@
-from typing import Dict
-from difflib import Differ
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
 
-import docx
-import gradio as gr
-import pymupdf
 from icecream import ic
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from app.patch import (
-    calculate_chunk_size,
+    TranslationError,
+    count_and_split,
     model_load,
     multichunk_improve_translation,
     multichunk_initial_translation,
     multichunk_reflect_on_translation,
-    num_tokens_in_string,
     one_chunk_improve_translation,
     one_chunk_initial_translation,
     one_chunk_reflect_on_translation,
 )
-from simplemma import simple_tokenizer
-import streamlit as st
+import src.translation_agent.lanes as lanes
+import src.translation_agent.metrics as metrics
+import src.translation_agent.preprocessing as preprocessing
 from .glossary_processor import GlossaryProcessor
+from .text_diff import diff_texts, iter_diff, tokenize  # noqa: F401
 
 
-progress = gr.Progress()
+def _ignore(*args, **kwargs) -> None:
+    pass
+
+
+# Set by the UI running the translation: progress((step, total), desc=...)
+# reports a stage starting, and warn(message) shows a warning to the user
+progress: Callable = _ignore
+warn: Callable[[str], None] = ic
 
 tone_mapping = {
     0: "Use a neutral tone.",
@@ -40,15 +45,9 @@ def extract_text(path):
     return file_text
 
 
-def extract_pdf(path):
-    doc = pymupdf.open(path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
-
-
 def extract_docx(path):
+    import docx
+
     doc = docx.Document(path)
     data = []
     for paragraph in doc.paragraphs:
@@ -57,49 +56,8 @@ def extract_docx(path):
     return content
 
 
-def tokenize(text):
-    # Use nltk to tokenize the text
-    words = simple_tokenizer(text)
-    # Check if the text contains spaces
-    if " " in text:
-        # Create a list of words and spaces
-        tokens = []
-        for word in words:
-            tokens.append(word)
-            if not word.startswith("'") and not word.endswith(
-                "'"
-            ):  # Avoid adding space after punctuation
-                tokens.append(" ")  # Add space after each word
-        return tokens[:-1]  # Remove the last space
-    else:
-        return words
-
-
-def diff_texts(text1, text2):
-    tokens1 = tokenize(text1)
-    tokens2 = tokenize(text2)
-
-    d = Differ()
-    diff_result = list(d.compare(tokens1, tokens2))
-
-    highlighted_text = []
-    for token in diff_result:
-        word = token[2:]
-        category = None
-        if token[0] == "+":
-            category = "added"
-        elif token[0] == "-":
-            category = "removed"
-        elif token[0] == "?":
-            continue  # Ignore the hints line
-
-        highlighted_text.append((word, category))
-
-    return highlighted_text
-
-
 # Add cached initializer
-@st.cache_resource
+@lru_cache(maxsize=None)
 def initialize_glossary() -> GlossaryProcessor:
     """
     Initialize and cache the glossary processor.
@@ -109,6 +67,27 @@ def initialize_glossary() -> GlossaryProcessor:
     return processor
 
 
+def prepare_glossary_prompt(
+    source_text: str, source_lang: str, target_lang: str, max_tokens: int
+) -> Tuple[Dict[str, str], int, List[str]]:
+    """
+    Mark the glossary terms of source_text and build the translation prompt,
+    then count and split the prompt. Runs in a preprocessing worker, which
+    loads its own copy of the glossaries once.
+
+    Returns:
+        Tuple[Dict[str, str], int, List[str]]: The glossary terms found, the
+            prompt's token count and its chunks, which join back into the
+            prompt. Only the chunks are sent back, not a second copy of it.
+    """
+    glossary_processor = initialize_glossary()
+    terms = glossary_processor.identify_terms(source_text, source_lang, target_lang)
+    marked_text = glossary_processor.mark_terms(source_text, terms)
+    enhanced_prompt = create_translation_prompt(marked_text, terms, source_lang, target_lang)
+    num_tokens_in_text, chunks = count_and_split(enhanced_prompt, max_tokens)
+    return terms, num_tokens_in_text, chunks
+
+
 def create_translation_prompt(text: str, terms: Dict[str, str], source_lang: str, target_lang: str) -> str:
     """Create a prompt for translation that includes glossary terms."""
     prompt = f"Please translate the following text from {source_lang} to {target_lang}.\n\n"
@@ -127,75 +106,92 @@ def create_translation_prompt(text: str, terms: Dict[str, str], source_lang: str
     return prompt
 
 
-def translator(source_lang: str, target_lang: str, source_text: str, 
-              tone: int, country: str, max_tokens: int = 1000) -> str:
-    """Translate the source_text from source_lang to target_lang with glossary support."""
-    
-    # Initialize glossary processing
-    glossary_processor = initialize_glossary()
-    terms = glossary_processor.identify_terms(source_text, source_lang, target_lang)
-    marked_text = glossary_processor.mark_terms(source_text, terms)
-    enhanced_prompt = create_translation_prompt(marked_text, terms, source_lang, target_lang)
-    
-    num_tokens_in_text = num_tokens_in_string(enhanced_prompt)
-    ic(num_tokens_in_text)
-
-    if num_tokens_in_text < max_tokens:
-        ic("Translating text as single chunk")
-
-        progress((1, 3), desc="First translation...")
-        init_translation = one_chunk_initial_translation(source_lang, target_lang, enhanced_prompt, tone)
+# Requests over this many source tokens run in the batch lane, so a long
+# document gives way to the short requests of other sessions
+INTERACTIVE_MAX_TOKENS = 4000
 
-        progress((2, 3), desc="Reflection...")
-        reflection = one_chunk_reflect_on_translation(source_lang, target_lang, enhanced_prompt, 
-                                                    init_translation, tone, country)
 
-        progress((3, 3), desc="Second translation...")
-        final_translation = one_chunk_improve_translation(source_lang, target_lang, enhanced_prompt, 
-                                                        init_translation, reflection, tone)
+def request_lane(num_tokens: int) -> str:
+    """Return the scheduling lane of a request for a text of num_tokens."""
+    return "interactive" if num_tokens <= INTERACTIVE_MAX_TOKENS else "batch"
 
-    else:
-        ic("Translating text as multiple chunks")
-
-        token_size = calculate_chunk_size(num_tokens_in_text, max_tokens)
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            model_name="gpt-4", 
-            chunk_size=token_size, 
-            chunk_overlap=0
-        )
-        source_text_chunks = text_splitter.split_text(enhanced_prompt)
-
-        progress((1, 3), desc="First translation...")
-        translation_1_chunks = multichunk_initial_translation(
-            source_lang, target_lang, source_text_chunks, tone
-        )
-
-        progress((2, 3), desc="Reflection...")
-        reflection_chunks = multichunk_reflect_on_translation(
-            source_lang, target_lang, source_text_chunks, 
-            translation_1_chunks, tone, country
-        )
 
-        progress((3, 3), desc="Second translation...")
-        translation_2_chunks = multichunk_improve_translation(
-            source_lang, target_lang, source_text_chunks,
-            translation_1_chunks, reflection_chunks, tone
+@metrics.track_request("translator")
+def translator(source_lang: str, target_lang: str, source_text: str, 
+              tone: int, country: str, max_tokens: int = 1000) -> str:
+    """Translate the source_text from source_lang to target_lang with glossary support."""
+    
+    # Glossary marking and tokenizing are CPU-bound, so they run in the
+    # preprocessing pool if there is one
+    with metrics.track_stage("glossary"):
+        terms, num_tokens_in_text, source_text_chunks = preprocessing.run(
+            prepare_glossary_prompt,
+            source_text,
+            source_lang,
+            target_lang,
+            max_tokens,
+            size=len(source_text),
         )
+    ic(num_tokens_in_text)
 
-        final_translation = "".join(translation_2_chunks)
+    with lanes.lane(request_lane(num_tokens_in_text)):
+        if num_tokens_in_text < max_tokens:
+            ic("Translating text as single chunk")
+            enhanced_prompt = "".join(source_text_chunks)
+
+            with metrics.track_stage("initial"):
+                progress((1, 3), desc="First translation...")
+                init_translation = one_chunk_initial_translation(source_lang, target_lang, enhanced_prompt, tone)
+
+            with metrics.track_stage("reflection"):
+                progress((2, 3), desc="Reflection...")
+                reflection = one_chunk_reflect_on_translation(source_lang, target_lang, enhanced_prompt, 
+                                                            init_translation, tone, country)
+
+            with metrics.track_stage("improved"):
+                progress((3, 3), desc="Second translation...")
+                final_translation = one_chunk_improve_translation(source_lang, target_lang, enhanced_prompt, 
+                                                                init_translation, reflection, tone)
+
+        else:
+            ic("Translating text as multiple chunks")
+
+            with metrics.track_stage("initial"):
+                progress((1, 3), desc="First translation...")
+                translation_1_chunks = multichunk_initial_translation(
+                    source_lang, target_lang, source_text_chunks, tone
+                )
+
+            with metrics.track_stage("reflection"):
+                progress((2, 3), desc="Reflection...")
+                reflection_chunks = multichunk_reflect_on_translation(
+                    source_lang, target_lang, source_text_chunks, 
+                    translation_1_chunks, tone, country
+                )
+
+            with metrics.track_stage("improved"):
+                progress((3, 3), desc="Second translation...")
+                translation_2_chunks = multichunk_improve_translation(
+                    source_lang, target_lang, source_text_chunks,
+                    translation_1_chunks, reflection_chunks, tone
+                )
+
+            final_translation = "".join(translation_2_chunks)
 
     # Validate glossary terms in final translation
+    glossary_processor = initialize_glossary()
     success, issues = glossary_processor.validate_translation(source_text, final_translation, terms)
     if not success:
-        st.warning("Some glossary terms may not have been translated correctly:")
+        warn("Some glossary terms may not have been translated correctly:")
         for issue in issues:
-            st.warning(issue)
+            warn(issue)
 
     # Remove markers before returning the translation
     cleaned_translation = remove_markers(final_translation)
     return cleaned_translation
 
 
+@metrics.track_request("translator_sec")
 def translator_sec(
     endpoint2: str,
     base2: str,
@@ -208,93 +204,88 @@ def translator_sec(
     max_tokens: int = 1000,
 ):
     """Translate the source_text from source_lang to target_lang."""
-    num_tokens_in_text = num_tokens_in_string(source_text)
+    num_tokens_in_text, source_text_chunks = preprocessing.run(
+        count_and_split, source_text, max_tokens, size=len(source_text)
+    )
 
     ic(num_tokens_in_text)
 
-    if num_tokens_in_text < max_tokens:
-        ic("Translating text as single chunk")
-
-        progress((1, 3), desc="First translation...")
-        init_translation = one_chunk_initial_translation(
-            source_lang, target_lang, source_text
-        )
-
-        try:
-            model_load(endpoint2, base2, model2, api_key2)
-        except Exception as e:
-            raise gr.Error(f"An unexpected error occurred: {e}") from e
-
-        progress((2, 3), desc="Reflection...")
-        reflection = one_chunk_reflect_on_translation(
-            source_lang, target_lang, source_text, init_translation, country
-        )
-
-        progress((3, 3), desc="Second translation...")
-        final_translation = one_chunk_improve_translation(
-            source_lang, target_lang, source_text, init_translation, reflection
-        )
-
-        # Clean up the translation
-        cleaned_translation = remove_markers(final_translation)
+    with lanes.lane(request_lane(num_tokens_in_text)):
+        if num_tokens_in_text < max_tokens:
+            ic("Translating text as single chunk")
+
+            with metrics.track_stage("initial"):
+                progress((1, 3), desc="First translation...")
+                init_translation = one_chunk_initial_translation(
+                    source_lang, target_lang, source_text
+                )
+
+            try:
+                model_load(endpoint2, base2, model2, api_key2)
+            except Exception as e:
+                raise TranslationError(f"An unexpected error occurred: {e}") from e
+
+            with metrics.track_stage("reflection"):
+                progress((2, 3), desc="Reflection...")
+                reflection = one_chunk_reflect_on_translation(
+                    source_lang, target_lang, source_text, init_translation, country
+                )
+
+            with metrics.track_stage("improved"):
+                progress((3, 3), desc="Second translation...")
+                final_translation = one_chunk_improve_translation(
+                    source_lang, target_lang, source_text, init_translation, reflection
+                )
+
+            # Clean up the translation
+            cleaned_translation = remove_markers(final_translation)
         
-        return init_translation, reflection, cleaned_translation
-
-    else:
-        ic("Translating text as multiple chunks")
-
-        token_size = calculate_chunk_size(
-            token_count=num_tokens_in_text, token_limit=max_tokens
-        )
-
-        ic(token_size)
-
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            model_name="gpt-4",
-            chunk_size=token_size,
-            chunk_overlap=0,
-        )
-
-        source_text_chunks = text_splitter.split_text(source_text)
-
-        progress((1, 3), desc="First translation...")
-        translation_1_chunks = multichunk_initial_translation(
-            source_lang, target_lang, source_text_chunks
-        )
-
-        init_translation = "".join(translation_1_chunks)
-
-        try:
-            model_load(endpoint2, base2, model2, api_key2)
-        except Exception as e:
-            raise gr.Error(f"An unexpected error occurred: {e}") from e
-
-        progress((2, 3), desc="Reflection...")
-        reflection_chunks = multichunk_reflect_on_translation(
-            source_lang,
-            target_lang,
-            source_text_chunks,
-            translation_1_chunks,
-            country,
-        )
-
-        reflection = "".join(reflection_chunks)
-
-        progress((3, 3), desc="Second translation...")
-        translation_2_chunks = multichunk_improve_translation(
-            source_lang,
-            target_lang,
-            source_text_chunks,
-            translation_1_chunks,
-            reflection_chunks,
-        )
-
-        final_translation = "".join(translation_2_chunks)
-
-        # Clean up the translation
-        cleaned_translation = remove_markers(final_translation)
+            return init_translation, reflection, cleaned_translation
+
+        else:
+            ic("Translating text as multiple chunks")
+
+            with metrics.track_stage("initial"):
+                progress((1, 3), desc="First translation...")
+                translation_1_chunks = multichunk_initial_translation(
+                    source_lang, target_lang, source_text_chunks
+                )
+
+            init_translation = "".join(translation_1_chunks)
+
+            try:
+                model_load(endpoint2, base2, model2, api_key2)
+            except Exception as e:
+                raise TranslationError(f"An unexpected error occurred: {e}") from e
+
+            with metrics.track_stage("reflection"):
+                progress((2, 3), desc="Reflection...")
+                reflection_chunks = multichunk_reflect_on_translation(
+                    source_lang,
+                    target_lang,
+                    source_text_chunks,
+                    translation_1_chunks,
+                    country,
+                )
+
+            reflection = "".join(reflection_chunks)
+
+            with metrics.track_stage("improved"):
+                progress((3, 3), desc="Second translation...")
+                translation_2_chunks = multichunk_improve_translation(
+                    source_lang,
+                    target_lang,
+                    source_text_chunks,
+                    translation_1_chunks,
+                    reflection_chunks,
+                )
+
+            final_translation = "".join(translation_2_chunks)
+
+            # Clean up the translation
+            cleaned_translation = remove_markers(final_translation)
         
-        return init_translation, reflection, cleaned_translation
+            return init_translation, reflection, cleaned_translation
 
 
 def remove_markers(text: str) -> str:
@@ -0,0 +1,275 @@
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+
+Highlight = Tuple[str, Optional[str]]
+
+# Unmatched paragraphs diffed together at most, beyond which they are
+# paired by position to bound the cost
+MAX_REGION_PARAGRAPHS = 64
+
+
+def tokenize(text: str, spaced: Optional[bool] = None) -> List[str]:
+    """
+    Split text into words and punctuation, with " " tokens between words.
+
+    Args:
+        text (str): The text to tokenize.
+        spaced (Optional[bool]): Whether to put " " between words. Defaults to
+            whether text contains spaces; scripts written without spaces
+            get none.
+    """
+    # simplemma loads its language data on import, so only once diffing
+    from simplemma import simple_tokenizer
+
+    words = simple_tokenizer(text)
+    if spaced is None:
+        spaced = " " in text
+    if not spaced:
+        return list(words)
+    tokens = []
+    for word in words:
+        tokens.append(word)
+        if not word.startswith("'") and not word.endswith("'"):
+            # Avoid adding space after punctuation
+            tokens.append(" ")
+    if tokens and tokens[-1] == " ":
+        tokens.pop()
+    return tokens
+
+
+def _middle_snake(
+    a: Sequence[int], a0: int, a1: int, b: Sequence[int], b0: int, b1: int
+) -> Tuple[int, int, int, int]:
+    # Find the middle snake of a shortest edit script from a[a0:a1] to
+    # b[b0:b1], searching forward from the start and backward from the end
+    # until the paths meet (Myers 1986, section 4b)
+    n, m = a1 - a0, b1 - b0
+    delta = n - m
+    odd = delta % 2 == 1
+    offset = n + m + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+    for d in range((n + m + 1) // 2 + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (
+                k != d and forward[offset + k - 1] < forward[offset + k + 1]
+            ):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if (
+                odd
+                and -(d - 1) <= delta - k <= d - 1
+                and x + backward[offset + delta - k] >= n
+            ):
+                return a0 + start_x, b0 + start_y, a0 + x, b0 + y
+        for k in range(-d, d + 1, 2):
+            if k == -d or (
+                k != d and backward[offset + k - 1] < backward[offset + k + 1]
+            ):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if (
+                not odd
+                and -d <= delta - k <= d
+                and x + forward[offset + delta - k] >= n
+            ):
+                return a1 - x, b1 - y, a1 - start_x, b1 - start_y
+    raise AssertionError("the forward and backward paths must meet")
+
+
+def myers_diff(
+    a: Sequence[int],
+    b: Sequence[int],
+    a0: int = 0,
+    a1: Optional[int] = None,
+    b0: int = 0,
+    b1: Optional[int] = None,
+) -> Iterator[Tuple[str, int]]:
+    """
+    Yield a shortest edit script from a to b in linear space.
+
+    Args:
+        a (Sequence[int]): The old sequence, e.g. of token IDs.
+        b (Sequence[int]): The new sequence.
+
+    Yields:
+        Tuple[str, int]: ("equal", i), ("delete", i) or ("insert", j), in
+            order, where i indexes a and j indexes b.
+    """
+    a1 = len(a) if a1 is None else a1
+    b1 = len(b) if b1 is None else b1
+    suffix = 0
+    while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+        yield "equal", a0
+        a0 += 1
+        b0 += 1
+    while (
+        a0 < a1 - suffix
+        and b0 < b1 - suffix
+        and (a[a1 - 1 - suffix] == b[b1 - 1 - suffix])
+    ):
+        suffix += 1
+    end_a, end_b = a1 - suffix, b1 - suffix
+
+    if a0 == end_a or b0 == end_b:
+        for i in range(a0, end_a):
+            yield "delete", i
+        for j in range(b0, end_b):
+            yield "insert", j
+    else:
+        x0, y0, x1, y1 = _middle_snake(a, a0, end_a, b, b0, end_b)
+        yield from myers_diff(a, b, a0, x0, b0, y0)
+        for i in range(x0, x1):
+            yield "equal", i
+        yield from myers_diff(a, b, x1, end_a, y1, end_b)
+
+    for i in range(end_a, a1):
+        yield "equal", i
+
+
+def _diff_tokens(
+    tokens1: List[str], tokens2: List[str], ids: Dict[str, int]
+) -> Iterator[Highlight]:
+    # Compare integer IDs rather than strings
+    a = [ids.setdefault(token, len(ids)) for token in tokens1]
+    b = [ids.setdefault(token, len(ids)) for token in tokens2]
+    for op, i in myers_diff(a, b):
+        if op == "equal":
+            yield tokens1[i], None
+        elif op == "delete":
+            yield tokens1[i], "removed"
+        else:
+            yield tokens2[i], "added"
+
+
+def _unique_anchors(
+    paragraphs1: List[str], paragraphs2: List[str]
+) -> List[Tuple[int, int]]:
+    # Patience alignment: paragraphs that occur once on each side, kept in
+    # the longest run that is in the same order on both sides
+    count1, count2 = Counter(paragraphs1), Counter(paragraphs2)
+    where2 = {p: j for j, p in enumerate(paragraphs2) if count2[p] == 1}
+    pairs = [
+        (i, where2[p])
+        for i, p in enumerate(paragraphs1)
+        if count1[p] == 1 and p in where2
+    ]
+    tails: List[int] = []
+    tail_index: List[int] = []
+    previous: List[int] = []
+    for n, (_, j) in enumerate(pairs):
+        k = bisect_left(tails, j)
+        if k == len(tails):
+            tails.append(j)
+            tail_index.append(n)
+        else:
+            tails[k] = j
+            tail_index[k] = n
+        previous.append(tail_index[k - 1] if k else -1)
+    anchors = []
+    n = tail_index[-1] if tail_index else -1
+    while n != -1:
+        anchors.append(pairs[n])
+        n = previous[n]
+    return anchors[::-1]
+
+
+def _paragraphs(text: Union[str, List[str]]) -> List[str]:
+    if isinstance(text, list):
+        return text
+    return text.split("\n")
+
+
+def iter_diff(
+    text1: Union[str, List[str]], text2: Union[str, List[str]]
+) -> Iterator[Highlight]:
+    """
+    Diff two translations word by word, lazily, a paragraph or chunk at a time.
+
+    Paragraphs (or the chunks, if lists of chunks are given) are first lined
+    up on the ones that occur once on each side and are unchanged. Between
+    those, paragraphs are paired by position, or diffed together if their
+    numbers differ, on their tokens with a linear-space Myers diff. The cost
+    grows with the length of each pair and its edits rather than with the
+    square of the whole document.
+
+    Args:
+        text1 (Union[str, List[str]]): The initial translation, or its chunks.
+        text2 (Union[str, List[str]]): The final translation, or its chunks.
+
+    Yields:
+        Tuple[str, Optional[str]]: Each token with None, "removed" or "added".
+    """
+    paragraphs1, paragraphs2 = _paragraphs(text1), _paragraphs(text2)
+    spaced1 = any(" " in p for p in paragraphs1)
+    spaced2 = any(" " in p for p in paragraphs2)
+    separator = "\n" if isinstance(text1, str) else ""
+    ids: Dict[str, int] = {}
+
+    def tokens(paragraphs: List[str], i: int, spaced: bool) -> List[str]:
+        # The separator before a paragraph is one of its tokens
+        head = [separator] if i > 0 and separator else []
+        return head + tokenize(paragraphs[i], spaced)
+
+    def region(i0: int, i1: int, j0: int, j1: int) -> Iterator[Highlight]:
+        if i1 - i0 == j1 - j0 or i0 == i1 or j0 == j1:
+            pairs = zip(range(i0, i1), range(j0, j1))
+            if i0 == i1 or j0 == j1:
+                pairs = [(i, None) for i in range(i0, i1)] + [
+                    (None, j) for j in range(j0, j1)
+                ]
+            for i, j in pairs:
+                left = [] if i is None else tokens(paragraphs1, i, spaced1)
+                right = [] if j is None else tokens(paragraphs2, j, spaced2)
+                yield from _diff_tokens(left, right, ids)
+        elif (i1 - i0) + (j1 - j0) > MAX_REGION_PARAGRAPHS:
+            # Too big to diff in one go: pair by position, rest unmatched
+            common = min(i1 - i0, j1 - j0)
+            yield from region(i0, i0 + common, j0, j0 + common)
+            yield from region(i0 + common, i1, j0 + common, j1)
+        else:
+            left = [
+                t
+                for i in range(i0, i1)
+                for t in tokens(paragraphs1, i, spaced1)
+            ]
+            right = [
+                t
+                for j in range(j0, j1)
+                for t in tokens(paragraphs2, j, spaced2)
+            ]
+            yield from _diff_tokens(left, right, ids)
+
+    i = j = 0
+    for anchor_i, anchor_j in _unique_anchors(paragraphs1, paragraphs2):
+        yield from region(i, anchor_i, j, anchor_j)
+        yield from _diff_tokens(
+            tokens(paragraphs1, anchor_i, spaced1),
+            tokens(paragraphs2, anchor_j, spaced2),
+            ids,
+        )
+        i, j = anchor_i + 1, anchor_j + 1
+    yield from region(i, len(paragraphs1), j, len(paragraphs2))
+
+
+def diff_texts(
+    text1: Union[str, List[str]], text2: Union[str, List[str]]
+) -> List[Highlight]:
+    """Return the word diff of two translations; see iter_diff."""
+    return list(iter_diff(text1, text2))
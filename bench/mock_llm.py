@@ -0,0 +1,268 @@
+"""
+A local stand-in for the OpenAI chat completions API, for offline benchmarks
+and tests.
+
+It answers POST /v1/chat/completions by echoing the text it was asked to
+translate, after a latency drawn from a configurable distribution, and can
+inject 429 errors at random or once a requests-per-minute cap is exceeded.
+
+Usage:
+    python bench/mock_llm.py --port 8011 --latency fixed:0.2 --error-rate 0.1
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import random
+import re
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict, Optional
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Build a latency sampler from "fixed:S", "uniform:LO,HI" or
+    "lognormal:MU,SIGMA".
+
+    Returns:
+        Callable[[], float]: Returns one latency in seconds per call.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",")] if args else []
+    if kind == "fixed":
+        return lambda: values[0] if values else 0.0
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+def echo(prompt: str, json_mode: bool) -> str:
+    """Answer a translation-agent prompt with the text it asks to work on."""
+
+    if json_mode:
+        start = prompt.find("{", prompt.find("JSON object mapping"))
+        try:
+            segments, _ = json.JSONDecoder().raw_decode(prompt[start:])
+        except ValueError:
+            return "{}"
+        translations = {
+            key: value.get("translation", "")
+            if isinstance(value, dict)
+            else value
+            for key, value in segments.items()
+        }
+        return json.dumps({"translations": translations}, ensure_ascii=False)
+
+    if "<EXPERT_SUGGESTIONS>" in prompt:
+        return prompt.rsplit("<TRANSLATION>\n", 1)[-1].split(
+            "\n</TRANSLATION>", 1
+        )[0]
+    if "suggestions" in prompt.splitlines()[-1].lower():
+        return "1. The translation is accurate; no changes are needed."
+    if "<TRANSLATE_THIS>" in prompt:
+        return prompt.rsplit("<TRANSLATE_THIS>\n", 1)[-1].split(
+            "\n</TRANSLATE_THIS>", 1
+        )[0]
+    match = re.search(r":\s(.*)\n\n\s*[^\n:]+:\s*$", prompt, re.DOTALL)
+    return match.group(1) if match else prompt
+
+
+class MockLLMServer:
+    """
+    An OpenAI-compatible chat completions server in a background thread.
+
+    Args:
+        port (int): The port to listen on; 0 picks a free one.
+        latency (str): The latency distribution, see parse_latency.
+        error_rate (float): The probability of answering a request with a 429.
+        rpm (Optional[int]): Answer 429 once more than this many requests
+            arrive within a minute.
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: str = "fixed:0",
+        error_rate: float = 0.0,
+        rpm: Optional[int] = None,
+        host: str = "127.0.0.1",
+    ):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "rate_limited": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+        self._lock = Lock()
+        self._recent: deque = deque()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _admit(self) -> Optional[int]:
+        # Returns the remaining request budget, or None if it is rejected
+        now = time.monotonic()
+        with self._lock:
+            self.stats["requests"] += 1
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            over_limit = self.rpm is not None and len(self._recent) >= self.rpm
+            if over_limit or random.random() < self.error_rate:
+                self.stats["rate_limited"] += 1
+                return None
+            self._recent.append(now)
+            return (self.rpm - len(self._recent)) if self.rpm else 1_000_000
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(
+                self, status: int, body: Dict, headers: Dict[str, str]
+            ):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):  # noqa: N802
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send_json(
+                        404, {"error": {"message": "not found"}}, {}
+                    )
+                    return
+
+                remaining = server._admit()
+                limit = str(server.rpm or 1_000_000)
+                if remaining is None:
+                    self._send_json(
+                        429,
+                        {
+                            "error": {
+                                "message": "Rate limit reached",
+                                "type": "rate_limit_exceeded",
+                            }
+                        },
+                        {
+                            "retry-after": "1",
+                            "x-ratelimit-limit-requests": limit,
+                            "x-ratelimit-remaining-requests": "0",
+                            "x-ratelimit-reset-requests": "1s",
+                        },
+                    )
+                    return
+
+                time.sleep(max(0.0, server.sample_latency()))
+
+                messages = request.get("messages", [])
+                prompt = messages[-1]["content"] if messages else ""
+                json_mode = (request.get("response_format") or {}).get(
+                    "type"
+                ) == "json_object"
+                content = echo(prompt, json_mode)
+                prompt_tokens = sum(
+                    estimate_tokens(m.get("content", "")) for m in messages
+                )
+                completion_tokens = estimate_tokens(content)
+                with server._lock:
+                    server.stats["prompt_tokens"] += prompt_tokens
+                    server.stats["completion_tokens"] += completion_tokens
+
+                self._send_json(
+                    200,
+                    {
+                        "id": f"chatcmpl-mock-{random.getrandbits(32):08x}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request.get("model", "mock"),
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {
+                                    "role": "assistant",
+                                    "content": content,
+                                },
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                        },
+                    },
+                    {
+                        "x-ratelimit-limit-requests": limit,
+                        "x-ratelimit-remaining-requests": str(remaining),
+                        "x-ratelimit-reset-requests": "60s",
+                    },
+                )
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--latency", default="fixed:0.2")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        args.port, args.latency, args.error_rate, args.rpm, args.host
+    )
+    print(f"Mock LLM listening on {server.base_url}")
+    with contextlib.suppress(KeyboardInterrupt):
+        server._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
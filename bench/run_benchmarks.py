@@ -0,0 +1,249 @@
+"""
+Deterministic, offline benchmarks of the translation pipeline against the
+mock LLM.
+
+Each scenario translates `concurrency` copies of a synthetic document of a
+given size with a given chunk size, and records throughput, p50/p99 latency
+per document and per call, tokens sent and peak traced memory. Results are
+written as JSON; pass --baseline with an earlier results file to fail on
+regressions.
+
+Usage:
+    python bench/run_benchmarks.py --sizes 5000 --concurrency 4 --output r.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import openai  # noqa: E402
+from translation_agent import instrumentation, utils  # noqa: E402
+
+import src.translation_agent.utils as app_utils  # noqa: E402
+from bench.mock_llm import MockLLMServer  # noqa: E402
+
+
+SAMPLE_TEXT = os.path.join(
+    ROOT, "examples", "sample-texts", "sample-long1.txt"
+)
+
+# Metrics where larger is worse, and those where smaller is worse
+LOWER_IS_BETTER = (
+    "doc_p50",
+    "doc_p99",
+    "call_p50",
+    "call_p99",
+    "prompt_tokens",
+    "peak_memory_mb",
+)
+HIGHER_IS_BETTER = ("docs_per_second",)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def synthetic_document(num_tokens: int) -> str:
+    """Repeat the sample text until it has roughly num_tokens tokens."""
+    with open(SAMPLE_TEXT, encoding="utf-8") as f:
+        paragraphs = [p for p in f.read().split("\n\n") if p.strip()]
+    document, tokens = [], 0
+    i = 0
+    while tokens < num_tokens:
+        paragraph = paragraphs[i % len(paragraphs)]
+        document.append(paragraph)
+        tokens += utils.num_tokens_in_string(paragraph)
+        i += 1
+    return "\n\n".join(document)
+
+
+def run_scenario(
+    translate_one: Callable[[str], None],
+    document: str,
+    concurrency: int,
+) -> Dict[str, float]:
+    """Translate `concurrency` copies of document at once and summarize."""
+
+    results: List[instrumentation.TranslationResult] = []
+
+    def run(_):
+        with instrumentation.collect() as result:
+            translate_one(document)
+        results.append(result)
+
+    tracemalloc.start()
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, range(concurrency)))
+    elapsed = time.monotonic() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    doc_seconds = [result.wall_seconds for result in results]
+    call_seconds = [
+        call.wall_seconds for result in results for call in result.calls
+    ]
+    return {
+        "docs_per_second": round(len(results) / elapsed, 4),
+        "doc_p50": round(percentile(doc_seconds, 0.5), 4),
+        "doc_p99": round(percentile(doc_seconds, 0.99), 4),
+        "call_p50": round(percentile(call_seconds, 0.5), 4),
+        "call_p99": round(percentile(call_seconds, 0.99), 4),
+        "calls": sum(len(result.calls) for result in results),
+        "prompt_tokens": sum(result.prompt_tokens for result in results),
+        "peak_memory_mb": round(peak / 2**20, 3),
+    }
+
+
+def translate_target(max_tokens: int) -> Callable[[str], None]:
+    return lambda text: utils.translate(
+        "English", "Spanish", text, 3, "Mexico", max_tokens=max_tokens
+    )
+
+
+def translator_target(max_tokens: int) -> Callable[[str], None]:
+    from app.process import translator
+
+    return lambda text: translator(
+        "English", "Spanish", text, 3, "Mexico", max_tokens
+    )
+
+
+def glossary_target(max_tokens: int) -> Callable[[str], None]:
+    from app.glossary_processor import GlossaryProcessor
+
+    processor = GlossaryProcessor()
+    processor.load_glossaries()
+
+    def run(text):
+        terms = processor.identify_terms(text, "English", "Spanish")
+        processor.mark_terms(text, terms)
+
+    return run
+
+
+TARGETS = {
+    "translate": translate_target,
+    "translator": translator_target,
+    "glossary": glossary_target,
+}
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """List the metrics that got worse than baseline by more than tolerance."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in LOWER_IS_BETTER:
+            if previous.get(metric) and current[metric] > previous[metric] * (
+                1 + tolerance
+            ):
+                regressions.append(
+                    f"{name}: {metric} {previous[metric]} -> {current[metric]}"
+                )
+        for metric in HIGHER_IS_BETTER:
+            if previous.get(metric) and current[metric] < previous[metric] * (
+                1 - tolerance
+            ):
+                regressions.append(
+                    f"{name}: {metric} {previous[metric]} -> {current[metric]}"
+                )
+    return regressions
+
+
+def parse_ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument(
+        "--targets",
+        default="translate,glossary",
+        help=f"Comma-separated, from {', '.join(TARGETS)}",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=parse_ints,
+        default=[300, 3000, 12000],
+        help="Document sizes in tokens",
+    )
+    parser.add_argument("--chunk-sizes", type=parse_ints, default=[1000])
+    parser.add_argument("--concurrency", type=parse_ints, default=[1, 4])
+    parser.add_argument("--latency", default="lognormal:-2.5,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=None,
+        help="Rate limit enforced by the mock LLM",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with MockLLMServer(
+        latency=args.latency, error_rate=args.error_rate, rpm=args.rpm
+    ) as server:
+        # The app imports the library as src.translation_agent, a second copy
+        # of its modules, so both copies talk to the mock. Identical requests
+        # from concurrent copies of a document must not be merged into one,
+        # or the run measures request merging instead of concurrency
+        for module in (utils, app_utils):
+            module.client = openai.OpenAI(
+                api_key="mock", base_url=server.base_url, max_retries=5
+            )
+            module.single_flight = None
+
+        results = {}
+        for target in args.targets.split(","):
+            for size in args.sizes:
+                document = synthetic_document(size)
+                for max_tokens in args.chunk_sizes:
+                    translate_one = TARGETS[target](max_tokens)
+                    for concurrency in args.concurrency:
+                        name = (
+                            f"{target}/size={size}/chunk={max_tokens}"
+                            f"/concurrency={concurrency}"
+                        )
+                        results[name] = run_scenario(
+                            translate_one, document, concurrency
+                        )
+                        print(name, json.dumps(results[name]))
+        print(f"Mock LLM: {json.dumps(server.stats)}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
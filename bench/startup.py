@@ -0,0 +1,154 @@
+"""
+Cold start benchmark: how long importing the library, the CLI and the apps
+takes.
+
+Each target is imported in a fresh interpreter `--runs` times, without
+OPENAI_API_KEY, and the median and best import times are recorded along with
+the heavy modules (openai, tiktoken, langchain, pandas, gradio, streamlit)
+that the import pulled in. Results are written as JSON; pass --baseline with
+an earlier results file to fail on regressions.
+
+Usage:
+    python bench/startup.py --runs 5 --output startup_results.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+TARGETS = {
+    "library": "translation_agent",
+    "cli": "translation_agent.cli",
+    "processing": "app.process",
+}
+
+HEAVY_MODULES = (
+    "openai",
+    "tiktoken",
+    "langchain_text_splitters",
+    "pandas",
+    "gradio",
+    "streamlit",
+    "pymupdf",
+    "docx",
+    "simplemma",
+)
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(seconds, ",".join(heavy))
+"""
+
+
+def time_import(module: str) -> Dict:
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = os.pathsep.join(
+        [ROOT, os.path.join(ROOT, "src"), env.get("PYTHONPATH", "")]
+    )
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            PROBE.format(module=module, heavy=HEAVY_MODULES),
+        ],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode:
+        return {"error": completed.stderr.strip().splitlines()[-1]}
+    seconds, _, heavy = (
+        completed.stdout.strip().splitlines()[-1].partition(" ")
+    )
+    return {
+        "seconds": float(seconds),
+        "heavy": heavy.split(",") if heavy else [],
+    }
+
+
+def run_target(module: str, runs: int) -> Dict:
+    samples: List[float] = []
+    heavy: List[str] = []
+    for _ in range(runs):
+        result = time_import(module)
+        if "error" in result:
+            return result
+        samples.append(result["seconds"])
+        heavy = result["heavy"]
+    return {
+        "median_seconds": round(statistics.median(samples), 4),
+        "best_seconds": round(min(samples), 4),
+        "heavy_modules": heavy,
+    }
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in current.items():
+        previous = baseline.get(name, {})
+        if "median_seconds" not in result or not previous.get(
+            "median_seconds"
+        ):
+            continue
+        if result["median_seconds"] > previous["median_seconds"] * (
+            1 + tolerance
+        ):
+            regressions.append(
+                f"{name}: median_seconds {previous['median_seconds']}"
+                f" -> {result['median_seconds']}"
+            )
+        added = set(result["heavy_modules"]) - set(
+            previous.get("heavy_modules", [])
+        )
+        if added:
+            regressions.append(
+                f"{name}: now imports {', '.join(sorted(added))}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument(
+        "--targets",
+        default=",".join(TARGETS),
+        help=f"Comma-separated, from {', '.join(TARGETS)}",
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default="startup_results.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    results = {}
+    for target in args.targets.split(","):
+        results[target] = run_target(TARGETS[target], args.runs)
+        print(target, json.dumps(results[target]))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,8 @@
+from .batching import batched_translation
+from .multi import translate_multi
+from .planner import plan
+from .resources import translate_json, translate_po
+from .segmenter import translate_segmented
+from .streaming import translate_stream
+from .subtitles import translate_srt
 from .utils import translate
@@ -0,0 +1,369 @@
+import json
+from typing import Dict, List
+
+from icecream import ic
+
+from . import instrumentation, utils
+from .utils import tone_mapping
+
+
+MAX_TOKENS_PER_BATCH = 2000  # source tokens packed into one json_mode request
+
+
+def pack_batches(texts: List[str], max_batch_tokens: int) -> List[List[int]]:
+    """
+    Greedily group consecutive texts into batches that fit a token budget.
+
+    Args:
+        texts (List[str]): The chunks or short texts to pack.
+        max_batch_tokens (int): The maximum number of source tokens per batch.
+            A single text larger than the budget gets a batch of its own.
+
+    Returns:
+        List[List[int]]: The indices of the texts in each batch, in order.
+
+    Example:
+        >>> pack_batches(["a", "b", "c"], 2)  # one token each
+        [[0, 1], [2]]
+    """
+
+    batches = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        num_tokens = utils.num_tokens_in_string(text)
+        if current and current_tokens + num_tokens > max_batch_tokens:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += num_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_response(response: str, ids: List[int]) -> Dict[int, str]:
+    """
+    Parse a json_mode batch response back into per-ID results.
+
+    Both {"translations": {"<id>": "<text>"}} and
+    {"translations": [{"id": <id>, "translation": "<text>"}]} are accepted.
+    IDs that are missing, unknown or not mapped to a string are left out, so
+    the caller can fall back to single-chunk calls for them.
+
+    Args:
+        response (str): The raw completion returned by get_completion.
+        ids (List[int]): The IDs that were sent in the batch.
+
+    Returns:
+        Dict[int, str]: The parsed results keyed by ID.
+    """
+
+    try:
+        payload = json.loads(response)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(payload, dict):
+        return {}
+
+    entries = payload.get("translations", payload)
+    if isinstance(entries, list):
+        entries = {
+            str(entry.get("id")): entry.get("translation")
+            for entry in entries
+            if isinstance(entry, dict)
+        }
+    if not isinstance(entries, dict):
+        return {}
+
+    results = {}
+    for i in ids:
+        value = entries.get(str(i))
+        if isinstance(value, str):
+            results[i] = value
+    return results
+
+
+def _context_block(source_text_chunks: List[str], independent: bool) -> str:
+    if independent:
+        return "The segments are unrelated texts. Translate each one on its own.\n"
+    return f"""The full source text is below, delimited by XML tags <SOURCE_TEXT> and </SOURCE_TEXT>. \
+Use it only as context, and do not translate anything outside the segments.
+
+<SOURCE_TEXT>
+{"".join(source_text_chunks)}
+</SOURCE_TEXT>
+"""
+
+
+def _run_batches(
+    stage: str,
+    batches: List[List[int]],
+    build_prompt,
+    system_message: str,
+    fallback,
+) -> Dict[int, str]:
+    results: Dict[int, str] = {}
+    for batch in batches:
+        with instrumentation.stage(stage):
+            response = utils.get_completion(
+                build_prompt(batch),
+                system_message=system_message,
+                json_mode=True,
+            )
+        parsed = parse_batch_response(response, batch)
+        missing = [i for i in batch if i not in parsed]
+        if missing:
+            ic(
+                f"Batch response missing {len(missing)} segment(s), "
+                "falling back"
+            )
+            parsed.update(fallback(missing))
+        results.update(parsed)
+    return results
+
+
+def batched_initial_translation(
+    source_lang: str,
+    target_lang: str,
+    source_text_chunks: List[str],
+    tone: int,
+    max_batch_tokens: int = MAX_TOKENS_PER_BATCH,
+    independent: bool = False,
+    instructions: str = "",
+) -> List[str]:
+    """
+    Translate chunks or short texts, several of them per request.
+
+    Args:
+        source_lang (str): The source language of the text.
+        target_lang (str): The target language for translation.
+        source_text_chunks (List[str]): The chunks of one text, or a list of
+            short texts.
+        tone (int): Formality level (1-5).
+        max_batch_tokens (int): The maximum number of source tokens per
+            request.
+        independent (bool): Whether the texts are unrelated. If False they are
+            treated as chunks of one document and the whole text is sent as
+            context.
+        instructions (str): Extra instructions added to each batch prompt.
+
+    Returns:
+        List[str]: A list of translated chunks, aligned with
+            source_text_chunks.
+    """
+
+    system_message = f"You are an expert linguist, specializing in translation from {source_lang} to {target_lang}. {tone_mapping[tone]}"
+    context = _context_block(source_text_chunks, independent)
+
+    def build_prompt(batch: List[int]) -> str:
+        segments = {str(i): source_text_chunks[i] for i in batch}
+        return f"""Your task is to provide a professional translation from {source_lang} to {target_lang} of several segments.
+The translation should adhere to the required formality level.
+
+{context}
+The segments to translate are given below as a JSON object mapping segment IDs to source text:
+{json.dumps(segments, ensure_ascii=False, indent=2)}
+{instructions}
+Translate every segment and keep its ID. Do not merge, split or omit segments.
+Respond only with a JSON object of the form {{"translations": {{"<id>": "<translation>"}}}}."""
+
+    def fallback(missing: List[int]) -> Dict[int, str]:
+        if independent:
+            return {
+                i: utils.one_chunk_initial_translation(
+                    source_lang, target_lang, source_text_chunks[i], tone
+                )
+                for i in missing
+            }
+        translations = utils.multichunk_initial_translation(
+            source_lang,
+            target_lang,
+            source_text_chunks,
+            tone,
+            chunk_indices=missing,
+        )
+        return dict(zip(missing, translations))
+
+    results = _run_batches(
+        "initial",
+        pack_batches(source_text_chunks, max_batch_tokens),
+        build_prompt,
+        system_message,
+        fallback,
+    )
+    return [results[i] for i in range(len(source_text_chunks))]
+
+
+def batched_improve_translation(
+    source_lang: str,
+    target_lang: str,
+    source_text_chunks: List[str],
+    translation_1_chunks: List[str],
+    reflection_chunks: List[str],
+    tone: int,
+    max_batch_tokens: int = MAX_TOKENS_PER_BATCH,
+    independent: bool = False,
+    instructions: str = "",
+) -> List[str]:
+    """
+    Improve translations using expert suggestions, several chunks per request.
+
+    Args:
+        source_lang (str): The source language of the text.
+        target_lang (str): The target language for translation.
+        source_text_chunks (List[str]): The chunks of one text, or a list of
+            short texts.
+        translation_1_chunks (List[str]): The initial translation of each
+            chunk.
+        reflection_chunks (List[str]): Expert suggestions for improving each
+            translated chunk.
+        tone (int): Formality level (1-5).
+        max_batch_tokens (int): The maximum number of tokens per request,
+            counting the source, initial translation and suggestions of each
+            chunk.
+        independent (bool): Whether the texts are unrelated. If False they are
+            treated as chunks of one document and the whole text is sent as
+            context.
+        instructions (str): Extra instructions added to each batch prompt.
+
+    Returns:
+        List[str]: The improved translation of each chunk, aligned with
+            source_text_chunks.
+    """
+
+    system_message = f"You are an expert linguist, specializing in translation editing from {source_lang} to {target_lang}. {tone_mapping[tone]}"
+    context = _context_block(source_text_chunks, independent)
+
+    def build_prompt(batch: List[int]) -> str:
+        segments = {
+            str(i): {
+                "source": source_text_chunks[i],
+                "translation": translation_1_chunks[i],
+                "suggestions": reflection_chunks[i],
+            }
+            for i in batch
+        }
+        return f"""Your task is to carefully read, then improve, translations from {source_lang} to {target_lang} of several segments, \
+taking into account a set of expert suggestions and constructive criticisms for each of them.
+
+{context}
+The segments are given below as a JSON object mapping segment IDs to the source text, the initial translation and the expert suggestions:
+{json.dumps(segments, ensure_ascii=False, indent=2)}
+
+Taking into account the expert suggestions, rewrite each translation to improve its accuracy, fluency, style and terminology, \
+ensuring it adheres to the required formality level.
+{instructions}
+Keep every segment ID. Do not merge, split or omit segments.
+Respond only with a JSON object of the form {{"translations": {{"<id>": "<improved translation>"}}}}."""
+
+    def fallback(missing: List[int]) -> Dict[int, str]:
+        if independent:
+            return {
+                i: utils.one_chunk_improve_translation(
+                    source_lang,
+                    target_lang,
+                    source_text_chunks[i],
+                    translation_1_chunks[i],
+                    reflection_chunks[i],
+                    tone,
+                )
+                for i in missing
+            }
+        translations = utils.multichunk_improve_translation(
+            source_lang,
+            target_lang,
+            source_text_chunks,
+            translation_1_chunks,
+            reflection_chunks,
+            tone,
+            chunk_indices=missing,
+        )
+        return dict(zip(missing, translations))
+
+    packed = [
+        source_text_chunks[i] + translation_1_chunks[i] + reflection_chunks[i]
+        for i in range(len(source_text_chunks))
+    ]
+    results = _run_batches(
+        "improved",
+        pack_batches(packed, max_batch_tokens),
+        build_prompt,
+        system_message,
+        fallback,
+    )
+    return [results[i] for i in range(len(source_text_chunks))]
+
+
+def batched_translation(
+    source_lang: str,
+    target_lang: str,
+    source_text_chunks: List[str],
+    tone: int,
+    country: str = "",
+    max_batch_tokens: int = MAX_TOKENS_PER_BATCH,
+    independent: bool = False,
+    instructions: str = "",
+) -> List[str]:
+    """
+    Run the translate, reflect and improve stages, batching the first and last.
+
+    Reflection stays one request per chunk, since it produces free-form
+    suggestions.
+
+    Args:
+        source_lang (str): The source language of the text.
+        target_lang (str): The target language for translation.
+        source_text_chunks (List[str]): The chunks of one text, or a list of
+            short texts.
+        tone (int): Formality level (1-5).
+        country (str): Country specified for the target language.
+        max_batch_tokens (int): The maximum number of tokens per batched
+            request.
+        independent (bool): Whether the texts are unrelated short texts.
+        instructions (str): Extra instructions added to each batch prompt.
+
+    Returns:
+        List[str]: The improved translation of each chunk.
+    """
+
+    translation_1_chunks = batched_initial_translation(
+        source_lang,
+        target_lang,
+        source_text_chunks,
+        tone,
+        max_batch_tokens,
+        independent,
+        instructions,
+    )
+
+    if independent:
+        reflection_chunks = [
+            utils.one_chunk_reflect_on_translation(
+                source_lang, target_lang, text, translation_1, tone, country
+            )
+            for text, translation_1 in zip(
+                source_text_chunks, translation_1_chunks
+            )
+        ]
+    else:
+        reflection_chunks = utils.multichunk_reflect_on_translation(
+            source_lang,
+            target_lang,
+            source_text_chunks,
+            translation_1_chunks,
+            tone,
+            country,
+        )
+
+    return batched_improve_translation(
+        source_lang,
+        target_lang,
+        source_text_chunks,
+        translation_1_chunks,
+        reflection_chunks,
+        tone,
+        max_batch_tokens,
+        independent,
+        instructions,
+    )
@@ -0,0 +1,229 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+# Upper bound on one provider request, retries aside
+DEFAULT_CALL_TIMEOUT = float(
+    os.getenv("TRANSLATION_AGENT_CALL_TIMEOUT", "120")
+)
+# How often waits re-check deadlines and session liveness
+POLL_INTERVAL = 0.1
+
+
+class TranslationCancelledError(Exception):
+    """Raised in a translation whose CancelToken was cancelled."""
+
+
+class DeadlineExceededError(TranslationCancelledError):
+    """Raised in a translation that ran past its deadline."""
+
+
+class CancelToken:
+    """
+    A cooperative cancellation signal for one translation job.
+
+    The pipeline checks it before every get_completion call, so a cancelled
+    job stops at the next chunk or stage boundary. Waits for the rate limiter
+    and for in-flight requests wake up as soon as it is cancelled.
+
+    Args:
+        timeout (Optional[float]): Seconds from now until the job's deadline.
+        is_alive (Optional[Callable[[], bool]]): Polled while the job runs;
+            returning False cancels it, e.g. when the user's session is gone.
+        abandon_calls (bool): Stop waiting for an in-flight request as soon
+            as the job is cancelled, see run_abandonable. If False, only the
+            deadline bounds a request, as its client timeout.
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        is_alive: Optional[Callable[[], bool]] = None,
+        abandon_calls: bool = True,
+    ):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.is_alive = is_alive
+        self.abandon_calls = abandon_calls
+        self.reason: Optional[str] = None
+        self._event = Event()
+        self._deadline_exceeded = False
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def _poll(self) -> None:
+        if self._event.is_set():
+            return
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self._deadline_exceeded = True
+            self.cancel("deadline exceeded")
+        elif self.is_alive is not None and not self.is_alive():
+            self.cancel("session closed")
+
+    @property
+    def cancelled(self) -> bool:
+        self._poll()
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Return the seconds left until the deadline, if there is one."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self) -> None:
+        """Raise TranslationCancelledError if cancelled or out of time."""
+        if self.cancelled:
+            error = (
+                DeadlineExceededError
+                if self._deadline_exceeded
+                else TranslationCancelledError
+            )
+            raise error(self.reason)
+
+    def wait(self, seconds: float, done: Optional[Event] = None) -> None:
+        """
+        Sleep for seconds, or until done is set, raising if cancelled first.
+        """
+        end = time.monotonic() + seconds
+        while True:
+            self.check()
+            left = end - time.monotonic()
+            if left <= 0 or (done is not None and done.is_set()):
+                return
+            step = min(left, POLL_INTERVAL)
+            (done or self._event).wait(step)
+
+
+_current_token: ContextVar[Optional[CancelToken]] = ContextVar(
+    "translation_agent_cancel_token", default=None
+)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+@contextmanager
+def scope(token: CancelToken) -> Iterator[CancelToken]:
+    """Make the get_completion calls made inside the block honour token."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def checkpoint() -> None:
+    """Raise if the current translation was cancelled or ran out of time."""
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+
+def sleep(seconds: float) -> None:
+    """Sleep, waking up early to raise if the translation is cancelled."""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.wait(seconds)
+
+
+def call_timeout() -> float:
+    """Return the timeout for the next provider request, within deadline."""
+    token = _current_token.get()
+    remaining = token.remaining() if token is not None else None
+    if remaining is None:
+        return DEFAULT_CALL_TIMEOUT
+    return max(min(DEFAULT_CALL_TIMEOUT, remaining), 0.001)
+
+
+def run_abandonable(fn: Callable[[], Any]) -> Any:
+    """
+    Run fn, but stop waiting for it as soon as the current translation is
+    cancelled.
+
+    This waits on a thread per call. The abandoned request is not stopped:
+    it runs on in the background, up to its call_timeout, and the provider
+    still bills it; only its result is dropped. Tokens with abandon_calls
+    False run fn in the calling thread and rely on the client timeout.
+    """
+    token = _current_token.get()
+    if token is None or not token.abandon_calls:
+        return fn()
+
+    done = Event()
+    outcome: Dict[str, Any] = {}
+
+    def run():
+        try:
+            outcome["result"] = fn()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    context = contextvars.copy_context()
+    Thread(target=context.run, args=(run,), daemon=True).start()
+    while not done.is_set():
+        token.wait(POLL_INTERVAL, done)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+class SessionTokens:
+    """
+    The cancel tokens of running jobs, keyed by app session.
+
+    Starting a job cancels the session's previous one, and cancelling a
+    session (e.g. when its browser tab closes) stops its job at the next
+    chunk boundary and abandons its in-flight request.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._tokens: Dict[str, CancelToken] = {}
+
+    def start(self, session_id: str, **kwargs) -> CancelToken:
+        """Create the token for a new job of session_id; see CancelToken."""
+        token = CancelToken(**kwargs)
+        with self._lock:
+            previous = self._tokens.get(session_id)
+            self._tokens[session_id] = token
+        if previous is not None:
+            previous.cancel("superseded by a new request")
+        return token
+
+    def cancel(self, session_id: str, reason: str = "cancelled") -> None:
+        with self._lock:
+            token = self._tokens.pop(session_id, None)
+        if token is not None:
+            token.cancel(reason)
+
+    def finish(self, session_id: str, token: CancelToken) -> None:
+        """Forget a session's token once its job is over."""
+        with self._lock:
+            if self._tokens.get(session_id) is token:
+                del self._tokens[session_id]
+
+    @contextmanager
+    def job(self, session_id: str, **kwargs) -> Iterator[CancelToken]:
+        """Run the block as the session's current job, in its token's scope."""
+        token = self.start(session_id, **kwargs)
+        try:
+            with scope(token):
+                yield token
+        finally:
+            self.finish(session_id, token)
+
+
+sessions = SessionTokens()
@@ -0,0 +1,139 @@
+import gzip
+import json
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from threading import Lock
+from typing import IO, Callable, Deque, Dict, Iterator, List
+
+from . import utils
+from .utils import Completion, request_key
+
+
+class CassetteMissError(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+@contextmanager
+def _open(path: str, mode: str) -> Iterator[IO[str]]:
+    if path.endswith(".gz"):
+        with gzip.open(path, mode + "t", encoding="utf-8") as f:
+            yield f
+    else:
+        with open(path, mode, encoding="utf-8") as f:
+            yield f
+
+
+class Cassette:
+    """
+    Record provider calls to a JSONL file, or serve them back offline.
+
+    Each line holds one (request, response, latency) entry. Paths ending in .gz
+    are gzip-compressed. When the same request was recorded several times,
+    replay serves the recordings in order, then keeps returning the last one.
+
+    Args:
+        path (str): The cassette file.
+        mode (str): "record" to call the provider and append entries, or
+            "replay" to serve recorded entries.
+        replay_latency (bool): In replay mode, sleep for the recorded latency
+            so throughput matches the recorded traffic.
+    """
+
+    def __init__(
+        self, path: str, mode: str = "replay", replay_latency: bool = False
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._lock = Lock()
+        self._entries: Dict[str, Deque[Dict]] = defaultdict(deque)
+        if mode == "replay":
+            with _open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]].append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def play(
+        self, request: Dict, send: Callable[[Dict], Completion]
+    ) -> Completion:
+        """
+        Replay the recorded response to request, or send and record it.
+
+        Args:
+            request (Dict): The chat completion request parameters.
+            send (Callable[[Dict], Completion]): Sends the request upstream.
+
+        Returns:
+            Completion: The recorded or live response.
+        """
+        key = request_key(request)
+        if self.mode == "replay":
+            return self._replay(key)
+
+        started = time.monotonic()
+        completion = send(request)
+        entry = {
+            "key": key,
+            "request": request,
+            "content": completion.content,
+            "prompt_tokens": completion.prompt_tokens,
+            "completion_tokens": completion.completion_tokens,
+            "model": completion.model,
+            "latency": round(time.monotonic() - started, 4),
+        }
+        with self._lock, _open(self.path, "a") as f:
+            line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+            f.write(line + "\n")
+        return completion
+
+    def _replay(self, key: str) -> Completion:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMissError(
+                    f"No recording for request {key[:12]} in {self.path}"
+                )
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+        if self.replay_latency:
+            time.sleep(entry["latency"])
+        return Completion(
+            content=entry["content"],
+            prompt_tokens=entry["prompt_tokens"],
+            completion_tokens=entry["completion_tokens"],
+            model=entry.get("model", ""),
+            cache_hit=True,
+        )
+
+
+@contextmanager
+def use_cassette(
+    path: str, mode: str = "replay", replay_latency: bool = False
+) -> Iterator[Cassette]:
+    """
+    Record or replay every get_completion call made inside the block.
+
+    Example:
+        >>> with use_cassette("traffic.jsonl.gz", mode="record"):
+        ...     translate("English", "Spanish", text, 3, "Mexico")
+        >>> with use_cassette("traffic.jsonl.gz", replay_latency=True):
+        ...     translate("English", "Spanish", text, 3, "Mexico")  # offline
+    """
+    previous = utils.cassette
+    utils.cassette = Cassette(path, mode, replay_latency)
+    try:
+        yield utils.cassette
+    finally:
+        utils.cassette = previous
+
+
+def requests(path: str) -> List[Dict]:
+    """Load the recorded requests of a cassette, e.g. to replay its traffic."""
+    with _open(path, "r") as f:
+        return [json.loads(line)["request"] for line in f if line.strip()]
@@ -0,0 +1,516 @@
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    Executor,
+    ProcessPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Dict, Iterator, Optional
+
+from . import (
+    batching,
+    instrumentation,
+    lanes,
+    resources,
+    segmenter,
+    streaming,
+    subtitles,
+    utils,
+)
+from .jobs import JobStore
+from .ratelimit import store_from_url
+
+
+@contextmanager
+def open_stream(path: str, mode: str = "r") -> Iterator[IO[str]]:
+    """
+    Open path as UTF-8 text, or use stdin or stdout for "-".
+
+    The file is closed when the block exits; stdin and stdout are left open.
+    """
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+        return
+    with open(path, mode, encoding="utf-8") as f:
+        yield f
+
+
+# Characters read at a time from a JSON array
+JSON_READ_SIZE = 1 << 16
+
+
+def iter_json_array(f: IO[str]) -> Iterator[Dict]:
+    """
+    Yield the items of a JSON array of objects one at a time, reading f in
+    blocks, so only one item is held in memory however long the array is.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+
+    def peek() -> str:
+        # The next character that is not whitespace, or "" at the end
+        nonlocal buffer, eof
+        while True:
+            buffer = buffer.lstrip()
+            if buffer or eof:
+                return buffer[:1]
+            buffer = f.read(JSON_READ_SIZE)
+            eof = not buffer
+
+    if peek() != "[":
+        raise ValueError("expected a JSON array")
+    buffer = buffer[1:]
+    if peek() == "]":
+        return
+    while True:
+        peek()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer)
+                break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # The item runs past the block: read on and decode it again
+                more = f.read(JSON_READ_SIZE)
+                eof = not more
+                buffer += more
+        buffer = buffer[end:]
+        yield item
+        separator = peek()
+        buffer = buffer[1:]
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(
+                f"expected , or ] in JSON array, got {separator!r}"
+            )
+
+
+def iter_items(path: str) -> Iterator[Dict]:
+    """
+    Stream batch items from a JSONL file, a JSON array, stdin or a directory.
+
+    JSONL and JSON items need a "source_text" (or "text") field and may
+    override "id", "source_lang", "target_lang", "country" and "tone", and set
+    "format" to a key of STRUCTURED_FORMATS, such as "srt", "po" or "md".
+    Directory items are the files under the directory; they are only read by
+    the worker that translates them, and .srt, .json, .po, .pot, Markdown,
+    Python and C++ files get the format of their extension. A JSON array is
+    read an item at a time, like JSONL.
+
+    Args:
+        path (str): A .jsonl/.json file, a directory, or "-" for JSONL on
+            stdin.
+
+    Yields:
+        Dict: One item per text to translate.
+    """
+
+    if os.path.isdir(path):
+        root = Path(path)
+        for file in sorted(root.rglob("*")):
+            if file.is_file():
+                yield {"id": str(file.relative_to(root)), "path": str(file)}
+        return
+
+    with open_stream(path) as f:
+        if path.endswith(".json"):
+            for line_no, item in enumerate(iter_json_array(f)):
+                item.setdefault("id", line_no)
+                yield item
+            return
+
+        for line_no, line in enumerate(f):
+            if line.strip():
+                item = json.loads(line)
+                item.setdefault("id", line_no)
+                yield item
+
+
+def _init_worker(
+    rpm: Optional[float],
+    routes: Optional[str],
+    rpm_scale: float,
+    adaptive: bool = False,
+    max_rpm: Optional[float] = None,
+    rate_store: Optional[str] = None,
+) -> None:
+    store = store_from_url(rate_store)
+    utils.set_rate_limit(rpm, adaptive=adaptive, max_rpm=max_rpm, store=store)
+    if routes:
+        # Routing needs openai for its errors, so it is imported only if used
+        from .router import load_router
+
+        utils.set_router(load_router(routes, rpm_scale, store))
+
+
+# Files translated by structure rather than as running text
+STRUCTURED_FORMATS = {
+    "srt": subtitles.translate_srt,
+    "json": resources.translate_json,
+    "po": resources.translate_po,
+    "pot": resources.translate_po,
+    # Source code and Markdown: only comments, docstrings and prose
+    **{
+        extension: functools.partial(
+            segmenter.translate_segmented, file_format=extension
+        )
+        for extension in segmenter.SEGMENTERS
+    },
+}
+
+
+def item_format(item: Dict, options: Dict) -> str:
+    """Return an item's format: "text", or a key of STRUCTURED_FORMATS."""
+    if options.get("format"):
+        return options["format"]
+    suffix = Path(item.get("path", "")).suffix.lower().lstrip(".")
+    return suffix if suffix in STRUCTURED_FORMATS else "text"
+
+
+def _translate_structured(
+    file_format: str, source_text: str, options: Dict
+) -> str:
+    kwargs = {
+        "max_batch_tokens": options["batch_max_tokens"]
+        or batching.MAX_TOKENS_PER_BATCH
+    }
+    store = None
+    if file_format != "srt" and options.get("resource_cache"):
+        store = kwargs["store"] = JobStore(options["resource_cache"])
+    try:
+        return STRUCTURED_FORMATS[file_format](
+            options["source_lang"],
+            options["target_lang"],
+            source_text,
+            int(options["tone"]),
+            options["country"],
+            **kwargs,
+        )
+    finally:
+        if store is not None:
+            store.close()
+
+
+def translate_item(item: Dict, defaults: Dict) -> Dict:
+    """Translate one batch item and return its output record."""
+    options = {**defaults, **item}
+    started = time.monotonic()
+    try:
+        if "path" in item:
+            with open(item["path"], encoding="utf-8") as f:
+                source_text = f.read()
+        else:
+            source_text = item.get("source_text", item.get("text"))
+        if not source_text:
+            raise ValueError("item has no source_text")
+
+        file_format = item_format(item, options)
+        with lanes.lane(options.get("lane", lanes.DEFAULT_LANE)):
+            if file_format != "text":
+                # Subtitles keep their timecodes, and string catalogs their
+                # keys and placeholders
+                with instrumentation.collect() as result:
+                    result.translation = _translate_structured(
+                        file_format, source_text, options
+                    )
+            else:
+                result = utils.translate(
+                    options["source_lang"],
+                    options["target_lang"],
+                    source_text,
+                    int(options["tone"]),
+                    options["country"],
+                    max_tokens=options["max_tokens"],
+                    batch_max_tokens=options["batch_max_tokens"],
+                    return_result=True,
+                )
+        return {
+            "id": item["id"],
+            "source_lang": options["source_lang"],
+            "target_lang": options["target_lang"],
+            "translation": result.translation,
+            "source_tokens": utils.num_tokens_in_string(source_text),
+            "prompt_tokens": result.prompt_tokens,
+            "completion_tokens": result.completion_tokens,
+            "calls": len(result.calls),
+            "seconds": round(time.monotonic() - started, 3),
+        }
+    except Exception as e:
+        return {
+            "id": item["id"],
+            "error": f"{type(e).__name__}: {e}",
+            "seconds": round(time.monotonic() - started, 3),
+        }
+
+
+def run_batch(
+    items: Iterator[Dict],
+    output: IO[str],
+    defaults: Dict,
+    executor: Executor,
+    max_in_flight: int,
+) -> Dict:
+    """
+    Translate items on an executor and write each result once it completes.
+
+    At most max_in_flight items are submitted at once, so memory stays bounded
+    however long the input is. Results are written in completion order.
+
+    Returns:
+        Dict: Throughput, token and error statistics for the run.
+    """
+
+    stats = {
+        "items": 0,
+        "errors": 0,
+        "calls": 0,
+        "source_tokens": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+    }
+    started = time.monotonic()
+    pending = set()
+
+    def drain(return_when):
+        nonlocal pending
+        done, pending = wait(pending, return_when=return_when)
+        for future in done:
+            record = future.result()
+            stats["items"] += 1
+            if "error" in record:
+                stats["errors"] += 1
+            else:
+                for key in (
+                    "calls",
+                    "source_tokens",
+                    "prompt_tokens",
+                    "completion_tokens",
+                ):
+                    stats[key] += record[key]
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+
+    for item in items:
+        if len(pending) >= max_in_flight:
+            drain(FIRST_COMPLETED)
+        pending.add(executor.submit(translate_item, item, defaults))
+    if pending:
+        drain(ALL_COMPLETED)
+
+    elapsed = time.monotonic() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["items_per_second"] = (
+        round(stats["items"] / elapsed, 3) if elapsed else 0.0
+    )
+    stats["tokens_per_second"] = (
+        round(stats["source_tokens"] / elapsed, 1) if elapsed else 0.0
+    )
+    return stats
+
+
+def batch_command(args: argparse.Namespace) -> int:
+    defaults = {
+        "source_lang": args.source_lang,
+        "target_lang": args.target_lang,
+        "country": args.country,
+        "tone": args.tone,
+        "max_tokens": args.max_tokens,
+        "batch_max_tokens": args.batch_max_tokens,
+        "lane": args.lane,
+        "resource_cache": args.resource_cache,
+    }
+    # Workers draw from one shared budget if there is a rate store, and
+    # otherwise each gets an equal share of it
+    share = 1 if args.rate_store else 1 / args.workers
+    worker_rpm = args.rpm * share if args.rpm else None
+    max_in_flight = args.max_in_flight or 2 * args.workers
+
+    with open_stream(args.output, "a") as output, ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(
+            worker_rpm,
+            args.routes,
+            share,
+            args.adaptive_rpm,
+            args.max_rpm * share if args.max_rpm else None,
+            args.rate_store,
+        ),
+    ) as executor:
+        stats = run_batch(
+            iter_items(args.input),
+            output,
+            defaults,
+            executor,
+            max_in_flight,
+        )
+
+    print(
+        f"Translated {stats['items']} item(s) with {stats['errors']} "
+        f"error(s) in {stats['seconds']}s: {stats['items_per_second']} "
+        f"items/s, {stats['source_tokens']} source tokens "
+        f"({stats['tokens_per_second']} tokens/s), {stats['calls']} calls "
+        f"using {stats['prompt_tokens']} prompt and "
+        f"{stats['completion_tokens']} completion tokens",
+        file=sys.stderr,
+    )
+    return 1 if stats["errors"] else 0
+
+
+def stream_command(args: argparse.Namespace) -> int:
+    _init_worker(args.rpm, args.routes, 1, rate_store=args.rate_store)
+    # Read, translate and write a chunk at a time, so memory stays bounded
+    # however large the file is
+    chunks = streaming.translate_stream(
+        args.source_lang,
+        args.target_lang,
+        streaming.drop_blank_lines(streaming.iter_file(args.input)),
+        args.tone,
+        args.country,
+        max_tokens=args.max_tokens,
+        context_chunks=args.context_chunks,
+    )
+    with open_stream(args.output, "w") as output:
+        for translation in chunks:
+            output.write(translation)
+            output.flush()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="translation-agent",
+        description="Agentic workflow for machine translation using LLMs",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser(
+        "batch", help="Translate a JSONL file or a directory of text files"
+    )
+    batch.add_argument(
+        "input", help="A .jsonl or .json file, a directory, or - for stdin"
+    )
+    batch.add_argument(
+        "-o", "--output", default="-", help="JSONL file to append results to"
+    )
+    batch.add_argument("--source-lang", default="English")
+    batch.add_argument("--target-lang", required=True)
+    batch.add_argument("--country", default="")
+    batch.add_argument("--tone", type=int, default=3, choices=range(1, 6))
+    batch.add_argument(
+        "--max-tokens", type=int, default=utils.MAX_TOKENS_PER_CHUNK
+    )
+    batch.add_argument(
+        "--batch-max-tokens",
+        type=int,
+        default=None,
+        help="Pack chunks into json_mode requests of up to this many tokens",
+    )
+    batch.add_argument(
+        "--lane",
+        default=lanes.DEFAULT_LANE,
+        choices=list(lanes.LANE_WEIGHTS),
+        help="Scheduling priority of the calls, unless an item sets its own",
+    )
+    batch.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    batch.add_argument(
+        "--rpm", type=float, default=None, help="Global requests per minute"
+    )
+    batch.add_argument(
+        "--adaptive-rpm",
+        action="store_true",
+        help="Tune --rpm from the provider's rate limit headers and 429s",
+    )
+    batch.add_argument(
+        "--max-rpm",
+        type=float,
+        default=None,
+        help="Upper bound for --adaptive-rpm",
+    )
+    batch.add_argument(
+        "--rate-store",
+        default=os.getenv("TRANSLATION_AGENT_RATE_STORE"),
+        help=(
+            "Share the rate budget with other processes, "
+            "e.g. sqlite:///tmp/rate.db"
+        ),
+    )
+    batch.add_argument(
+        "--routes",
+        default=os.getenv("TRANSLATION_AGENT_ROUTES"),
+        help="JSON file of backends to route calls over, with failover",
+    )
+    batch.add_argument(
+        "--resource-cache",
+        default=None,
+        help=(
+            "SQLite file of string and comment translations to reuse "
+            "between runs"
+        ),
+    )
+    batch.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=None,
+        help="Items submitted at once (default: 2 per worker)",
+    )
+    batch.set_defaults(func=batch_command)
+
+    stream = subparsers.add_parser(
+        "stream", help="Translate one large text file a chunk at a time"
+    )
+    stream.add_argument("input", help="A UTF-8 text file")
+    stream.add_argument(
+        "-o", "--output", default="-", help="File to write the translation to"
+    )
+    stream.add_argument("--source-lang", default="English")
+    stream.add_argument("--target-lang", required=True)
+    stream.add_argument("--country", default="")
+    stream.add_argument("--tone", type=int, default=3, choices=range(1, 6))
+    stream.add_argument(
+        "--max-tokens", type=int, default=utils.MAX_TOKENS_PER_CHUNK
+    )
+    stream.add_argument(
+        "--context-chunks",
+        type=int,
+        default=1,
+        help="Chunks of context on each side of the chunk being translated",
+    )
+    stream.add_argument(
+        "--rpm", type=float, default=None, help="Requests per minute"
+    )
+    stream.add_argument(
+        "--rate-store",
+        default=os.getenv("TRANSLATION_AGENT_RATE_STORE"),
+        help=(
+            "Share the rate budget with other processes, "
+            "e.g. sqlite:///tmp/rate.db"
+        ),
+    )
+    stream.add_argument(
+        "--routes",
+        default=os.getenv("TRANSLATION_AGENT_ROUTES"),
+        help="JSON file of backends to route calls over, with failover",
+    )
+    stream.set_defaults(func=stream_command)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class CallRecord:
+    """Telemetry for one get_completion call."""
+
+    stage: Optional[str]
+    chunk: Optional[int]
+    model: str
+    wall_seconds: float = 0.0
+    queue_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    cache_hit: bool = False
+    error: Optional[str] = None
+    lane: Optional[str] = None
+
+
+@dataclass
+class TranslationResult:
+    """A translation together with the calls that produced it."""
+
+    translation: str = ""
+    calls: List[CallRecord] = field(default_factory=list)
+    wall_seconds: float = 0.0
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(call.prompt_tokens for call in self.calls)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(call.completion_tokens for call in self.calls)
+
+    def by_stage(self) -> Dict[str, Dict[str, float]]:
+        """
+        Aggregate the calls per pipeline stage.
+
+        Returns:
+            Dict[str, Dict[str, float]]: For each stage, the number of calls, their
+                summed wall and queue time, tokens, retries and cache hits.
+        """
+        stages: Dict[str, Dict[str, float]] = {}
+        for call in self.calls:
+            totals = stages.setdefault(
+                call.stage or "other",
+                dict.fromkeys(
+                    (
+                        "calls",
+                        "wall_seconds",
+                        "queue_seconds",
+                        "prompt_tokens",
+                        "completion_tokens",
+                        "retries",
+                        "cache_hits",
+                        "errors",
+                    ),
+                    0,
+                ),
+            )
+            totals["calls"] += 1
+            totals["wall_seconds"] += call.wall_seconds
+            totals["queue_seconds"] += call.queue_seconds
+            totals["prompt_tokens"] += call.prompt_tokens
+            totals["completion_tokens"] += call.completion_tokens
+            totals["retries"] += call.retries
+            totals["cache_hits"] += call.cache_hit
+            totals["errors"] += call.error is not None
+        return stages
+
+
+class Hook:
+    """
+    Receive telemetry as translations run, e.g. to forward it to a metrics system.
+
+    Subclass it, override the methods you need and register it with add_hook.
+    Hooks are called synchronously on the calling thread and must be fast.
+    """
+
+    def on_call(self, record: CallRecord) -> None:
+        pass
+
+    def on_translation(self, result: TranslationResult) -> None:
+        pass
+
+
+hooks: List[Hook] = []
+
+_current_stage: ContextVar[Tuple[Optional[str], Optional[int]]] = ContextVar(
+    "translation_agent_stage", default=(None, None)
+)
+_current_result: ContextVar[Optional[TranslationResult]] = ContextVar(
+    "translation_agent_result", default=None
+)
+
+
+def add_hook(hook: Hook) -> None:
+    hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    hooks.remove(hook)
+
+
+def current_stage() -> Tuple[Optional[str], Optional[int]]:
+    """Return the (stage, chunk index) that get_completion is being called for."""
+    return _current_stage.get()
+
+
+@contextmanager
+def stage(name: str, chunk: Optional[int] = None) -> Iterator[None]:
+    """Attribute the get_completion calls made inside the block to a stage and chunk."""
+    token = _current_stage.set((name, chunk))
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+def record_call(record: CallRecord) -> None:
+    """Add a call to the translation being collected, if any, and notify hooks."""
+    result = _current_result.get()
+    if result is not None:
+        result.calls.append(record)
+    for hook in hooks:
+        hook.on_call(record)
+
+
+@contextmanager
+def collect() -> Iterator[TranslationResult]:
+    """
+    Collect every call made inside the block into a TranslationResult.
+
+    The caller sets result.translation; hooks receive the result when the block exits.
+    """
+    result = TranslationResult()
+    token = _current_result.set(result)
+    started = time.monotonic()
+    try:
+        yield result
+    finally:
+        _current_result.reset(token)
+        result.wall_seconds = time.monotonic() - started
+    for hook in hooks:
+        hook.on_translation(result)
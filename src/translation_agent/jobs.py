@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import sqlite3
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from icecream import ic
+
+from . import utils
+
+
+JOB_DB_PATH = os.getenv("TRANSLATION_AGENT_JOB_DB", "translation_jobs.db")
+
+STAGES = ("initial", "reflection", "improved")
+
+
+def chunk_fingerprint(
+    source_lang: str,
+    target_lang: str,
+    tone: int,
+    country: str,
+    chunk_index: int,
+    chunk: str,
+) -> str:
+    """
+    Fingerprint a chunk with every setting its stage outputs depend on.
+
+    Returns:
+        str: A hex digest that changes whenever the chunk or its settings
+            change.
+    """
+    payload = json.dumps(
+        [source_lang, target_lang, tone, country, chunk_index, chunk],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    """
+    Persist the stage outputs of translation jobs in a SQLite database.
+
+    Each (job, chunk fingerprint, stage) cell is written as soon as it
+    completes, so a job that dies halfway can be resumed without repeating
+    finished calls.
+    """
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS cells (
+                    job_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    output TEXT NOT NULL,
+                    PRIMARY KEY (job_id, fingerprint, stage)
+                )"""
+            )
+
+    def load(self, job_id: str) -> Dict[Tuple[str, str], str]:
+        """
+        Load every completed cell of a job.
+
+        Returns:
+            Dict[Tuple[str, str], str]: Stage outputs keyed by
+                (fingerprint, stage).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fingerprint, stage, output FROM cells "
+                "WHERE job_id = ?",
+                (job_id,),
+            ).fetchall()
+        return {
+            (fingerprint, stage): output for fingerprint, stage, output in rows
+        }
+
+    def put(
+        self,
+        job_id: str,
+        fingerprint: str,
+        stage: str,
+        chunk_index: int,
+        output: str,
+    ) -> None:
+        """Store the output of one (chunk, stage) cell and commit it."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?)",
+                (job_id, fingerprint, stage, chunk_index, output),
+            )
+
+    def delete(self, job_id: str) -> None:
+        """Remove every cell of a job."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cells WHERE job_id = ?", (job_id,))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def resumable_translation(
+    store: JobStore,
+    job_id: str,
+    source_lang: str,
+    target_lang: str,
+    source_text_chunks: List[str],
+    tone: int,
+    country: str = "",
+) -> List[str]:
+    """
+    Run the translate, reflect and improve stages, skipping stored cells.
+
+    A single chunk is translated with the one_chunk prompts, several chunks
+    with the multichunk prompts. Every completed cell is persisted before the
+    next one starts.
+
+    Args:
+        store (JobStore): Where stage outputs are read from and written to.
+        job_id (str): The job to resume or start.
+        source_lang (str): The source language of the text.
+        target_lang (str): The target language for translation.
+        source_text_chunks (List[str]): The source text divided into chunks.
+        tone (int): Formality level (1-5).
+        country (str): Country specified for the target language.
+
+    Returns:
+        List[str]: The improved translation of each chunk.
+    """
+
+    fingerprints = [
+        chunk_fingerprint(source_lang, target_lang, tone, country, i, chunk)
+        for i, chunk in enumerate(source_text_chunks)
+    ]
+    cells = store.load(job_id)
+    outputs: Dict[str, List[Optional[str]]] = {
+        stage: [
+            cells.get((fingerprint, stage)) for fingerprint in fingerprints
+        ]
+        for stage in STAGES
+    }
+    single = len(source_text_chunks) == 1
+
+    def run_cell(stage: str, i: int) -> str:
+        if single:
+            source_text = source_text_chunks[0]
+            if stage == "initial":
+                return utils.one_chunk_initial_translation(
+                    source_lang, target_lang, source_text, tone
+                )
+            if stage == "reflection":
+                return utils.one_chunk_reflect_on_translation(
+                    source_lang,
+                    target_lang,
+                    source_text,
+                    outputs["initial"][0],
+                    tone,
+                    country,
+                )
+            return utils.one_chunk_improve_translation(
+                source_lang,
+                target_lang,
+                source_text,
+                outputs["initial"][0],
+                outputs["reflection"][0],
+                tone,
+            )
+
+        if stage == "initial":
+            return utils.multichunk_initial_translation(
+                source_lang,
+                target_lang,
+                source_text_chunks,
+                tone,
+                chunk_indices=[i],
+            )[0]
+        if stage == "reflection":
+            return utils.multichunk_reflect_on_translation(
+                source_lang,
+                target_lang,
+                source_text_chunks,
+                outputs["initial"],
+                tone,
+                country,
+                chunk_indices=[i],
+            )[0]
+        return utils.multichunk_improve_translation(
+            source_lang,
+            target_lang,
+            source_text_chunks,
+            outputs["initial"],
+            outputs["reflection"],
+            tone,
+            chunk_indices=[i],
+        )[0]
+
+    for stage in STAGES:
+        missing = [
+            i for i, output in enumerate(outputs[stage]) if output is None
+        ]
+        if missing:
+            ic(f"Job {job_id}: running {len(missing)} {stage} cell(s)")
+        for i in missing:
+            output = run_cell(stage, i)
+            store.put(job_id, fingerprints[i], stage, i, output)
+            outputs[stage][i] = output
+
+    return outputs["improved"]
@@ -0,0 +1,117 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Condition
+from typing import Deque, Dict, Iterator, Optional
+
+from . import cancellation
+
+
+# Share of the rate budget each lane gets while all of them are busy
+LANE_WEIGHTS = {"interactive": 8, "batch": 2, "background": 1}
+DEFAULT_LANE = "batch"
+
+_current_lane: ContextVar[str] = ContextVar(
+    "translation_agent_lane", default=DEFAULT_LANE
+)
+
+
+def current_lane() -> str:
+    """Return the lane that get_completion calls made here are scheduled in."""
+    return _current_lane.get()
+
+
+@contextmanager
+def lane(name: str) -> Iterator[None]:
+    """
+    Schedule the get_completion calls made inside the block in a lane.
+
+    Works as a decorator too, e.g. on an app's request handler:
+
+        @lanes.lane("interactive")
+        def translator(...): ...
+    """
+    if name not in LANE_WEIGHTS:
+        raise ValueError(f"Unknown lane: {name}")
+    token = _current_lane.set(name)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+class LaneScheduler:
+    """
+    Hand out turns at the rate limiter fairly between lanes, by weight.
+
+    Callers queue for a turn in their lane; whoever holds the turn takes the
+    next rate limiter slot. When several lanes are waiting, each gets slots in
+    proportion to its weight, and a lane with nothing queued takes nothing.
+    Since every call queues afresh, a long document gives way to interactive
+    calls at its next chunk boundary instead of holding the budget until done.
+    A turn lasts until the caller's slot is due, since handing out turns
+    faster than slots would let every lane reserve at its plain share.
+
+    Lanes only order the threads of one process. Worker processes, such as
+    the batch command's, each have their own scheduler, and a shared
+    RateStore splits the budget between processes without regard to lanes.
+
+    Args:
+        weights (Optional[Dict[str, float]]): Weight per lane. Defaults to
+            LANE_WEIGHTS.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.weights = dict(weights or LANE_WEIGHTS)
+        self._cond = Condition()
+        self._queues: Dict[str, Deque[object]] = {
+            name: deque() for name in self.weights
+        }
+        # Stride scheduling: the lane with the lowest pass goes next, and
+        # each turn advances its lane's pass by 1 / weight
+        self._pass = dict.fromkeys(self.weights, 0.0)
+        self._virtual_time = 0.0
+        self._busy = False
+
+    def _next_lane(self) -> Optional[str]:
+        waiting = [name for name, queue in self._queues.items() if queue]
+        return min(waiting, key=self._pass.get) if waiting else None
+
+    @contextmanager
+    def turn(self, name: str) -> Iterator[None]:
+        """Wait for this caller's turn in lane name, and hold it in the block."""
+        ticket = object()
+        with self._cond:
+            queue = self._queues[name]
+            if not queue:
+                # A lane that was idle does not bank turns for later
+                self._pass[name] = max(self._pass[name], self._virtual_time)
+            queue.append(ticket)
+            try:
+                while (
+                    self._busy
+                    or self._next_lane() != name
+                    or queue[0] is not ticket
+                ):
+                    # Poll so that a cancelled job leaves the queue
+                    self._cond.wait(cancellation.POLL_INTERVAL)
+                    cancellation.checkpoint()
+            except BaseException:
+                queue.remove(ticket)
+                self._cond.notify_all()
+                raise
+            queue.popleft()
+            self._virtual_time = self._pass[name]
+            self._pass[name] += 1 / self.weights[name]
+            self._busy = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def waiting(self) -> Dict[str, int]:
+        """Return how many callers are queued in each lane."""
+        with self._cond:
+            return {name: len(queue) for name, queue in self._queues.items()}
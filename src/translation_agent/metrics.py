@@ -0,0 +1,365 @@
+import json
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .instrumentation import CallRecord, Hook, add_hook, remove_hook
+
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+MAX_FINISHED_SPANS = 1000
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    # Label values escape backslashes, quotes and newlines in the text format
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: LabelValues, extra: str = "") -> str:
+        pairs = [
+            f'{label}="{_escape(value)}"'
+            for label, value in zip(self.labels, key)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{self._format_labels(key)} {value}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def count(self, **labels: str) -> int:
+        return self._values.get(self._key(labels), ([], 0.0, 0))[2]
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [
+                (key, (list(c), t, n))
+                for key, (c, t, n) in self._values.items()
+            ]
+        lines = []
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = self._format_labels(key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            inf_labels = self._format_labels(key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {count}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+            lines.append(
+                f"{self.name}_count{self._format_labels(key)} {count}"
+            )
+        return lines
+
+
+class Registry:
+    """A set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return (
+            "\n".join(metric.render() for metric in self._metrics.values())
+            + "\n"
+        )
+
+
+registry = Registry()
+
+REQUESTS = registry.register(
+    Counter(
+        "translation_requests_total",
+        "Translation requests by entry point and status",
+        ["entry", "status"],
+    )
+)
+REQUEST_SECONDS = registry.register(
+    Histogram(
+        "translation_request_seconds",
+        "End-to-end translation latency",
+        ["entry"],
+    )
+)
+IN_FLIGHT = registry.register(
+    Gauge(
+        "translation_in_flight",
+        "Translation requests currently running",
+        ["entry"],
+    )
+)
+STAGE_SECONDS = registry.register(
+    Histogram(
+        "translation_stage_seconds", "Latency of pipeline stages", ["stage"]
+    )
+)
+LLM_CALLS = registry.register(
+    Counter(
+        "llm_calls_total",
+        "get_completion calls by stage, model and status",
+        ["stage", "model", "status"],
+    )
+)
+LLM_CALL_SECONDS = registry.register(
+    Histogram(
+        "llm_call_seconds",
+        "Provider latency of get_completion calls",
+        ["stage"],
+    )
+)
+RATE_LIMIT_WAIT_SECONDS = registry.register(
+    Histogram(
+        "rate_limit_wait_seconds",
+        "Time get_completion calls spent waiting for the rate limiter",
+        ["stage", "lane"],
+        buckets=(0, 0.1, 0.5, 1, 2, 5, 10, 30, 60),
+    )
+)
+LLM_TOKENS = registry.register(
+    Counter(
+        "llm_tokens_total",
+        "Tokens reported in provider usage",
+        ["stage", "kind"],
+    )
+)
+
+
+class MetricsHook(Hook):
+    """Feed get_completion telemetry into the metrics registry."""
+
+    def on_call(self, record: CallRecord) -> None:
+        stage = record.stage or "other"
+        status = "error" if record.error else "ok"
+        LLM_CALLS.inc(stage=stage, model=record.model, status=status)
+        LLM_CALL_SECONDS.observe(record.wall_seconds, stage=stage)
+        RATE_LIMIT_WAIT_SECONDS.observe(
+            record.queue_seconds, stage=stage, lane=record.lane or ""
+        )
+        LLM_TOKENS.inc(record.prompt_tokens, stage=stage, kind="prompt")
+        LLM_TOKENS.inc(
+            record.completion_tokens, stage=stage, kind="completion"
+        )
+
+
+# Tracing
+
+_current_span: ContextVar[Optional[Dict]] = ContextVar(
+    "translation_agent_span", default=None
+)
+finished_spans: Deque[Dict] = deque(maxlen=MAX_FINISHED_SPANS)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Dict]:
+    """
+    Trace the block as a span, nested under the span open in this context.
+
+    Finished spans are kept in memory (the most recent MAX_FINISHED_SPANS) and
+    served as JSON on /traces.
+    """
+    parent = _current_span.get()
+    if parent:
+        trace_id = parent["trace_id"]
+    else:
+        trace_id = f"{random.getrandbits(64):016x}"
+    current = {
+        "name": name,
+        "trace_id": trace_id,
+        "span_id": f"{random.getrandbits(32):08x}",
+        "parent_id": parent["span_id"] if parent else None,
+        "attributes": attributes,
+        "start": time.time(),
+    }
+    token = _current_span.set(current)
+    started = time.monotonic()
+    try:
+        yield current
+    except BaseException as e:
+        current["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current["duration"] = time.monotonic() - started
+        finished_spans.append(current)
+
+
+@contextmanager
+def track_request(entry: str) -> Iterator[None]:
+    """Count, time and trace one translation request from an app entry."""
+    IN_FLIGHT.inc(entry=entry)
+    started = time.monotonic()
+    status = "error"
+    try:
+        with span(entry):
+            yield
+        status = "ok"
+    finally:
+        IN_FLIGHT.dec(entry=entry)
+        REQUESTS.inc(entry=entry, status=status)
+        REQUEST_SECONDS.observe(time.monotonic() - started, entry=entry)
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """Time and trace one pipeline stage."""
+    started = time.monotonic()
+    try:
+        with span("stage", stage=stage):
+            yield
+    finally:
+        STAGE_SECONDS.observe(time.monotonic() - started, stage=stage)
+
+
+# HTTP endpoint
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):  # noqa: N802
+        if self.path == "/metrics":
+            body = registry.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/traces":
+            body = json.dumps(list(finished_spans)).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_hook: Optional[MetricsHook] = None
+_server_lock = Lock()
+
+
+def start_http_server(
+    port: int, host: str = "127.0.0.1"
+) -> ThreadingHTTPServer:
+    """
+    Serve /metrics (Prometheus text format) and /traces (JSON) from a daemon
+    thread.
+
+    Calling it again returns the server that is already running, and registers
+    the MetricsHook only once. Pass port 0 to bind a free port, e.g. in tests.
+    """
+    global _server, _server_hook
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+            Thread(target=_server.serve_forever, daemon=True).start()
+            _server_hook = MetricsHook()
+            add_hook(_server_hook)
+        return _server
+
+
+def stop_http_server() -> None:
+    """Stop the server start_http_server started and unregister its hook."""
+    global _server, _server_hook
+    with _server_lock:
+        server, _server = _server, None
+        hook, _server_hook = _server_hook, None
+    if hook is not None:
+        remove_hook(hook)
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+def start_from_env() -> Optional[ThreadingHTTPServer]:
+    """Start the metrics endpoint if METRICS_PORT is set."""
+    port = os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    return start_http_server(int(port), os.getenv("METRICS_HOST", "127.0.0.1"))
@@ -0,0 +1,137 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from icecream import ic
+
+from . import utils
+
+
+Target = Union[str, Tuple[str, str]]
+
+
+@dataclass
+class SourceAnalysis:
+    """The source-side work shared by every target language."""
+
+    source_text: str
+    num_tokens: int
+    chunks: List[str]
+
+    @property
+    def single_chunk(self) -> bool:
+        return len(self.chunks) == 1
+
+
+def analyze_source(
+    source_text: str, max_tokens: int = utils.MAX_TOKENS_PER_CHUNK
+) -> SourceAnalysis:
+    """
+    Count tokens and split the source text once, the same way translate() does.
+
+    Args:
+        source_text (str): The text to translate.
+        max_tokens (int): The maximum number of tokens per chunk.
+
+    Returns:
+        SourceAnalysis: The token count and chunk boundaries of the text.
+    """
+    num_tokens = utils.num_tokens_in_string(source_text)
+    chunks = utils.split_source_text(source_text, num_tokens, max_tokens)
+    return SourceAnalysis(source_text, num_tokens, chunks)
+
+
+def translate_analyzed(
+    analysis: SourceAnalysis,
+    source_lang: str,
+    target_lang: str,
+    tone: int,
+    country: str = "",
+    batch_max_tokens: Optional[int] = None,
+) -> str:
+    """Run the translation pipeline for one target on an analyzed source."""
+
+    if analysis.single_chunk:
+        return utils.one_chunk_translate_text(
+            source_lang, target_lang, analysis.source_text, tone, country
+        )
+
+    if batch_max_tokens:
+        from .batching import batched_translation
+
+        translation_2_chunks = batched_translation(
+            source_lang,
+            target_lang,
+            analysis.chunks,
+            tone,
+            country,
+            max_batch_tokens=batch_max_tokens,
+        )
+    else:
+        translation_2_chunks = utils.multichunk_translation(
+            source_lang, target_lang, analysis.chunks, tone, country
+        )
+    return "".join(translation_2_chunks)
+
+
+def translate_multi(
+    source_lang: str,
+    source_text: str,
+    targets: Sequence[Target],
+    tone: int = 3,
+    max_tokens: int = utils.MAX_TOKENS_PER_CHUNK,
+    max_workers: Optional[int] = None,
+    batch_max_tokens: Optional[int] = None,
+) -> Dict[Target, str]:
+    """
+    Translate one source text into several target languages.
+
+    The source is tokenized and split once, then the per-target pipelines run
+    concurrently. They share the process-wide rate limit set with
+    utils.set_rate_limit, so the whole fan-out stays within one budget.
+
+    Args:
+        source_lang (str): The source language of the text.
+        source_text (str): The text to translate.
+        targets (Sequence[Target]): Target languages, either as names or as
+            (target_lang, country) pairs. Duplicates are translated once.
+        tone (int): Formality level (1-5).
+        max_tokens (int): The maximum number of tokens per chunk.
+        max_workers (Optional[int]): How many targets to translate at once.
+            Defaults to one thread per target.
+        batch_max_tokens (Optional[int]): If set, pack chunks into json_mode
+            requests of up to this many tokens, as in translate().
+
+    Returns:
+        Dict[Target, str]: The final translation for each target, keyed as
+            given.
+    """
+
+    analysis = analyze_source(source_text, max_tokens)
+    ic(analysis.num_tokens, len(analysis.chunks))
+
+    unique_targets = list(dict.fromkeys(targets))
+    if not unique_targets:
+        return {}
+
+    def run(target: Target) -> str:
+        target_lang, country = (
+            (target, "") if isinstance(target, str) else target
+        )
+        return translate_analyzed(
+            analysis, source_lang, target_lang, tone, country, batch_max_tokens
+        )
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers or len(unique_targets)
+    ) as executor:
+        # Run each target in a copy of the caller's context so that stage
+        # attribution and result collection follow the work into the threads
+        futures = [
+            executor.submit(contextvars.copy_context().run, run, target)
+            for target in unique_targets
+        ]
+        translations = [future.result() for future in futures]
+
+    return dict(zip(unique_targets, translations))
@@ -0,0 +1,190 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from . import utils
+
+
+# Tokens in each stage's instructions and system message, without the text
+PROMPT_OVERHEAD_TOKENS = {"initial": 150, "reflection": 330, "improved": 330}
+# Rough length of a reflection's list of suggestions
+REFLECTION_TOKENS = 250
+# Translations come back roughly as long as their source
+OUTPUT_TOKEN_RATIO = 1.2
+# Time to first token and generation speed of a typical hosted model
+LATENCY_SECONDS = 1.5
+OUTPUT_TOKENS_PER_SECOND = 60.0
+
+STAGES = ("initial", "reflection", "improved")
+
+
+@dataclass
+class StagePlan:
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    seconds: float = 0.0
+
+    def add_call(self, input_tokens: float, output_tokens: float) -> None:
+        self.calls += 1
+        self.input_tokens += round(input_tokens)
+        self.output_tokens += round(output_tokens)
+        self.seconds += (
+            LATENCY_SECONDS + output_tokens / OUTPUT_TOKENS_PER_SECOND
+        )
+
+
+@dataclass
+class TranslationPlan:
+    """The calls, tokens and wall time a translate() run should take."""
+
+    num_tokens: int
+    chunks: int
+    stages: Dict[str, StagePlan] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    @property
+    def calls(self) -> int:
+        return sum(stage.calls for stage in self.stages.values())
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(stage.input_tokens for stage in self.stages.values())
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(stage.output_tokens for stage in self.stages.values())
+
+    def summary(self) -> str:
+        return (
+            f"{self.chunks} chunk(s), {self.calls} call(s), "
+            f"~{self.input_tokens} input / "
+            f"~{self.output_tokens} output tokens, ~{self.seconds:.0f}s"
+        )
+
+
+def _batched_stage(
+    stage: StagePlan,
+    overhead: int,
+    context_tokens: int,
+    item_tokens: List[float],
+    output_tokens: List[float],
+    max_batch_tokens: int,
+) -> None:
+    # Mirror batching.pack_batches on token counts instead of strings
+    batch: List[int] = []
+    batch_tokens = 0.0
+    items: List[Optional[float]] = [*item_tokens, None]
+    for i, tokens in enumerate(items):
+        if batch and (
+            tokens is None or batch_tokens + tokens > max_batch_tokens
+        ):
+            stage.add_call(
+                overhead + context_tokens + batch_tokens,
+                sum(output_tokens[j] for j in batch),
+            )
+            batch, batch_tokens = [], 0.0
+        if tokens is not None:
+            batch.append(i)
+            batch_tokens += tokens
+
+
+def plan(
+    source_text: str,
+    max_tokens: int = utils.MAX_TOKENS_PER_CHUNK,
+    batch_max_tokens: Optional[int] = None,
+    rpm: Optional[float] = None,
+    concurrency: int = 1,
+) -> TranslationPlan:
+    """
+    Estimate the cost and duration of translating source_text, without
+    calling the LLM.
+
+    The text is split exactly as translate() splits it, so the chunk count is
+    exact, and so are the call counts without batch_max_tokens. With it,
+    improve batches are packed by estimated output and reflection lengths, so
+    the improve call count is an estimate too. Token counts include the full
+    text that the multichunk prompts repeat as context for every chunk; output
+    lengths are estimates.
+
+    Args:
+        source_text (str): The text to translate.
+        max_tokens (int): The maximum number of tokens per chunk.
+        batch_max_tokens (Optional[int]): The batch budget passed to
+            translate(), if any.
+        rpm (Optional[float]): Requests per minute. Defaults to the limit set
+            with utils.set_rate_limit, or no limit.
+        concurrency (int): How many such documents run side by side and share
+            the rate limit, as in the batch command.
+
+    Returns:
+        TranslationPlan: Calls and tokens per stage, and the estimated wall
+            time.
+    """
+
+    num_tokens = utils.num_tokens_in_string(source_text)
+    chunks = utils.split_source_text(source_text, num_tokens, max_tokens)
+    result = TranslationPlan(num_tokens, len(chunks))
+    stages = result.stages = {stage: StagePlan() for stage in STAGES}
+
+    if len(chunks) == 1:
+        chunk_tokens = [num_tokens]
+        context_tokens = 0
+    else:
+        chunk_tokens = [utils.num_tokens_in_string(chunk) for chunk in chunks]
+        context_tokens = num_tokens
+    translated = [tokens * OUTPUT_TOKEN_RATIO for tokens in chunk_tokens]
+
+    if batch_max_tokens and len(chunks) > 1:
+        _batched_stage(
+            stages["initial"],
+            PROMPT_OVERHEAD_TOKENS["initial"],
+            context_tokens,
+            chunk_tokens,
+            translated,
+            batch_max_tokens,
+        )
+    else:
+        for tokens, output in zip(chunk_tokens, translated):
+            stages["initial"].add_call(
+                PROMPT_OVERHEAD_TOKENS["initial"] + context_tokens + tokens,
+                output,
+            )
+
+    for tokens, output in zip(chunk_tokens, translated):
+        stages["reflection"].add_call(
+            PROMPT_OVERHEAD_TOKENS["reflection"]
+            + context_tokens
+            + tokens
+            + output,
+            REFLECTION_TOKENS,
+        )
+
+    improve_inputs = [
+        tokens + output + REFLECTION_TOKENS
+        for tokens, output in zip(chunk_tokens, translated)
+    ]
+    if batch_max_tokens and len(chunks) > 1:
+        _batched_stage(
+            stages["improved"],
+            PROMPT_OVERHEAD_TOKENS["improved"],
+            context_tokens,
+            improve_inputs,
+            translated,
+            batch_max_tokens,
+        )
+    else:
+        for tokens, output in zip(improve_inputs, translated):
+            stages["improved"].add_call(
+                PROMPT_OVERHEAD_TOKENS["improved"] + context_tokens + tokens,
+                output,
+            )
+
+    # Calls within a document run one after another; the rate limit is shared
+    # by every document running concurrently.
+    if rpm is None and utils.rate_limiter is not None:
+        rpm = utils.rate_limiter.rpm
+    latency_bound = sum(stage.seconds for stage in stages.values())
+    rate_bound = result.calls * concurrency * 60.0 / rpm if rpm else 0.0
+    result.seconds = max(latency_bound, rate_bound)
+
+    return result
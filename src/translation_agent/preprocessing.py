@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Callable, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+# Processes for CPU-bound preprocessing; 0 runs it in the calling thread
+PREPROCESS_WORKERS = int(
+    os.getenv("TRANSLATION_AGENT_PREPROCESS_WORKERS", "0")
+)
+
+# Inputs smaller than this (in characters) are processed in the calling
+# thread, where they take less time than pickling them to a worker
+MIN_OFFLOAD_SIZE = 20_000
+
+_pool: Optional[ProcessPoolExecutor] = None
+_workers = PREPROCESS_WORKERS
+_lock = Lock()
+
+
+def set_workers(workers: Optional[int]) -> None:
+    """
+    Set the number of processes that run CPU-bound preprocessing, such as
+    counting tokens, splitting text and parsing documents.
+
+    A request thread that hands a step to the pool waits without holding the
+    GIL, so the other threads keep sending and receiving provider calls.
+
+    Args:
+        workers (Optional[int]): Worker processes, or None or 0 to run every
+            step in the calling thread.
+    """
+    global _pool, _workers
+    with _lock:
+        pool, _pool = _pool, None
+        _workers = workers or 0
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    with _lock:
+        if _pool is None and _workers:
+            _pool = ProcessPoolExecutor(max_workers=_workers)
+        return _pool
+
+
+def offloads(size: int) -> bool:
+    """Whether run() sends an input of this size to a worker process."""
+    return size >= MIN_OFFLOAD_SIZE and _get_pool() is not None
+
+
+def run(fn: Callable[..., T], *args, size: int = MIN_OFFLOAD_SIZE) -> T:
+    """
+    Run fn(*args) in the preprocessing pool, or inline if there is no pool or
+    the input is small.
+
+    fn and its arguments are pickled to the worker and the result back, so fn
+    must be a module-level function and should return something smaller than
+    its input where it can, such as a count or the spans to change.
+
+    Args:
+        fn (Callable[..., T]): The step to run.
+        size (int): The size of the input, e.g. len(text), compared with
+            MIN_OFFLOAD_SIZE. Defaults to offloading.
+
+    Returns:
+        T: What fn returned.
+    """
+    pool = _get_pool() if size >= MIN_OFFLOAD_SIZE else None
+    if pool is None:
+        return fn(*args)
+    return pool.submit(fn, *args).result()
@@ -0,0 +1,342 @@
+import os
+import re
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Dict, Mapping, Optional
+
+from . import cancellation
+
+
+class RateStore(ABC):
+    """
+    Where rate limiters keep their schedules: when each budget is next free.
+
+    Limiters sharing a store (and a key) share one budget. Implement these
+    three methods against a networked store, e.g. Redis with a Lua script, to
+    share a budget between hosts.
+    """
+
+    @abstractmethod
+    def reserve(self, key: str, interval: float) -> float:
+        """
+        Atomically take the next free slot of key and push it back by interval.
+
+        Returns:
+            float: Seconds until the reserved slot.
+        """
+
+    @abstractmethod
+    def delay(self, key: str) -> float:
+        """Return the seconds until key's next free slot, without reserving."""
+
+    @abstractmethod
+    def defer(self, key: str, seconds: float) -> None:
+        """Make key's next free slot at least seconds from now."""
+
+
+class LocalRateStore(RateStore):
+    """A budget shared by the threads of one process."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._next_slot: Dict[str, float] = {}
+
+    def reserve(self, key: str, interval: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(key, 0.0))
+            self._next_slot[key] = slot + interval
+        return slot - now
+
+    def delay(self, key: str) -> float:
+        with self._lock:
+            return max(0.0, self._next_slot.get(key, 0.0) - time.monotonic())
+
+    def defer(self, key: str, seconds: float) -> None:
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._next_slot[key] = max(self._next_slot.get(key, 0.0), until)
+
+
+class SQLiteRateStore(RateStore):
+    """
+    A budget shared by every process on a host through a SQLite file.
+
+    Reservations run in an immediate transaction, so they are serialized
+    across processes, and use the wall clock, which all processes share.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # A forked worker must not reuse its parent's connection
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.path,
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            self._pid = os.getpid()
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS rate_slots (
+                    key TEXT PRIMARY KEY,
+                    next_slot REAL NOT NULL
+                )"""
+            )
+        return self._conn
+
+    def _update(self, key: str, interval: float, floor: float) -> float:
+        # Returns the seconds until the slot before the update
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT next_slot FROM rate_slots WHERE key = ?", (key,)
+                ).fetchone()
+                now = time.time()
+                slot = max(now, row[0] if row else 0.0)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_slots VALUES (?, ?)",
+                    (key, max(slot + interval, now + floor)),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return slot - now
+
+    def reserve(self, key: str, interval: float) -> float:
+        return self._update(key, interval, 0.0)
+
+    def delay(self, key: str) -> float:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT next_slot FROM rate_slots WHERE key = ?", (key,)
+            ).fetchone()
+        return max(0.0, row[0] - time.time()) if row else 0.0
+
+    def defer(self, key: str, seconds: float) -> None:
+        self._update(key, 0.0, seconds)
+
+
+class RateLimiter:
+    """
+    Space out requests so that no more than rpm of them start per minute.
+
+    The limiter is thread-safe: concurrent callers are serialized on the
+    reservation, not on the request itself, so requests still overlap.
+    Limiters given the same shared store and key split one budget, each
+    taking whatever slots are free.
+
+    Args:
+        rpm (float): Requests per minute.
+        store (Optional[RateStore]): Where the schedule is kept. Defaults to
+            a store private to this limiter.
+        key (str): The budget's name within the store.
+    """
+
+    tpm: Optional[float] = None
+
+    def __init__(
+        self,
+        rpm: float,
+        store: Optional[RateStore] = None,
+        key: str = "requests",
+    ):
+        if rpm <= 0:
+            raise ValueError("rpm must be positive")
+        self.rpm = rpm
+        self.store = store or LocalRateStore()
+        self.key = key
+        self._lock = Lock()
+
+    def delay(self) -> float:
+        """Return how long a request made now would wait, without reserving."""
+        return self.store.delay(self.key)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Block until the caller may send its next request.
+
+        Args:
+            tokens (int): The estimated tokens of the request. Only limiters
+                with a tokens-per-minute budget use it.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            cancellation.sleep(wait)
+        return wait
+
+    def _reserve(self, tokens: int) -> float:
+        return self.store.reserve(self.key, 60.0 / self.rpm)
+
+    def observe(
+        self, headers: Mapping[str, str], throttled: bool = False
+    ) -> None:
+        """
+        Learn from a provider response. A fixed limiter ignores it.
+
+        Args:
+            headers (Mapping[str, str]): The response's rate limit headers.
+            throttled (bool): Whether the provider pushed back with a 429.
+        """
+
+
+def store_from_url(url: Optional[str]) -> Optional[RateStore]:
+    """
+    Open the store named by a URL such as "sqlite:///tmp/rate.db".
+
+    Returns None for an empty URL, meaning a per-process budget.
+    """
+    if not url:
+        return None
+    scheme, _, path = url.partition("://")
+    if scheme == "sqlite":
+        return SQLiteRateStore(path)
+    raise ValueError(f"Unsupported rate limit store: {url}")
+
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a reset header such as "1s", "6m0s", "20ms" or "1.5" into seconds.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    A rate limiter that tunes its budget from the provider's feedback (AIMD).
+
+    Every unthrottled response raises the requests-per-minute budget by
+    increase, and every 429 multiplies it by decrease. The budget stays within
+    [min_rpm, max_rpm] and never exceeds the limit the provider reports in
+    x-ratelimit-limit-requests. When a response reports that no requests (or
+    tokens) remain, new requests wait for the reported reset. With a tpm
+    budget, requests are also spaced by their estimated tokens, and the token
+    budget moves by the same proportions.
+
+    Args:
+        rpm (float): The starting requests per minute.
+        tpm (Optional[float]): The starting tokens per minute, if limited.
+        min_rpm (float): The lowest budget a 429 storm can push it to.
+        max_rpm (Optional[float]): The highest budget; None trusts the
+            provider's reported limit.
+        increase (float): Requests per minute added per success.
+        decrease (float): The factor applied on a 429.
+        store (Optional[RateStore]): Where the schedule is kept.
+        key (str): The budget's name within the store.
+    """
+
+    def __init__(
+        self,
+        rpm: float,
+        tpm: Optional[float] = None,
+        min_rpm: float = 1.0,
+        max_rpm: Optional[float] = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        store: Optional[RateStore] = None,
+        key: str = "requests",
+    ):
+        super().__init__(rpm, store, key)
+        if tpm is not None and tpm <= 0:
+            raise ValueError("tpm must be positive")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.tpm = tpm
+        self.min_rpm = min_rpm
+        self.max_rpm = max_rpm
+        self.increase = increase
+        self.decrease = decrease
+        self._min_tpm = tpm * min_rpm / rpm if tpm else None
+        self._provider_rpm: Optional[float] = None
+        self._provider_tpm: Optional[float] = None
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            rpm, tpm = self.rpm, self.tpm
+        wait = self.store.reserve(self.key, 60.0 / rpm)
+        if tpm and tokens:
+            token_key = f"{self.key}:tokens"
+            wait = max(
+                wait, self.store.reserve(token_key, tokens * 60.0 / tpm)
+            )
+        return wait
+
+    def _scale(self, factor: float) -> None:
+        ceiling = min(
+            limit
+            for limit in (self.max_rpm, self._provider_rpm, float("inf"))
+            if limit is not None
+        )
+        rpm = min(max(self.rpm * factor, self.min_rpm), ceiling)
+        if self.tpm:
+            tpm = self.tpm * rpm / self.rpm
+            if self._provider_tpm is not None:
+                tpm = min(tpm, self._provider_tpm)
+            self.tpm = max(tpm, self._min_tpm)
+        self.rpm = rpm
+
+    def observe(
+        self, headers: Mapping[str, str], throttled: bool = False
+    ) -> None:
+        headers = {name.lower(): value for name, value in headers.items()}
+        pauses = []
+        with self._lock:
+            limit = _header_float(headers, "x-ratelimit-limit-requests")
+            if limit:
+                self._provider_rpm = limit
+            limit = _header_float(headers, "x-ratelimit-limit-tokens")
+            if limit:
+                self._provider_tpm = limit
+
+            if throttled:
+                self._scale(self.decrease)
+                pauses.append(parse_duration(headers.get("retry-after")))
+            else:
+                self._scale((self.rpm + self.increase) / self.rpm)
+
+            for kind in ("requests", "tokens"):
+                remaining = _header_float(
+                    headers, f"x-ratelimit-remaining-{kind}"
+                )
+                reset = parse_duration(
+                    headers.get(f"x-ratelimit-reset-{kind}")
+                )
+                if remaining is not None and remaining <= 0:
+                    pauses.append(reset)
+        pause = max((p for p in pauses if p), default=0.0)
+        if pause:
+            self.store.defer(self.key, pause)
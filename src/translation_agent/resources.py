@@ -0,0 +1,444 @@
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from icecream import ic
+
+from . import batching, instrumentation, utils
+from .jobs import JobStore, chunk_fingerprint
+from .utils import tone_mapping
+
+
+# Placeholders the model must not touch: {{mustache}}, ICU arguments such as
+# {name} or {n, number}, the head of ICU plural/select messages, printf
+# conversions, markup tags, `code` spans, Markdown link targets and URLs
+_PLACEHOLDER = re.compile(
+    r"`[^`\n]+`"
+    r"|\]\([^()\s]+(?:\s+\"[^\"]*\")?\)"
+    r"|https?://[^\s<>()\[\]`]+"
+    r"|\{\{\s*[\w.]+\s*\}\}"
+    r"|\{\s*\w+\s*(?:,\s*\w+\s*(?:,[^{}]*)?)?\}"
+    r"|\{\s*\w+\s*,\s*(?:plural|selectordinal|select)\s*,(?:\s*offset:\d+)?"
+    r"|%(?:\(\w+\))?[-+#0]*\d*(?:\.\d+)?[sdifeEgGxXoc%]"
+    r"|</?[A-Za-z][^<>]*>"
+)
+_ICU_HEAD = re.compile(r"\{\s*\w+\s*,\s*(?:plural|selectordinal|select)\s*,")
+_ICU_BRANCH = re.compile(r"\s*(?:=\d+|\w+)\s*\{")
+_ICU_END = re.compile(r"\s*\}")
+_TOKEN = re.compile(r"⟦(\d+)⟧")
+
+RESOURCE_JOB_ID = "resources"  # JobStore job under which strings are cached
+UI_STRINGS = "the user interface strings of an application"
+
+
+def _scan(
+    text: str, i: int, pieces: List[Tuple[str, bool]], in_branch: bool
+) -> int:
+    # Split text[i:] into (piece, is_placeholder) pairs, up to the brace that
+    # closes the ICU branch being scanned, and return where it stopped
+    while i < len(text):
+        match = _PLACEHOLDER.match(text, i)
+        if match and _ICU_HEAD.match(match.group(0)):
+            # A plural or select message: its selectors and braces are
+            # structure, and only the text of its branches is translated
+            pieces.append((match.group(0), True))
+            i = match.end()
+            branch = _ICU_BRANCH.match(text, i)
+            while branch:
+                pieces.append((branch.group(0), True))
+                i = _scan(text, branch.end(), pieces, True)
+                if i < len(text):
+                    pieces.append(("}", True))
+                    i += 1
+                branch = _ICU_BRANCH.match(text, i)
+            end = _ICU_END.match(text, i)
+            if end:
+                pieces.append((end.group(0), True))
+                i = end.end()
+        elif match:
+            pieces.append((match.group(0), True))
+            i = match.end()
+        elif in_branch and text[i] == "}":
+            return i
+        else:
+            pieces.append((text[i], in_branch and text[i] == "#"))
+            i += 1
+    return i
+
+
+def protect(text: str) -> Tuple[str, List[str]]:
+    """
+    Replace the placeholders and markup in text with numbered tokens.
+
+    Returns:
+        Tuple[str, List[str]]: The text with ⟦0⟧, ⟦1⟧... in place of its
+            placeholders, and the placeholders in token order.
+
+    Example:
+        >>> protect("Hello {name}, you have %d messages")
+        ('Hello ⟦0⟧, you have ⟦1⟧ messages', ['{name}', '%d'])
+    """
+    pieces: List[Tuple[str, bool]] = []
+    _scan(text, 0, pieces, False)
+    masked: List[str] = []
+    placeholders: List[str] = []
+    previous = False
+    for piece, is_placeholder in pieces:
+        if is_placeholder and previous:
+            # Adjacent placeholders share one token
+            placeholders[-1] += piece
+        elif is_placeholder:
+            placeholders.append(piece)
+            masked.append(f"⟦{len(placeholders) - 1}⟧")
+        else:
+            masked.append(piece)
+        previous = is_placeholder
+    return "".join(masked), placeholders
+
+
+def restore(text: str, placeholders: List[str]) -> Optional[str]:
+    """
+    Put placeholders back in place of their tokens.
+
+    Returns:
+        Optional[str]: The restored text, or None if the tokens in text are not
+            exactly the ones protect() made.
+    """
+    found = sorted(int(i) for i in _TOKEN.findall(text))
+    if found != list(range(len(placeholders))):
+        return None
+    return _TOKEN.sub(lambda match: placeholders[int(match.group(1))], text)
+
+
+def translate_strings(
+    source_lang: str,
+    target_lang: str,
+    strings: List[str],
+    tone: int = 3,
+    country: str = "",
+    max_batch_tokens: int = batching.MAX_TOKENS_PER_BATCH,
+    store: Optional[JobStore] = None,
+    job_id: str = RESOURCE_JOB_ID,
+    kind: str = UI_STRINGS,
+) -> List[str]:
+    """
+    Translate UI strings, many per request, keeping their placeholders.
+
+    Identical strings are translated once. With a store, translations are
+    cached under job_id, and strings translated by an earlier run with the
+    same settings are not sent again. Strings without any text, such as a
+    lone placeholder, are kept as they are, and so is a string whose
+    placeholders could not be kept in its translation.
+
+    Args:
+        source_lang (str): The source language of the strings.
+        target_lang (str): The target language for translation.
+        strings (List[str]): The strings to translate.
+        tone (int): Formality level (1-5).
+        country (str): Country specified for the target language.
+        max_batch_tokens (int): The maximum number of source tokens per request.
+        store (Optional[JobStore]): Where translations are cached between runs.
+        job_id (str): The store job to cache them under.
+        kind (str): What the strings are, for the prompt.
+
+    Returns:
+        List[str]: The translation of each string, aligned with strings.
+    """
+
+    def fingerprint(text: str) -> str:
+        return chunk_fingerprint(
+            source_lang, target_lang, tone, country, 0, text
+        )
+
+    cached = store.load(job_id) if store is not None else {}
+    translations: Dict[str, str] = {}
+    pending: List[str] = []
+    for text in dict.fromkeys(strings):
+        masked, _ = protect(text)
+        if not re.search(r"[^\W\d_]", _TOKEN.sub("", masked)):
+            translations[text] = text
+        elif (fingerprint(text), "initial") in cached:
+            translations[text] = cached[(fingerprint(text), "initial")]
+        else:
+            pending.append(text)
+    ic(
+        f"{len(strings)} strings, {len(translations) + len(pending)} unique, "
+        f"{len(pending)} to translate"
+    )
+
+    protected = [protect(text) for text in pending]
+    masked = [text for text, _ in protected]
+    system_message = f"You are an expert software localizer, specializing in translation from {source_lang} to {target_lang}. {tone_mapping[tone]}"
+    for batch in batching.pack_batches(masked, max_batch_tokens):
+        segments = {str(i): masked[i] for i in batch}
+        prompt = f"""Your task is to translate {kind} from {source_lang} to {target_lang}.
+
+The strings are given below as a JSON object mapping string IDs to source text:
+{json.dumps(segments, ensure_ascii=False, indent=2)}
+
+Tokens such as ⟦0⟧ stand for placeholders and markup filled in by the application. \
+Keep every token exactly as written, once each, moving it only where {target_lang} word order needs it.
+Translate every string and keep its ID. Keep each translation about as short as its source text.
+Respond only with a JSON object of the form {{"translations": {{"<id>": "<translation>"}}}}."""
+
+        with instrumentation.stage("initial"):
+            response = utils.get_completion(
+                prompt, system_message=system_message, json_mode=True
+            )
+        parsed = batching.parse_batch_response(response, batch)
+        for i in batch:
+            text, placeholders = pending[i], protected[i][1]
+            translation = parsed.get(i)
+            if translation is not None:
+                translation = restore(translation, placeholders)
+            if translation is None:
+                ic(f"Retrying string {i} on its own")
+                translation = restore(
+                    utils.one_chunk_initial_translation(
+                        source_lang, target_lang, masked[i], tone
+                    ),
+                    placeholders,
+                )
+            if translation is None:
+                ic(f"Placeholders lost in string {i}, keeping the source")
+                translations[text] = text
+                continue
+            translations[text] = translation
+            if store is not None:
+                store.put(job_id, fingerprint(text), "initial", 0, translation)
+    return [translations[text] for text in strings]
+
+
+def _json_strings(value: Any, found: List[str]) -> None:
+    if isinstance(value, str):
+        found.append(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _json_strings(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _json_strings(item, found)
+
+
+def _json_replace(value: Any, translations: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        return translations[value]
+    if isinstance(value, dict):
+        return {
+            key: _json_replace(item, translations)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_json_replace(item, translations) for item in value]
+    return value
+
+
+def translate_json(
+    source_lang: str,
+    target_lang: str,
+    source_text: str,
+    tone: int = 3,
+    country: str = "",
+    max_batch_tokens: int = batching.MAX_TOKENS_PER_BATCH,
+    store: Optional[JobStore] = None,
+    job_id: str = RESOURCE_JOB_ID,
+    indent: Optional[int] = 2,
+) -> str:
+    """
+    Translate the string values of a JSON locale bundle.
+
+    Keys, numbers, booleans and the nesting are kept as they are, and only
+    the string values are translated, with translate_strings.
+
+    Args:
+        source_text (str): The content of the .json file.
+        indent (Optional[int]): The indent of the output JSON.
+
+    Returns:
+        str: The translated JSON, with the keys in their original order.
+    """
+
+    data = json.loads(source_text)
+    strings: List[str] = []
+    _json_strings(data, strings)
+    translated = translate_strings(
+        source_lang,
+        target_lang,
+        strings,
+        tone,
+        country,
+        max_batch_tokens=max_batch_tokens,
+        store=store,
+        job_id=job_id,
+    )
+    output = json.dumps(
+        _json_replace(data, dict(zip(strings, translated))),
+        ensure_ascii=False,
+        indent=indent,
+    )
+    return output + "\n" if source_text.endswith("\n") else output
+
+
+_PO_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", '"': '"', "\\": "\\"}
+_PO_FIELD = re.compile(r'^(msgctxt|msgid_plural|msgid|msgstr(?:\[\d+\])?)\s+"')
+
+
+def _po_unquote(line: str) -> str:
+    body = line[line.index('"') + 1 : line.rindex('"')]
+    return re.sub(
+        r"\\(.)",
+        lambda match: _PO_ESCAPES.get(match.group(1), match.group(0)),
+        body,
+    )
+
+
+def _po_quote(text: str) -> str:
+    text = (
+        text.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+        .replace("\t", "\\t")
+        .replace("\r", "\\r")
+    )
+    return f'"{text}"'
+
+
+def _po_field_lines(name: str, text: str) -> List[str]:
+    parts = re.findall(r"[^\n]*\n|[^\n]+", text)
+    if len(parts) <= 1:
+        return [f"{name} {_po_quote(text)}"]
+    # Multi-line messages are written the way msgmerge writes them
+    return [f'{name} ""'] + [_po_quote(part) for part in parts]
+
+
+@dataclass
+class _POEntry:
+    lines: List[str]
+    fields: Dict[str, str] = field(default_factory=dict)
+    first_msgstr: Optional[int] = None  # index of the first msgstr line
+
+    @property
+    def fuzzy(self) -> bool:
+        return any(
+            line.startswith("#,") and "fuzzy" in line for line in self.lines
+        )
+
+    @property
+    def translated(self) -> bool:
+        msgstrs = [v for k, v in self.fields.items() if k.startswith("msgstr")]
+        return bool(msgstrs) and all(msgstrs) and not self.fuzzy
+
+
+def _parse_po(source_text: str) -> List[_POEntry]:
+    entries: List[_POEntry] = []
+    for block in re.split(r"\n[ \t]*\n", source_text.strip("\n")):
+        entry = _POEntry(block.split("\n"))
+        current = None
+        for i, line in enumerate(entry.lines):
+            match = _PO_FIELD.match(line)
+            if match:
+                current = match.group(1)
+                entry.fields[current] = _po_unquote(line)
+                if current.startswith("msgstr") and entry.first_msgstr is None:
+                    entry.first_msgstr = i
+            elif line.startswith('"') and current is not None:
+                entry.fields[current] += _po_unquote(line)
+            else:
+                current = None
+        entries.append(entry)
+    return entries
+
+
+def _plural_count(entries: List[_POEntry]) -> int:
+    for entry in entries:
+        if entry.fields.get("msgid") == "":
+            header = entry.fields.get("msgstr", "")
+            match = re.search(r"nplurals\s*=\s*(\d+)", header)
+            if match:
+                return int(match.group(1))
+    return 2
+
+
+def translate_po(
+    source_lang: str,
+    target_lang: str,
+    source_text: str,
+    tone: int = 3,
+    country: str = "",
+    max_batch_tokens: int = batching.MAX_TOKENS_PER_BATCH,
+    store: Optional[JobStore] = None,
+    job_id: str = RESOURCE_JOB_ID,
+) -> str:
+    """
+    Fill in the msgstr of the untranslated and fuzzy entries of a gettext .po
+    file, as produced by msgmerge after the sources changed.
+
+    Entries that are already translated, the header and obsolete entries are
+    left untouched, and so are comments, references and contexts. A plural
+    entry gets its singular translation in msgstr[0] and its plural
+    translation in every other form, for a translator to review.
+
+    Args:
+        source_text (str): The content of the .po or .pot file.
+
+    Returns:
+        str: The .po file with the new translations.
+    """
+
+    entries = _parse_po(source_text)
+    todo = [
+        entry
+        for entry in entries
+        if entry.fields.get("msgid")
+        and entry.first_msgstr is not None
+        and not entry.translated
+    ]
+    strings: List[str] = []
+    for entry in todo:
+        strings.append(entry.fields["msgid"])
+        if "msgid_plural" in entry.fields:
+            strings.append(entry.fields["msgid_plural"])
+    translated = dict(
+        zip(
+            strings,
+            translate_strings(
+                source_lang,
+                target_lang,
+                strings,
+                tone,
+                country,
+                max_batch_tokens=max_batch_tokens,
+                store=store,
+                job_id=job_id,
+            ),
+        )
+    )
+
+    nplurals = _plural_count(entries)
+    for entry in todo:
+        singular = translated[entry.fields["msgid"]]
+        if "msgid_plural" in entry.fields:
+            plural = translated[entry.fields["msgid_plural"]]
+            msgstr_lines = []
+            for n in range(nplurals):
+                msgstr_lines += _po_field_lines(
+                    f"msgstr[{n}]", singular if n == 0 else plural
+                )
+        else:
+            msgstr_lines = _po_field_lines("msgstr", singular)
+        # msgstr lines end an entry; the fuzzy flag and the previous msgid
+        # go with the old translation
+        head = []
+        for line in entry.lines[: entry.first_msgstr]:
+            if line.startswith("#,"):
+                line = re.sub(r",\s*fuzzy\b", "", line)
+                if line.strip() == "#":
+                    continue
+            elif line.startswith("#|"):
+                continue
+            head.append(line)
+        entry.lines = head + msgstr_lines
+
+    output = "\n\n".join("\n".join(entry.lines) for entry in entries)
+    return output + "\n" if source_text.endswith("\n") else output
@@ -0,0 +1,280 @@
+import json
+import os
+import time
+from dataclasses import dataclass, field, replace
+from threading import Lock
+from typing import Dict, List, Optional, Sequence
+
+import openai
+from icecream import ic
+
+from . import instrumentation, utils
+from .ratelimit import (
+    AdaptiveRateLimiter,
+    RateLimiter,
+    RateStore,
+    store_from_url,
+)
+from .utils import Completion
+
+
+# Errors worth retrying on another backend. Client errors such as a bad
+# request or an invalid key would fail the same way everywhere.
+FAILOVER_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+# Known OpenAI-compatible endpoints, as in the app's model_load
+ENDPOINTS = {
+    "OpenAI": (None, "OPENAI_API_KEY"),
+    "Groq": ("https://api.groq.com/openai/v1", "GROQ_API_KEY"),
+    "TogetherAI": ("https://api.together.xyz/v1", "TOGETHER_API_KEY"),
+    "Ollama": ("http://localhost:11434/v1", None),
+}
+
+
+class NoBackendError(RuntimeError):
+    """Raised when no configured backend may serve a stage."""
+
+
+@dataclass
+class Backend:
+    """
+    One endpoint and model the router can send requests to.
+
+    Args:
+        name (str): A label used in logs and call records.
+        client (openai.OpenAI): The client for the endpoint.
+        model (str): The model to request, overriding the caller's model.
+        rpm (Optional[float]): The backend's own requests-per-minute budget.
+        stages (Optional[Sequence[str]]): The stages this backend may serve,
+            e.g. ["reflection"] for a strong model only. None allows all.
+    """
+
+    name: str
+    client: openai.OpenAI
+    model: str
+    rpm: Optional[float] = None
+    stages: Optional[Sequence[str]] = None
+    latency: Optional[float] = None  # EWMA of successful call latency
+    error_rate: float = 0.0  # EWMA of failures, 1 per error and 0 per success
+    down_until: float = 0.0
+    limiter: Optional[RateLimiter] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.rpm and self.limiter is None:
+            self.limiter = RateLimiter(self.rpm)
+
+    def allows(self, stage: Optional[str]) -> bool:
+        return self.stages is None or stage in self.stages
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+
+class Router:
+    """
+    Send each request to the best healthy backend and fail over on errors.
+
+    Backends are ranked by expected time to answer: the EWMA of their latency
+    plus the wait for their rate budget, inflated by their EWMA error rate.
+    A backend whose error rate crosses error_threshold is taken out of rotation
+    for cooldown seconds, then tried again. If every allowed backend is
+    cooling down they are all tried anyway, best first.
+
+    Args:
+        backends (List[Backend]): The pool to route over, in order of
+            preference while no latency has been observed.
+        alpha (float): The EWMA weight of the newest observation.
+        error_threshold (float): The error rate that takes a backend down.
+        cooldown (float): Seconds a failing backend stays out of rotation.
+    """
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        alpha: float = 0.3,
+        error_threshold: float = 0.5,
+        cooldown: float = 30.0,
+    ):
+        if not backends:
+            raise ValueError("A router needs at least one backend")
+        self.backends = backends
+        self.alpha = alpha
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self._lock = Lock()
+
+    def _score(self, backend: Backend) -> float:
+        # Unmeasured backends score zero so that each gets tried early
+        latency = backend.latency or 0.0
+        wait = backend.limiter.delay() if backend.limiter else 0.0
+        return (latency + wait) * (1 + 4 * backend.error_rate)
+
+    def candidates(self, stage: Optional[str]) -> List[Backend]:
+        """Return the backends allowed for stage, best first."""
+        allowed = [b for b in self.backends if b.allows(stage)]
+        if not allowed:
+            raise NoBackendError(f"No backend is allowed for stage {stage}")
+        now = time.monotonic()
+        with self._lock:
+            healthy = [b for b in allowed if b.healthy(now)] or allowed
+            order = {id(b): i for i, b in enumerate(self.backends)}
+            return sorted(
+                healthy, key=lambda b: (self._score(b), order[id(b)])
+            )
+
+    def _observe(self, backend: Backend, latency: Optional[float]) -> None:
+        with self._lock:
+            failed = latency is None
+            backend.error_rate += self.alpha * (failed - backend.error_rate)
+            if failed:
+                if backend.error_rate >= self.error_threshold:
+                    backend.down_until = time.monotonic() + self.cooldown
+            elif backend.latency is None:
+                backend.latency = latency
+            else:
+                backend.latency += self.alpha * (latency - backend.latency)
+
+    def send(self, request: Dict) -> Completion:
+        """
+        Send a chat completion request through the best available backend.
+
+        Args:
+            request (Dict): The keyword arguments for chat.completions.create.
+                Its model is replaced by the chosen backend's model.
+
+        Returns:
+            Completion: The response, with model naming the backend used.
+        """
+        stage, _ = instrumentation.current_stage()
+        error: Optional[Exception] = None
+        for backend in self.candidates(stage):
+            if backend.limiter is not None:
+                backend.limiter.acquire()
+            started = time.monotonic()
+            try:
+                completion = utils.create_completion(
+                    {**request, "model": backend.model}, backend.client
+                )
+            except FAILOVER_ERRORS as e:
+                self._observe(backend, None)
+                if backend.limiter and isinstance(e, openai.RateLimitError):
+                    backend.limiter.observe(e.response.headers, throttled=True)
+                ic(f"{backend.name} failed, failing over: {e}")
+                error = e
+                continue
+            self._observe(backend, time.monotonic() - started)
+            if backend.limiter is not None:
+                # Only a 429, above, counts as throttling, not a retry
+                backend.limiter.observe(completion.headers)
+            return replace(completion, model=f"{backend.name}/{backend.model}")
+        raise error
+
+    def snapshot(self) -> List[Dict]:
+        """Return each backend's current latency, error rate and health."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "name": b.name,
+                    "model": b.model,
+                    "latency": b.latency,
+                    "error_rate": round(b.error_rate, 4),
+                    "healthy": b.healthy(now),
+                }
+                for b in self.backends
+            ]
+
+
+def backend_from_config(
+    config: Dict, rpm_scale: float = 1.0, store: Optional[RateStore] = None
+) -> Backend:
+    """
+    Build a Backend from a config entry such as
+    {"endpoint": "Groq", "model": "llama3-70b-8192", "rpm": 30,
+    "stages": ["initial", "improved"]}.
+
+    "endpoint" is one of OpenAI, Groq, TogetherAI, Ollama or CUSTOM; CUSTOM
+    takes a "base_url". "api_key" overrides the endpoint's key variable, and
+    "api_key_env" names another environment variable to read it from. With
+    "adaptive": true the rpm is tuned from the backend's rate limit headers,
+    up to "max_rpm" if given.
+    """
+    endpoint = config.get("endpoint", "OpenAI")
+    base_url, key_env = ENDPOINTS.get(endpoint, (config.get("base_url"), None))
+    key_env = config.get("api_key_env", key_env)
+    api_key = config.get("api_key") or (
+        os.getenv(key_env) if key_env else None
+    )
+    if endpoint == "Ollama":
+        api_key = "ollama"
+    name = config.get("name", endpoint)
+    rpm = config.get("rpm")
+    rpm = rpm * rpm_scale if rpm else None
+    limiter = None
+    if rpm and config.get("adaptive"):
+        max_rpm = config.get("max_rpm")
+        limiter = AdaptiveRateLimiter(
+            rpm,
+            max_rpm=max_rpm * rpm_scale if max_rpm else None,
+            store=store,
+            key=f"backend:{name}",
+        )
+    elif rpm:
+        limiter = RateLimiter(rpm, store, key=f"backend:{name}")
+    return Backend(
+        name=name,
+        client=openai.OpenAI(api_key=api_key, base_url=base_url),
+        model=config["model"],
+        rpm=rpm,
+        stages=config.get("stages"),
+        limiter=limiter,
+    )
+
+
+def load_router(
+    path: str, rpm_scale: float = 1.0, store: Optional[RateStore] = None
+) -> Router:
+    """
+    Build a Router from a JSON file.
+
+    The file holds either a list of backend entries (see backend_from_config)
+    or an object with a "backends" list and optional "alpha",
+    "error_threshold" and "cooldown" settings.
+
+    Args:
+        path (str): The JSON config file.
+        rpm_scale (float): Multiplies every backend's rpm, e.g. to split the
+            budget between worker processes.
+        store (Optional[RateStore]): Where the backends' budgets are kept,
+            to share them with other processes.
+    """
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    if isinstance(config, list):
+        config = {"backends": config}
+    backends = [
+        backend_from_config(entry, rpm_scale, store)
+        for entry in config["backends"]
+    ]
+    settings = {
+        key: config[key]
+        for key in ("alpha", "error_threshold", "cooldown")
+        if key in config
+    }
+    return Router(backends, **settings)
+
+
+def load_router_from_env(rpm_scale: float = 1.0) -> Optional[Router]:
+    """
+    Build a Router from the file named by TRANSLATION_AGENT_ROUTES, if set,
+    sharing budgets through TRANSLATION_AGENT_RATE_STORE if that is set.
+    """
+    path = os.getenv("TRANSLATION_AGENT_ROUTES")
+    if not path:
+        return None
+    store = store_from_url(os.getenv("TRANSLATION_AGENT_RATE_STORE"))
+    return load_router(path, rpm_scale, store)
@@ -0,0 +1,444 @@
+import ast
+import io
+import re
+import tokenize
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from icecream import ic
+
+from . import batching, resources
+from .jobs import JobStore
+
+
+SEGMENTED_JOB_ID = "segmented"  # JobStore job under which spans are cached
+
+# Comments that are instructions to tools rather than prose
+_DIRECTIVE = re.compile(
+    r"^(?:#!|#\s*-\*-|(?:#|//)\s*(?:type:|noqa|pragma|fmt:|pylint:|isort:|"
+    r"mypy:|ruff:|NOLINT|clang-format|IWYU))"
+)
+_LETTER = re.compile(r"[^\W\d_]")
+
+
+@dataclass
+class Span:
+    """
+    A piece of a file, either kept verbatim or translated.
+
+    The lines of a translatable span after its first one are stored without
+    line_prefix (the indentation of a docstring, or the "# " of a comment
+    block), which is put back before each line of the translation.
+    """
+
+    text: str
+    translatable: bool = False
+    line_prefix: str = ""
+
+    def render(self, translation: Optional[str] = None) -> str:
+        text = self.text if translation is None else translation
+        if not self.line_prefix:
+            return text
+        blank = self.line_prefix.rstrip()
+        lines = text.split("\n")
+        return "\n".join(
+            [lines[0]]
+            + [
+                self.line_prefix + line if line else blank
+                for line in lines[1:]
+            ]
+        )
+
+
+def _add_core(spans: List[Span], core: str, prefix: str = "") -> bool:
+    # Add core, whose lines after the first start with prefix, as one
+    # translatable span; False if a line does not, so it cannot be rebuilt
+    blank = prefix.rstrip()
+    lines = core.split("\n")
+    stripped = [lines[0]]
+    for line in lines[1:]:
+        if line == blank:
+            stripped.append("")
+        elif line.startswith(prefix) and len(line) > len(prefix):
+            stripped.append(line[len(prefix) :])
+        else:
+            return False
+    spans.append(Span("\n".join(stripped), True, prefix))
+    return True
+
+
+def _add_text(
+    spans: List[Span], text: str, prefix: str = "", edge: str = r"\s"
+) -> None:
+    # Keep the edges of text (whitespace, or comment stars) verbatim and
+    # translate what is between them, line by line if prefix does not fit
+    match = re.match(rf"^({edge}*)(.*?)({edge}*)$", text, re.DOTALL)
+    lead, core, trail = match.groups()
+    if not _LETTER.search(core):
+        spans.append(Span(text))
+        return
+    spans.append(Span(lead))
+    if not _add_core(spans, core, prefix):
+        lines = core.split("\n")
+        for i, line in enumerate(lines):
+            _add_text(spans, line)
+            if i < len(lines) - 1:
+                spans.append(Span("\n"))
+    spans.append(Span(trail))
+
+
+def _line_comment_blocks(
+    source: str, comments: List[re.Match], marker: str
+) -> List[Span]:
+    # comments are the matches of whole comments, in order; consecutive ones
+    # alone on their lines at the same column become one block
+    spans: List[Span] = []
+    position = 0
+    i = 0
+    while i < len(comments):
+        first = comments[i]
+        line_start = source.rfind("\n", 0, first.start()) + 1
+        indent = source[line_start : first.start()]
+        opener = re.match(rf"{marker}\s?", first.group(0)).group(0)
+        j = i + 1
+        if not indent.strip():
+            while (
+                j < len(comments)
+                and source[comments[j - 1].end() : comments[j].start()]
+                == "\n" + indent
+                and (
+                    re.match(rf"{marker}\s?", comments[j].group(0)).group(0)
+                    == opener
+                    or comments[j].group(0) == opener.rstrip()
+                )
+                and not _DIRECTIVE.match(comments[j].group(0))
+            ):
+                j += 1
+        spans.append(Span(source[position : first.start()]))
+        position = comments[j - 1].end()
+        block = source[first.start() : position]
+        if _DIRECTIVE.match(block):
+            spans.append(Span(block))
+        else:
+            spans.append(Span(opener))
+            prefix = "" if indent.strip() else indent + opener
+            _add_text(spans, block[len(opener) :], prefix)
+        i = j
+    spans.append(Span(source[position:]))
+    return spans
+
+
+def segment_python(source: str) -> List[Span]:
+    """Split Python source into code and translatable comments/docstrings."""
+    try:
+        tree = ast.parse(source)
+        tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+    except (SyntaxError, tokenize.TokenError) as e:
+        ic(f"Cannot parse the Python source, keeping it as is: {e}")
+        return [Span(source)]
+
+    docstring_lines = set()
+    for node in ast.walk(tree):
+        if isinstance(
+            node,
+            (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef),
+        ):
+            body = node.body
+            if (
+                body
+                and isinstance(body[0], ast.Expr)
+                and isinstance(body[0].value, ast.Constant)
+                and isinstance(body[0].value.value, str)
+            ):
+                docstring_lines.add((body[0].lineno, body[0].end_lineno))
+
+    line_offsets = [0]
+    for line in source.splitlines(keepends=True):
+        line_offsets.append(line_offsets[-1] + len(line))
+
+    def offset(position) -> int:
+        row, col = position
+        return line_offsets[row - 1] + col
+
+    # Comments go through the same grouping as C++ line comments, and
+    # docstrings are cut out of the verbatim spans between them
+    comments = [
+        re.compile(re.escape(token.string)).match(source, offset(token.start))
+        for token in tokens
+        if token.type == tokenize.COMMENT
+    ]
+    docstrings = [
+        (offset(token.start), offset(token.end))
+        for token in tokens
+        if token.type == tokenize.STRING
+        and (token.start[0], token.end[0]) in docstring_lines
+    ]
+
+    spans: List[Span] = []
+    start = 0  # where the current span starts in source
+    for span in _line_comment_blocks(source, comments, "#+"):
+        end = start + len(span.render())
+        if span.translatable:
+            spans.append(span)
+            start = end
+            continue
+        # Cut the docstrings out of the code between the comments
+        position = start
+        for doc_start, doc_end in docstrings:
+            if not (start <= doc_start and doc_end <= end):
+                continue
+            literal = source[doc_start:doc_end]
+            quotes = re.match(r"[rRuU]*('''|\"\"\"|'|\")", literal)
+            spans.append(Span(source[position:doc_start]))
+            spans.append(Span(quotes.group(0)))
+            # Later lines of a docstring share the indentation of its first
+            line_start = source.rfind("\n", 0, doc_start) + 1
+            indent = re.match(r"[ \t]*", source[line_start:doc_start]).group(0)
+            body = literal[quotes.end() : -len(quotes.group(1))]
+            _add_text(spans, body, indent)
+            spans.append(Span(quotes.group(1)))
+            position = doc_end
+        spans.append(Span(source[position:end]))
+        start = end
+    return spans
+
+
+_CPP_TOKEN = re.compile(
+    r'(?:u8|[uUL])?R"(?P<delim>[^()\\\s]{0,16})\(.*?\)(?P=delim)"'
+    r'|(?:u8|[uUL])?"(?:\\.|[^"\\\n])*"'
+    r"|'(?:\\.|[^'\\\n])*'"
+    r"|(?P<line>//[^\n]*)"
+    r"|(?P<block>/\*.*?\*/)",
+    re.DOTALL,
+)
+
+
+def segment_cpp(source: str) -> List[Span]:
+    """Split C or C++ source into verbatim code and translatable comments."""
+    line_comments = []
+    blocks = []
+    for match in _CPP_TOKEN.finditer(source):
+        if match.group("line"):
+            line_comments.append(match)
+        elif match.group("block"):
+            blocks.append(match)
+
+    spans: List[Span] = []
+    start = 0  # where the current span starts in source
+    for span in _line_comment_blocks(source, line_comments, r"//+[!<]?"):
+        end = start + len(span.render())
+        if span.translatable:
+            spans.append(span)
+            start = end
+            continue
+        position = start
+        for block in blocks:
+            if not (start <= block.start() and block.end() <= end):
+                continue
+            text = block.group(0)
+            opener = re.match(r"/\*(?:\*+(?!/))?[!<]?", text).group(0)
+            closer = re.search(r"\*+/$", text[len(opener) :]).group(0)
+            spans.append(Span(source[position : block.start()]))
+            spans.append(Span(opener))
+            # Later lines usually start with " * " under the opener
+            body = text[len(opener) : len(text) - len(closer)]
+            lines = body.strip(" \t*\n").split("\n")[1:]
+            prefix = ""
+            for line in lines:
+                if line.strip(" \t*"):
+                    prefix = re.match(r"[ \t]*(?:\*[ \t]?)?", line).group(0)
+                    break
+            _add_text(spans, body, prefix, edge=r"[\s*]")
+            spans.append(Span(closer))
+            position = block.end()
+        spans.append(Span(source[position:end]))
+        start = end
+    return spans
+
+
+_FENCE = re.compile(r"^[ \t]{0,3}(`{3,}|~{3,})")
+_MD_VERBATIM_LINE = re.compile(
+    r"^\s*(?:<|\[[^\]]+\]:\s|\|?\s*:?-{3,}:?\s*(?:\|\s*:?-{3,}:?\s*)*\|?\s*$"
+    r"|(?:[-*_]\s*){3,}$|={3,}\s*$)"
+)
+_MD_LINE_PREFIX = re.compile(
+    r"^[ \t]*(?:>[ \t]?)*(?:[-*+][ \t]+|\d+[.)][ \t]+)?(?:\[[ xX]\][ \t]+)?"
+    r"(?:#{1,6}[ \t]+)?"
+)
+
+
+def segment_markdown(source: str) -> List[Span]:
+    """
+    Split Markdown into verbatim markup and code, and translatable prose.
+
+    Fenced and indented code blocks, front matter, HTML, link definitions,
+    rules and table separators are kept as they are. The prose of headings,
+    list items, quotes and table cells is translated, a paragraph at a time.
+    """
+    spans: List[Span] = []
+    paragraph: List[str] = []
+
+    def flush() -> None:
+        if paragraph:
+            _add_text(spans, "".join(paragraph))
+            paragraph.clear()
+
+    lines = source.splitlines(keepends=True)
+    fence = None
+    previous_blank = True
+    front_matter = bool(lines) and lines[0].strip() == "---"
+    for i, line in enumerate(lines):
+        content = line.rstrip("\r\n")
+        newline = line[len(content) :]
+        if front_matter:
+            spans.append(Span(line))
+            front_matter = i == 0 or content.strip() not in ("---", "...")
+            continue
+        if fence is not None:
+            spans.append(Span(line))
+            match = _FENCE.match(content)
+            if (
+                match
+                and match.group(1)[0] == fence[0]
+                and len(match.group(1)) >= len(fence)
+                and not content.strip(" \t`~")
+            ):
+                fence = None
+            continue
+        match = _FENCE.match(content)
+        if match:
+            flush()
+            fence = match.group(1)
+            spans.append(Span(line))
+            continue
+
+        blank = not content.strip()
+        indented_code = (
+            previous_blank
+            and not paragraph
+            and content.startswith(("    ", "\t"))
+        )
+        if blank or indented_code or _MD_VERBATIM_LINE.match(content):
+            flush()
+            spans.append(Span(line))
+            previous_blank = blank or (indented_code and previous_blank)
+            continue
+        previous_blank = False
+
+        if content.lstrip().startswith("|"):
+            flush()
+            # A table row: translate each cell on its own
+            for cell in re.split(r"(\|)", content):
+                if cell == "|":
+                    spans.append(Span(cell))
+                else:
+                    _add_text(spans, cell)
+            spans.append(Span(newline))
+            continue
+
+        prefix = _MD_LINE_PREFIX.match(content).group(0)
+        if paragraph and not prefix.strip():
+            # A continuation line, indented or not
+            paragraph.append(line)
+            continue
+        # A heading, list item or quote line starts its own paragraph
+        flush()
+        if prefix:
+            spans.append(Span(prefix))
+            if prefix.lstrip(" \t>").startswith("#"):
+                _add_text(spans, line[len(prefix) :])
+                continue
+        paragraph.append(line[len(prefix) :])
+    flush()
+    return spans
+
+
+SEGMENTERS: Dict[str, Callable[[str], List[Span]]] = {
+    "py": segment_python,
+    "c": segment_cpp,
+    "cc": segment_cpp,
+    "cpp": segment_cpp,
+    "h": segment_cpp,
+    "hpp": segment_cpp,
+    "md": segment_markdown,
+    "markdown": segment_markdown,
+}
+_KINDS = {
+    segment_python: "the comments and docstrings of a Python source file",
+    segment_cpp: "the comments of a C++ source file",
+    segment_markdown: (
+        "the paragraphs, headings and list items of a Markdown document"
+    ),
+}
+
+
+def segment(source_text: str, file_format: str) -> List[Span]:
+    """
+    Split a file into verbatim and translatable spans.
+
+    Args:
+        source_text (str): The content of the file.
+        file_format (str): Its extension, a key of SEGMENTERS.
+
+    Returns:
+        List[Span]: Spans whose texts add up to source_text.
+    """
+    return SEGMENTERS[file_format.lower().lstrip(".")](source_text)
+
+
+def translate_segmented(
+    source_lang: str,
+    target_lang: str,
+    source_text: str,
+    tone: int = 3,
+    country: str = "",
+    max_batch_tokens: int = batching.MAX_TOKENS_PER_BATCH,
+    store: Optional[JobStore] = None,
+    job_id: str = SEGMENTED_JOB_ID,
+    file_format: str = "md",
+) -> str:
+    """
+    Translate the comments and docstrings of source code, or the prose of a
+    Markdown document, and leave the rest of the file byte for byte as it was.
+
+    Only the translatable spans are sent, many per json_mode request, with
+    inline code, URLs and placeholders protected; see
+    resources.translate_strings.
+
+    Args:
+        source_lang (str): The source language of the text.
+        target_lang (str): The target language for translation.
+        source_text (str): The content of the file.
+        tone (int): Formality level (1-5).
+        country (str): Country specified for the target language.
+        max_batch_tokens (int): The maximum number of source tokens per
+            request.
+        store (Optional[JobStore]): Where translations are cached between runs.
+        job_id (str): The store job to cache them under.
+        file_format (str): The file's extension, a key of SEGMENTERS.
+
+    Returns:
+        str: The file with its translatable spans translated.
+    """
+
+    segmenter = SEGMENTERS[file_format.lower().lstrip(".")]
+    spans = segmenter(source_text)
+    texts = [span.text for span in spans if span.translatable]
+    ic(f"Translating {len(texts)} of {len(spans)} spans")
+    translations = iter(
+        resources.translate_strings(
+            source_lang,
+            target_lang,
+            texts,
+            tone,
+            country,
+            max_batch_tokens=max_batch_tokens,
+            store=store,
+            job_id=job_id,
+            kind=_KINDS[segmenter],
+        )
+    )
+    return "".join(
+        span.render(next(translations) if span.translatable else None)
+        for span in spans
+    )
@@ -0,0 +1,226 @@
+import codecs
+import mmap
+import os
+from collections import deque
+from typing import Deque, Iterable, Iterator, List
+
+from icecream import ic
+
+from . import utils
+
+
+# Bytes of a file decoded at a time by iter_file
+READ_BLOCK_SIZE = 1 << 20
+
+
+def iter_file(path: str, block_size: int = READ_BLOCK_SIZE) -> Iterator[str]:
+    """
+    Yield a UTF-8 text file in pieces of about block_size bytes, memory-mapped
+    so that only the piece being decoded is held in memory.
+
+    Pieces end after a newline where the block has one, so lines are only cut
+    when longer than block_size. "\r\n" line endings are read as "\n".
+
+    Args:
+        path (str): The file to read.
+        block_size (int): The most bytes to decode at a time.
+
+    Yields:
+        str: Pieces whose concatenation is the text of the file.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            # An empty file cannot be mapped
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while start < size:
+                end = min(start + block_size, size)
+                if end < size:
+                    newline = data.rfind(b"\n", start, end)
+                    if newline != -1:
+                        end = newline + 1
+                    elif data[end - 1 : end] == b"\r":
+                        # Keep a "\r\n" together
+                        end += 1
+                text = decoder.decode(data[start:end])
+                yield text.replace("\r\n", "\n")
+                start = end
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def drop_blank_lines(pieces: Iterable[str]) -> Iterator[str]:
+    """
+    Remove the lines that are empty or only whitespace from a stream of text,
+    as re.sub(r"(?m)^\\s*$\\n?", "", text) does for a whole text.
+
+    Args:
+        pieces (Iterable[str]): The text, in order; lines may span pieces.
+
+    Yields:
+        str: The text a line, or the part of a line in one piece, at a time.
+    """
+    held = ""  # the start of a line, all whitespace so far
+    line_start = True
+    for piece in pieces:
+        parts = piece.split("\n")
+        for n, part in enumerate(parts):
+            last = n == len(parts) - 1
+            if line_start and not part.strip():
+                # A blank line is dropped with its newline; one that goes on
+                # in the next piece may still turn out not to be blank
+                held = held + part if last else ""
+                continue
+            line = part if last else part + "\n"
+            if line_start:
+                line, held = held + line, ""
+            if line:
+                yield line
+            line_start = not last
+
+
+def iter_file_chunks(
+    path: str, max_tokens: int = utils.MAX_TOKENS_PER_CHUNK
+) -> Iterator[str]:
+    """
+    Read a text file into chunks of up to max_tokens tokens, without blank
+    lines, holding about one block and one chunk in memory at a time.
+
+    Args:
+        path (str): The UTF-8 text file to read.
+        max_tokens (int): The maximum number of tokens per chunk.
+
+    Yields:
+        str: The chunks of the file, in order.
+    """
+    return iter_chunks(drop_blank_lines(iter_file(path)), max_tokens)
+
+
+def iter_chunks(
+    pieces: Iterable[str], max_tokens: int = utils.MAX_TOKENS_PER_CHUNK
+) -> Iterator[str]:
+    """
+    Pack a stream of text pieces (pages, paragraphs) into chunks of up to
+    max_tokens tokens, yielding each chunk as soon as it is full.
+
+    Pieces are kept whole where they fit; a piece longer than max_tokens is
+    split the same way translate() splits a long text.
+
+    Args:
+        pieces (Iterable[str]): The text, in order, e.g. from a lazy reader.
+        max_tokens (int): The maximum number of tokens per chunk.
+
+    Yields:
+        str: Chunks whose concatenation is the concatenated pieces.
+    """
+    buffer: List[str] = []
+    buffered_tokens = 0
+    for piece in pieces:
+        if not piece:
+            continue
+        num_tokens = utils.num_tokens_in_string(piece)
+        if buffer and buffered_tokens + num_tokens > max_tokens:
+            yield "".join(buffer)
+            buffer, buffered_tokens = [], 0
+        if num_tokens > max_tokens:
+            yield from utils.split_source_text(piece, num_tokens, max_tokens)
+            continue
+        buffer.append(piece)
+        buffered_tokens += num_tokens
+        if buffered_tokens >= max_tokens:
+            # Full already, so do not wait for the next piece
+            yield "".join(buffer)
+            buffer, buffered_tokens = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def _translate_in_window(
+    source_lang: str,
+    target_lang: str,
+    window: List[str],
+    position: int,
+    tone: int,
+    country: str,
+) -> str:
+    # Run the three stages for window[position], with the rest as context
+    indices = [position]
+    translation_1 = [""] * len(window)
+    translation_1[position] = utils.multichunk_initial_translation(
+        source_lang, target_lang, window, tone, chunk_indices=indices
+    )[0]
+    reflection = [""] * len(window)
+    reflection[position] = utils.multichunk_reflect_on_translation(
+        source_lang,
+        target_lang,
+        window,
+        translation_1,
+        tone,
+        country,
+        chunk_indices=indices,
+    )[0]
+    return utils.multichunk_improve_translation(
+        source_lang,
+        target_lang,
+        window,
+        translation_1,
+        reflection,
+        tone,
+        chunk_indices=indices,
+    )[0]
+
+
+def translate_stream(
+    source_lang: str,
+    target_lang: str,
+    pieces: Iterable[str],
+    tone: int,
+    country: str = "",
+    max_tokens: int = utils.MAX_TOKENS_PER_CHUNK,
+    context_chunks: int = 1,
+) -> Iterator[str]:
+    """
+    Translate a text that is still being read, yielding translated chunks in
+    order as soon as each is done.
+
+    Unlike translate(), which shows every chunk the whole document as
+    context, each chunk here sees context_chunks chunks on either side, so
+    chunk i is translated once chunk i + context_chunks has been read and the
+    whole document never has to be in memory.
+
+    Args:
+        source_lang (str): The source language of the text.
+        target_lang (str): The target language for the translation.
+        pieces (Iterable[str]): The source text, e.g. the pages of a PDF.
+        tone (int): Formality level (1-5).
+        country (str): Country specified for the target language.
+        max_tokens (int): The maximum number of tokens per chunk.
+        context_chunks (int): Chunks of context on each side of a chunk.
+
+    Yields:
+        str: The translation of each chunk.
+    """
+    window: Deque[str] = deque(maxlen=2 * context_chunks + 1)
+    pending = 0  # chunks read but not yet translated, at the end of window
+
+    def translate_next() -> str:
+        position = len(window) - pending
+        return _translate_in_window(
+            source_lang, target_lang, list(window), position, tone, country
+        )
+
+    for i, chunk in enumerate(iter_chunks(pieces, max_tokens)):
+        window.append(chunk)
+        pending += 1
+        if pending > context_chunks:
+            ic(f"Translating streamed chunk {i - context_chunks}")
+            yield translate_next()
+            pending -= 1
+
+    while pending:
+        yield translate_next()
+        pending -= 1
@@ -0,0 +1,211 @@
+import json
+from typing import Dict, List
+
+import pysrt
+from icecream import ic
+
+from . import batching, instrumentation, utils
+from .utils import tone_mapping
+
+
+CONTEXT_CUES = 3  # neighbouring cues shown on each side of a batch
+
+
+def _cue_json(cues: List[str], ids: List[int]) -> str:
+    return json.dumps(
+        {str(i): cues[i] for i in ids}, ensure_ascii=False, indent=2
+    )
+
+
+def _context(cues: List[str], batch: List[int], context_cues: int) -> str:
+    before = list(range(max(0, batch[0] - context_cues), batch[0]))
+    stop = min(len(cues), batch[-1] + 1 + context_cues)
+    after = list(range(batch[-1] + 1, stop))
+    if not before and not after:
+        return ""
+    parts = ["For context only, do not translate these neighbouring cues:"]
+    if before:
+        parts.append(f"Before: {_cue_json(cues, before)}")
+    if after:
+        parts.append(f"After: {_cue_json(cues, after)}")
+    return "\n".join(parts) + "\n"
+
+
+def _ask(
+    stage: str, prompt: str, system_message: str, batch: List[int]
+) -> Dict[int, str]:
+    with instrumentation.stage(stage):
+        response = utils.get_completion(
+            prompt, system_message=system_message, json_mode=True
+        )
+    return batching.parse_batch_response(response, batch)
+
+
+def translate_cues(
+    source_lang: str,
+    target_lang: str,
+    cues: List[str],
+    tone: int = 3,
+    country: str = "",
+    max_batch_tokens: int = batching.MAX_TOKENS_PER_BATCH,
+    context_cues: int = CONTEXT_CUES,
+    reflect: bool = True,
+) -> List[str]:
+    """
+    Translate subtitle cue texts with a few batched requests.
+
+    Neighbouring cues are packed into batches of up to max_batch_tokens source
+    tokens, and each batch goes through the translate, reflect and improve
+    stages as one unit, with context_cues cues on either side shown as context
+    so that sentences running across a batch boundary read on.
+
+    Args:
+        source_lang (str): The source language of the subtitles.
+        target_lang (str): The target language for translation.
+        cues (List[str]): The text of each cue, in order.
+        tone (int): Formality level (1-5).
+        country (str): Country specified for the target language.
+        max_batch_tokens (int): The maximum number of source tokens per batch.
+        context_cues (int): Cues of context on each side of a batch.
+        reflect (bool): Whether to run the reflect and improve stages.
+
+    Returns:
+        List[str]: The translation of each cue, aligned with cues.
+    """
+
+    system_message = f"You are an expert subtitle translator, specializing in translation from {source_lang} to {target_lang}. {tone_mapping[tone]}"
+    rules = """Each cue is shown on screen on its own, so keep every cue ID and translate each cue as itself: \
+do not merge, split, omit or move text between cues. Keep cues short enough to read at a glance, \
+keep their line breaks where possible, and keep formatting tags such as <i> and </i>."""
+    results: List[str] = list(cues)
+
+    batches = batching.pack_batches(cues, max_batch_tokens)
+    ic(f"Translating {len(cues)} cues in {len(batches)} batches")
+    for batch in batches:
+        context = _context(cues, batch, context_cues)
+        source = _cue_json(cues, batch)
+        prompt = f"""Your task is to provide a professional translation from {source_lang} to {target_lang} of the subtitle cues below.
+
+{context}
+The cues to translate are given below as a JSON object mapping cue IDs to text:
+{source}
+
+{rules}
+Respond only with a JSON object of the form {{"translations": {{"<id>": "<translation>"}}}}."""
+        translation_1 = _ask("initial", prompt, system_message, batch)
+        for i in batch:
+            if i not in translation_1:
+                ic(f"Cue {i} missing from the batch response, falling back")
+                translation_1[i] = utils.one_chunk_initial_translation(
+                    source_lang, target_lang, cues[i], tone
+                )
+        translated = json.dumps(
+            {str(i): translation_1[i] for i in batch},
+            ensure_ascii=False,
+            indent=2,
+        )
+        if not reflect:
+            for i in batch:
+                results[i] = translation_1[i]
+            continue
+
+        reflection = utils.one_chunk_reflect_on_translation(
+            source_lang, target_lang, source, translated, tone, country
+        )
+        prompt = f"""Your task is to carefully read, then improve, a translation from {source_lang} to {target_lang} of the subtitle cues below, \
+taking into account a set of expert suggestions and constructive criticisms.
+
+{context}
+The source cues, as a JSON object mapping cue IDs to text:
+{source}
+
+The initial translation, with the same cue IDs:
+{translated}
+
+The expert suggestions:
+{reflection}
+
+Taking into account the expert suggestions, rewrite the translation of each cue to improve its accuracy, fluency, style and terminology, \
+ensuring it adheres to the required formality level.
+{rules}
+Respond only with a JSON object of the form {{"translations": {{"<id>": "<improved translation>"}}}}."""
+        improved = _ask("improved", prompt, system_message, batch)
+        for i in batch:
+            # A cue the improve step dropped keeps its initial translation
+            results[i] = improved.get(i, translation_1[i])
+    return results
+
+
+def translate_subtitles(
+    source_lang: str,
+    target_lang: str,
+    subtitles: pysrt.SubRipFile,
+    tone: int = 3,
+    country: str = "",
+    max_batch_tokens: int = batching.MAX_TOKENS_PER_BATCH,
+    context_cues: int = CONTEXT_CUES,
+    reflect: bool = True,
+) -> pysrt.SubRipFile:
+    """
+    Translate a parsed subtitle file; see translate_cues.
+
+    Returns:
+        pysrt.SubRipFile: A copy of subtitles with the same cue indices and
+            timecodes, and the translated text.
+    """
+
+    translations = translate_cues(
+        source_lang,
+        target_lang,
+        [item.text for item in subtitles],
+        tone,
+        country,
+        max_batch_tokens=max_batch_tokens,
+        context_cues=context_cues,
+        reflect=reflect,
+    )
+    return pysrt.SubRipFile(
+        [
+            pysrt.SubRipItem(
+                index=item.index,
+                start=item.start,
+                end=item.end,
+                text=translation,
+                position=item.position,
+            )
+            for item, translation in zip(subtitles, translations)
+        ]
+    )
+
+
+def translate_srt(
+    source_lang: str,
+    target_lang: str,
+    source_text: str,
+    tone: int = 3,
+    country: str = "",
+    max_batch_tokens: int = batching.MAX_TOKENS_PER_BATCH,
+    context_cues: int = CONTEXT_CUES,
+    reflect: bool = True,
+) -> str:
+    """
+    Translate the text of an SRT file, keeping its cues and timecodes.
+
+    Args:
+        source_text (str): The content of the .srt file.
+
+    Returns:
+        str: The translated SRT.
+    """
+
+    translated = translate_subtitles(
+        source_lang,
+        target_lang,
+        pysrt.from_string(source_text),
+        tone,
+        country,
+        max_batch_tokens=max_batch_tokens,
+        context_cues=context_cues,
+        reflect=reflect,
+    )
+    return "\n".join(str(item) for item in translated)
@@ -1,15 +1,35 @@
+import hashlib
+import json
 import os
-from typing import List, Union
+import sys
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 
-import openai
-import tiktoken
 from dotenv import load_dotenv
 from icecream import ic
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from . import cancellation, instrumentation, lanes, metrics, preprocessing
+from .lanes import LaneScheduler
+from .ratelimit import (
+    AdaptiveRateLimiter,
+    RateLimiter,
+    RateStore,
+    store_from_url,
+)
+from .singleflight import SingleFlight
+
+
+if TYPE_CHECKING:
+    import openai
 
 
 load_dotenv()  # read local .env file
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Created by get_client() on first use, as importing openai and building a
+# client is most of the import time; set it to use another client
+client: Optional["openai.OpenAI"] = None
 
 MAX_TOKENS_PER_CHUNK = (
     1000  # if text is more than this many tokens, we'll break it up into
@@ -24,6 +44,152 @@ tone_mapping = {
     5: "Use very formal and highly structured language, as required for legal or academic writing."
 }
 
+# Shared by every get_completion call
+rate_limiter: Optional[RateLimiter] = None
+# The arguments set_rate_limit was last called with, and the limiter it set
+_rate_limit_config: Optional[Tuple] = None
+cassette = None  # a cassette.Cassette that records or replays provider calls
+# Concurrent identical requests share one provider call; set to None to disable
+single_flight: Optional[SingleFlight] = SingleFlight()
+router = None  # a router.Router that spreads calls over several backends
+# Orders callers waiting for the rate limiter by lane; None serves them FIFO
+scheduler: Optional[LaneScheduler] = LaneScheduler()
+
+
+@dataclass
+class Completion:
+    """The parts of a provider response that the pipeline uses."""
+
+    content: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    cache_hit: bool = False
+    model: str = ""  # the backend that answered, when a router picked it
+    headers: Dict[str, str] = field(default_factory=dict)  # rate limit headers
+
+
+def set_rate_limit(
+    rpm: Optional[float],
+    tpm: Optional[float] = None,
+    adaptive: bool = False,
+    min_rpm: float = 1.0,
+    max_rpm: Optional[float] = None,
+    store: Optional[RateStore] = None,
+) -> None:
+    """
+    Cap the number of get_completion requests started per minute.
+
+    Args:
+        rpm (Optional[float]): Requests per minute, or None to remove the limit.
+        tpm (Optional[float]): Prompt tokens per minute, if also limited.
+            Only adaptive limiters enforce it.
+        adaptive (bool): Tune rpm (and tpm) from the provider's rate limit
+            headers and 429s, starting from the given values.
+        min_rpm (float): The lower bound of an adaptive limit.
+        max_rpm (Optional[float]): The upper bound of an adaptive limit.
+            Defaults to the limit the provider reports.
+        store (Optional[RateStore]): Where the budget is kept. Defaults to
+            the store named by TRANSLATION_AGENT_RATE_STORE (e.g.
+            "sqlite:///tmp/translation_rate.db"), which every process using
+            it shares, or else a budget private to this process.
+
+    Calling it again with the same arguments keeps the current limiter, with
+    its schedule and what an adaptive limiter has learned.
+    """
+    global rate_limiter, _rate_limit_config
+    url = os.getenv("TRANSLATION_AGENT_RATE_STORE") if store is None else None
+    config = (rpm, tpm, adaptive, min_rpm, max_rpm, store, url)
+    if _rate_limit_config == (config, rate_limiter):
+        return
+    if store is None:
+        store = _store_for_url(url)
+    if not rpm:
+        rate_limiter = None
+    elif adaptive:
+        rate_limiter = AdaptiveRateLimiter(
+            rpm, tpm, min_rpm, max_rpm, store=store
+        )
+    else:
+        rate_limiter = RateLimiter(rpm, store)
+    _rate_limit_config = (config, rate_limiter)
+
+
+@lru_cache(maxsize=None)
+def _store_for_url(url: Optional[str]) -> Optional[RateStore]:
+    # One store, and one database connection, per URL
+    return store_from_url(url)
+
+
+def request_key(request: Dict) -> str:
+    """Hash the full request parameters into a key for identical requests."""
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def set_router(new_router) -> None:
+    """
+    Route get_completion calls over a pool of backends instead of client.
+
+    Args:
+        new_router (Optional[router.Router]): The router, or None to send
+            every call to client again.
+    """
+    global router
+    router = new_router
+
+
+def get_client() -> "openai.OpenAI":
+    """Return the module's OpenAI client, creating it on first use."""
+    global client
+    if client is None:
+        import openai
+
+        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return client
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    # Only an imported openai can have raised one
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(error, openai.RateLimitError)
+
+
+def create_completion(
+    request: Dict, openai_client: Optional["openai.OpenAI"] = None
+) -> Completion:
+    """
+    Send one chat completion request to the configured client.
+
+    Args:
+        request (Dict): The keyword arguments for chat.completions.create.
+        openai_client (Optional[openai.OpenAI]): The client to send it with.
+            Defaults to the module's client, see get_client.
+
+    Returns:
+        Completion: The response content and its usage.
+    """
+    openai_client = openai_client or get_client()
+    raw_response = openai_client.chat.completions.with_raw_response.create(
+        **request, timeout=cancellation.call_timeout()
+    )
+    response = raw_response.parse()
+    headers = getattr(raw_response, "headers", None) or {}
+    completion = Completion(
+        content=response.choices[0].message.content,
+        retries=getattr(raw_response, "retries_taken", 0),
+        headers={
+            name.lower(): value
+            for name, value in headers.items()
+            if name.lower().startswith("x-ratelimit-")
+            or name.lower() == "retry-after"
+        },
+    )
+    if response.usage is not None:
+        completion.prompt_tokens = response.usage.prompt_tokens
+        completion.completion_tokens = response.usage.completion_tokens
+    return completion
+
 
 def get_completion(
     prompt: str,
@@ -52,29 +218,110 @@ def get_completion(
             If json_mode is False, returns the generated text as a string.
     """
 
+    # Cancelled jobs stop here, at the next chunk or stage boundary
+    cancellation.checkpoint()
+
+    stage, chunk = instrumentation.current_stage()
+    record = instrumentation.CallRecord(
+        stage=stage, chunk=chunk, model=model, lane=lanes.current_lane()
+    )
+
+    request = {
+        "model": model,
+        "temperature": temperature,
+        "top_p": 1,
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt},
+        ],
+    }
     if json_mode:
-        response = client.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            top_p=1,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt},
-            ],
-        )
-        return response.choices[0].message.content
-    else:
-        response = client.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            top_p=1,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt},
-            ],
-        )
-        return response.choices[0].message.content
+        request["response_format"] = {"type": "json_object"}
+
+    def send() -> Completion:
+        # Only the caller that actually sends the request spends rate budget
+        limiter = rate_limiter
+        if limiter is not None:
+            tokens = (
+                num_tokens_in_string(system_message + prompt)
+                if limiter.tpm
+                else 0
+            )
+            queued = time.monotonic()
+            turn = scheduler.turn(record.lane) if scheduler else nullcontext()
+            # The turn is held until the caller's slot is due, so callers of
+            # other lanes queue behind it and get slots by lane weight. The
+            # wait wakes up to raise if the job is cancelled
+            with turn:
+                limiter.acquire(tokens)
+            record.queue_seconds = time.monotonic() - queued
+        cancellation.checkpoint()
+        upstream = router.send if router is not None else create_completion
+        try:
+            if cassette is not None:
+                completion = cancellation.run_abandonable(
+                    lambda: cassette.play(request, upstream)
+                )
+            else:
+                completion = cancellation.run_abandonable(
+                    lambda: upstream(request)
+                )
+        except Exception as e:
+            if limiter is not None and _is_rate_limit_error(e):
+                limiter.observe(e.response.headers, throttled=True)
+            # A request cut short by the deadline's timeout ends the job
+            cancellation.checkpoint()
+            raise
+        # A replayed recording says nothing about the provider's limits
+        if limiter is not None and not completion.cache_hit:
+            # Client retries may follow 5xx or connection errors, so only a
+            # 429 that reaches us counts as pushback; the headers still show
+            # an exhausted budget
+            limiter.observe(completion.headers)
+        return completion
+
+    def coalesced_send() -> Tuple[Completion, bool]:
+        while True:
+            try:
+                return single_flight.do(request_key(request), send)
+            except cancellation.TranslationCancelledError:
+                # The shared request belonged to a job that was cancelled;
+                # send it again unless this job was cancelled too
+                cancellation.checkpoint()
+
+    started = time.monotonic()
+    try:
+        with metrics.span(
+            "get_completion", stage=stage, chunk=chunk, model=model
+        ):
+            if single_flight is not None:
+                completion, shared = coalesced_send()
+                if shared:
+                    # The usage was billed to the call that made the request
+                    completion = replace(
+                        completion,
+                        prompt_tokens=0,
+                        completion_tokens=0,
+                        retries=0,
+                        cache_hit=True,
+                    )
+            else:
+                completion = send()
+    except Exception as e:
+        record.wall_seconds = time.monotonic() - started
+        record.error = f"{type(e).__name__}: {e}"
+        instrumentation.record_call(record)
+        raise
+
+    record.wall_seconds = time.monotonic() - started
+    record.model = completion.model or model
+    record.prompt_tokens = completion.prompt_tokens
+    record.completion_tokens = completion.completion_tokens
+    record.retries = completion.retries
+    record.cache_hit = completion.cache_hit
+    instrumentation.record_call(record)
+
+    return completion.content
 
 
 def one_chunk_initial_translation(
@@ -102,7 +349,10 @@ def one_chunk_initial_translation(
 
     {target_lang}:"""
 
-    translation = get_completion(translation_prompt, system_message=system_message)
+    with instrumentation.stage("initial"):
+        translation = get_completion(
+            translation_prompt, system_message=system_message
+        )
     return translation
 
 
@@ -176,7 +426,10 @@ Consider the following:
 Provide a **list of specific, helpful, and constructive suggestions** for improvement.
 Output **only** the suggestions and nothing else."""
 
-    reflection = get_completion(reflection_prompt, system_message=system_message)
+    with instrumentation.stage("reflection"):
+        reflection = get_completion(
+            reflection_prompt, system_message=system_message
+        )
     return reflection
 
 
@@ -233,7 +486,8 @@ When improving the translation, ensure the following:
 
 **Output only the improved translation and nothing else.**"""
 
-    translation_2 = get_completion(prompt, system_message)
+    with instrumentation.stage("improved"):
+        translation_2 = get_completion(prompt, system_message)
     return translation_2
 
 
@@ -263,7 +517,7 @@ def one_chunk_translate_text(
     )
 
     reflection = one_chunk_reflect_on_translation(
-        source_lang, target_lang, source_text, translation_1, country
+        source_lang, target_lang, source_text, translation_1, tone, country
     )
 
     translation_2 = one_chunk_improve_translation(
@@ -274,6 +528,14 @@ def one_chunk_translate_text(
 
 
 
+@lru_cache(maxsize=None)
+def _encoding(encoding_name: str):
+    # tiktoken is imported on the first count, not with the package
+    import tiktoken
+
+    return tiktoken.get_encoding(encoding_name)
+
+
 def num_tokens_in_string(
     input_str: str, encoding_name: str = "cl100k_base"
 ) -> int:
@@ -294,13 +556,17 @@ def num_tokens_in_string(
         >>> print(num_tokens)
         5
     """
-    encoding = tiktoken.get_encoding(encoding_name)
+    encoding = _encoding(encoding_name)
     num_tokens = len(encoding.encode(input_str))
     return num_tokens
 
 
 def multichunk_initial_translation(
-    source_lang: str, target_lang: str, source_text_chunks: List[str], tone: int
+    source_lang: str,
+    target_lang: str,
+    source_text_chunks: List[str],
+    tone: int,
+    chunk_indices: Optional[List[int]] = None,
 ) -> List[str]:
     """
     Translate a text in multiple chunks from the source language to the target language.
@@ -310,9 +576,11 @@ def multichunk_initial_translation(
         target_lang (str): The target language for translation.
         source_text_chunks (List[str]): A list of text chunks to be translated.
         tone (int): Formality level (1-5).
+        chunk_indices (Optional[List[int]]): Only translate these chunks, using the
+            others as context. Defaults to all chunks.
 
     Returns:
-        List[str]: A list of translated text chunks.
+        List[str]: A list of translated text chunks, one per translated chunk index.
     """
 
     system_message = f"You are an expert linguist, specializing in translation from {source_lang} to {target_lang}. {tone_mapping[tone]}"
@@ -336,8 +604,11 @@ To reiterate, you should translate only this part of the text, shown here again
 Output only the translation of the portion you are asked to translate, and nothing else.
 """
 
+    if chunk_indices is None:
+        chunk_indices = list(range(len(source_text_chunks)))
+
     translation_chunks = []
-    for i in range(len(source_text_chunks)):
+    for i in chunk_indices:
         # Will translate chunk i
         tagged_text = (
             "".join(source_text_chunks[0:i])
@@ -354,7 +625,8 @@ Output only the translation of the portion you are asked to translate, and nothi
             chunk_to_translate=source_text_chunks[i],
         )
 
-        translation = get_completion(prompt, system_message=system_message)
+        with instrumentation.stage("initial", i):
+            translation = get_completion(prompt, system_message=system_message)
         translation_chunks.append(translation)
 
     return translation_chunks
@@ -368,6 +640,7 @@ def multichunk_reflect_on_translation(
     translation_1_chunks: List[str],
     tone: int,
     country: str = "",
+    chunk_indices: Optional[List[int]] = None,
 ) -> List[str]:
     """
     Provides constructive criticism and suggestions for improving a partial translation.
@@ -379,9 +652,11 @@ def multichunk_reflect_on_translation(
         translation_1_chunks (List[str]): The translated chunks corresponding to the source text chunks.
         tone (int): Formality level (1-5).
         country (str): Country specified for the target language.
+        chunk_indices (Optional[List[int]]): Only reflect on these chunks, using the
+            others as context. Defaults to all chunks.
 
     Returns:
-        List[str]: A list of reflections containing suggestions for improving each translated chunk.
+        List[str]: A list of reflections, one per reflected chunk index.
     """
 
     system_message = f"You are an expert linguist specializing in translation from {source_lang} to {target_lang}. {tone_mapping[tone]} \
@@ -451,8 +726,11 @@ Write a list of specific, helpful, and constructive suggestions for improving th
 Each suggestion should address one specific part of the translation.
 Output only the suggestions and nothing else."""
 
+    if chunk_indices is None:
+        chunk_indices = list(range(len(source_text_chunks)))
+
     reflection_chunks = []
-    for i in range(len(source_text_chunks)):
+    for i in chunk_indices:
         # Will reflect on chunk i
         tagged_text = (
             "".join(source_text_chunks[0:i])
@@ -479,7 +757,8 @@ Output only the suggestions and nothing else."""
                 translation_1_chunk=translation_1_chunks[i],
             )
 
-        reflection = get_completion(prompt, system_message=system_message)
+        with instrumentation.stage("reflection", i):
+            reflection = get_completion(prompt, system_message=system_message)
         reflection_chunks.append(reflection)
 
     return reflection_chunks
@@ -492,6 +771,7 @@ def multichunk_improve_translation(
     translation_1_chunks: List[str],
     reflection_chunks: List[str],
     tone: int,
+    chunk_indices: Optional[List[int]] = None,
 ) -> List[str]:
     """
     Improves the translation of a text from source language to target language by considering expert suggestions.
@@ -503,9 +783,11 @@ def multichunk_improve_translation(
         translation_1_chunks (List[str]): The initial translation of each chunk.
         reflection_chunks (List[str]): Expert suggestions for improving each translated chunk.
         tone (int): Formality level (1-5).
+        chunk_indices (Optional[List[int]]): Only improve these chunks, using the
+            others as context. Defaults to all chunks.
 
     Returns:
-        List[str]: The improved translation of each chunk.
+        List[str]: The improved translation of each chunk, one per improved chunk index.
     """
 
     system_message = f"You are an expert linguist, specializing in translation editing from {source_lang} to {target_lang}. {tone_mapping[tone]}"
@@ -546,8 +828,11 @@ Taking into account the expert suggestions, rewrite the translation to improve i
 
 Output only the new translation of the indicated part and nothing else."""
 
+    if chunk_indices is None:
+        chunk_indices = list(range(len(source_text_chunks)))
+
     translation_2_chunks = []
-    for i in range(len(source_text_chunks)):
+    for i in chunk_indices:
         # Will translate chunk i
         tagged_text = (
             "".join(source_text_chunks[0:i])
@@ -566,7 +851,10 @@ Output only the new translation of the indicated part and nothing else."""
             reflection_chunk=reflection_chunks[i],
         )
 
-        translation_2 = get_completion(prompt, system_message=system_message)
+        with instrumentation.stage("improved", i):
+            translation_2 = get_completion(
+                prompt, system_message=system_message
+            )
         translation_2_chunks.append(translation_2)
 
     return translation_2_chunks
@@ -655,6 +943,60 @@ def calculate_chunk_size(token_count: int, token_limit: int) -> int:
     return chunk_size
 
 
+def split_source_text(
+    source_text: str, num_tokens_in_text: int, max_tokens: int
+) -> List[str]:
+    """
+    Split the source text into the chunks that translate() works on.
+
+    Args:
+        source_text (str): The text to split.
+        num_tokens_in_text (int): The number of tokens in source_text.
+        max_tokens (int): The maximum number of tokens per chunk.
+
+    Returns:
+        List[str]: The chunks, or [source_text] if it fits in a single chunk.
+    """
+
+    if num_tokens_in_text < max_tokens:
+        return [source_text]
+
+    token_size = calculate_chunk_size(
+        token_count=num_tokens_in_text, token_limit=max_tokens
+    )
+
+    ic(token_size)
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name="gpt-4",
+        chunk_size=token_size,
+        chunk_overlap=0,
+    )
+
+    return text_splitter.split_text(source_text)
+
+
+def count_and_split(
+    source_text: str, max_tokens: int = MAX_TOKENS_PER_CHUNK
+) -> Tuple[int, List[str]]:
+    """
+    Count the tokens of a text and split it into chunks of up to max_tokens,
+    in one step that preprocessing.run can hand to a worker process. A text
+    of fewer than max_tokens tokens is not split at all.
+
+    Returns:
+        Tuple[int, List[str]]: The token count and the chunks.
+    """
+    num_tokens_in_text = num_tokens_in_string(source_text)
+    if num_tokens_in_text < max_tokens:
+        return num_tokens_in_text, [source_text]
+    return num_tokens_in_text, split_source_text(
+        source_text, num_tokens_in_text, max_tokens
+    )
+
+
 def translate(
     source_lang,
     target_lang,
@@ -662,13 +1004,103 @@ def translate(
     tone,
     country,
     max_tokens=MAX_TOKENS_PER_CHUNK,
+    batch_max_tokens=None,
+    job_id=None,
+    job_store=None,
+    return_result=False,
+    timeout=None,
+    cancel_token=None,
 ):
-    """Translate the source_text from source_lang to target_lang with a specified tone."""
+    """Translate the source_text from source_lang to target_lang with a specified tone.
 
-    num_tokens_in_text = num_tokens_in_string(source_text)
+    If batch_max_tokens is set, the chunks of a long text are packed into json_mode
+    requests of up to that many tokens for the initial and improve stages.
+
+    If job_id is set, every (chunk, stage) output is checkpointed in job_store
+    (a JobStore, by default at JOB_DB_PATH) and a job that was interrupted resumes
+    where it stopped. Checkpointed jobs run one chunk per request, so job_id
+    cannot be combined with batch_max_tokens.
+
+    If return_result is set, a TranslationResult is returned instead of the bare
+    translation, with the timings, token usage and retries of every call.
+
+    If timeout (in seconds) or cancel_token (a cancellation.CancelToken) is set,
+    the job stops with TranslationCancelledError (DeadlineExceededError for
+    the deadline) at the next chunk or stage boundary once the deadline passes
+    or the token is cancelled. A timeout alone bounds the request in flight by its client
+    timeout; a cancel_token also abandons it when cancelled.
+    """
+
+    if job_id is not None and batch_max_tokens:
+        raise ValueError(
+            "batch_max_tokens cannot be used with job_id: checkpointed jobs "
+            "run one chunk per request"
+        )
+
+    if timeout is not None or cancel_token is not None:
+        token = cancel_token or cancellation.CancelToken(abandon_calls=False)
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+            token.deadline = min(token.deadline or deadline, deadline)
+        with cancellation.scope(token):
+            return translate(
+                source_lang,
+                target_lang,
+                source_text,
+                tone,
+                country,
+                max_tokens=max_tokens,
+                batch_max_tokens=batch_max_tokens,
+                job_id=job_id,
+                job_store=job_store,
+                return_result=return_result,
+            )
+
+    if return_result:
+        with instrumentation.collect() as result:
+            result.translation = translate(
+                source_lang,
+                target_lang,
+                source_text,
+                tone,
+                country,
+                max_tokens=max_tokens,
+                batch_max_tokens=batch_max_tokens,
+                job_id=job_id,
+                job_store=job_store,
+            )
+        return result
+
+    # Tokenizing a long text is CPU-bound, so it runs in the preprocessing
+    # pool if there is one
+    num_tokens_in_text, source_text_chunks = preprocessing.run(
+        count_and_split, source_text, max_tokens, size=len(source_text)
+    )
 
     ic(num_tokens_in_text)
 
+    if job_id is not None:
+        from .jobs import JobStore, resumable_translation
+
+        ic(f"Translating text as resumable job {job_id}")
+
+        store = job_store or JobStore()
+        try:
+            translation_2_chunks = resumable_translation(
+                store,
+                job_id,
+                source_lang,
+                target_lang,
+                source_text_chunks,
+                tone,
+                country,
+            )
+        finally:
+            if job_store is None:
+                store.close()
+
+        return "".join(translation_2_chunks)
+
     if num_tokens_in_text < max_tokens:
         ic("Translating text as a single chunk")
 
@@ -681,22 +1113,20 @@ def translate(
     else:
         ic("Translating text as multiple chunks")
 
-        token_size = calculate_chunk_size(
-            token_count=num_tokens_in_text, token_limit=max_tokens
-        )
-
-        ic(token_size)
+        if batch_max_tokens:
+            from .batching import batched_translation
 
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            model_name="gpt-4",
-            chunk_size=token_size,
-            chunk_overlap=0,
-        )
-
-        source_text_chunks = text_splitter.split_text(source_text)
-
-        translation_2_chunks = multichunk_translation(
-            source_lang, target_lang, source_text_chunks, tone, country
-        )
+            translation_2_chunks = batched_translation(
+                source_lang,
+                target_lang,
+                source_text_chunks,
+                tone,
+                country,
+                max_batch_tokens=batch_max_tokens,
+            )
+        else:
+            translation_2_chunks = multichunk_translation(
+                source_lang, target_lang, source_text_chunks, tone, country
+            )
 
         return "".join(translation_2_chunks)
@@ -1,15 +1,25 @@
 import os
 import re
 import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import src.translation_agent.cancellation as cancellation
+import src.translation_agent.planner as planner
+import app.process as process
+from app.file_utils import extract_pdf
 from app.process import (
+    TranslationError,
     extract_docx,
-    extract_pdf,
     extract_text,
+    metrics,
     model_load,
     translator,
     translator_sec,
 )
 
+# Glossary warnings are shown in the page
+process.warn = st.warning
+
 # **Page Configuration**
 st.set_page_config(
     page_title="Translation Agent",
@@ -58,6 +68,14 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# **Metrics Endpoint (started once per server process when METRICS_PORT is set)**
+@st.cache_resource
+def start_metrics():
+    return metrics.start_from_env()
+
+
+start_metrics()
+
 st.markdown('<div class="title-container"><div class="title-text">GIMO Translation Agent</div></div>', unsafe_allow_html=True)
 
 # **Helper Function: Translation Workflow**
@@ -83,9 +101,29 @@ def huanik(
 
     source_text = re.sub(r"(?m)^\s*$\n?", "", source_text)
 
-    final_translation = translator(
-        source_lang, target_lang, source_text, tone, country, max_tokens
-    )
+    # Stop spending quota once the browser session is gone, or when the
+    # same session starts another translation
+    session_id = get_script_run_ctx().session_id
+    try:
+        with cancellation.sessions.job(
+            session_id,
+            is_alive=lambda: runtime.exists()
+            and runtime.get_instance().is_active_session(session_id),
+        ):
+            final_translation = translator(
+                source_lang,
+                target_lang,
+                source_text,
+                tone,
+                country,
+                max_tokens,
+            )
+    except cancellation.TranslationCancelledError as e:
+        st.warning(f"Translation stopped: {e}")
+        return None
+    except TranslationError as e:
+        st.error(str(e))
+        return None
 
     return final_translation
 
@@ -151,6 +189,16 @@ file = st.file_uploader("Upload File", type=["pdf", "txt", "py", "docx", "json",
 if file:
     source_text = read_doc(file)
 
+# **Pre-flight Estimate of Calls, Tokens and Time**
+@st.cache_data(max_entries=32)
+def estimate(source_text: str, max_tokens: int, rpm: int) -> str:
+    # Reruns happen on every widget change; re-plan only when the inputs do
+    return planner.plan(source_text, max_tokens=max_tokens, rpm=rpm).summary()
+
+
+if source_text and source_text.strip():
+    st.caption(f"Estimated: {estimate(source_text, max_tokens, rpm)}")
+
 # **Function to Perform Translation and Update Session State**
 def translate():
     if not st.session_state.source_text.strip():
@@ -0,0 +1,98 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from translation_agent.batching import batched_initial_translation
+from translation_agent.batching import batched_improve_translation
+from translation_agent.batching import pack_batches
+from translation_agent.batching import parse_batch_response
+
+
+@pytest.fixture(autouse=True)
+def word_tokens():
+    # Count words instead of tiktoken tokens so the tests run offline
+    with patch(
+        "translation_agent.utils.num_tokens_in_string",
+        side_effect=lambda text: len(text.split()),
+    ):
+        yield
+
+
+def echo_batch(prompt, system_message=None, json_mode=False):
+    # Answer a batch prompt by upper-casing every segment
+    assert json_mode
+    start = prompt.index("{", prompt.index("segment IDs"))
+    segments, _ = json.JSONDecoder().raw_decode(prompt[start:])
+    return json.dumps(
+        {
+            "translations": {
+                key: (value["translation"] if isinstance(value, dict) else value).upper()
+                for key, value in segments.items()
+            }
+        }
+    )
+
+
+def test_pack_batches():
+    texts = ["one two", "three", "four five six", "seven"]
+    assert pack_batches(texts, 3) == [[0, 1], [2], [3]]
+    assert pack_batches(texts, 100) == [[0, 1, 2, 3]]
+    # A text larger than the budget still gets its own batch
+    assert pack_batches(["a b c d"], 2) == [[0]]
+
+
+def test_parse_batch_response():
+    assert parse_batch_response('{"translations": {"0": "a", "2": "c"}}', [0, 1, 2]) == {0: "a", 2: "c"}
+    assert parse_batch_response(
+        '{"translations": [{"id": 1, "translation": "b"}]}', [1]
+    ) == {1: "b"}
+    assert parse_batch_response("not json", [0]) == {}
+    assert parse_batch_response('{"translations": {"5": "x"}}', [0]) == {}
+
+
+def test_batched_initial_translation_packs_requests():
+    chunks = ["hello there", "general kenobi", "you are", "bold"]
+
+    with patch(
+        "translation_agent.utils.get_completion", side_effect=echo_batch
+    ) as mock_get_completion:
+        result = batched_initial_translation(
+            "English", "Spanish", chunks, 3, max_batch_tokens=4
+        )
+
+    assert result == [chunk.upper() for chunk in chunks]
+    assert mock_get_completion.call_count == 2
+
+
+def test_batched_initial_translation_falls_back_on_bad_json():
+    chunks = ["hello there", "general kenobi"]
+
+    with patch(
+        "translation_agent.utils.get_completion", return_value="no json here"
+    ), patch(
+        "translation_agent.utils.multichunk_initial_translation",
+        return_value=["hola", "general"],
+    ) as mock_multichunk:
+        result = batched_initial_translation("English", "Spanish", chunks, 3)
+
+    assert result == ["hola", "general"]
+    mock_multichunk.assert_called_once_with(
+        "English", "Spanish", chunks, 3, chunk_indices=[0, 1]
+    )
+
+
+def test_batched_improve_translation_independent_texts():
+    texts = ["Will you win?", "Free spins"]
+    translations = ["¿ganarás?", "giros gratis"]
+    reflections = ["ok", "ok"]
+
+    with patch(
+        "translation_agent.utils.get_completion", side_effect=echo_batch
+    ) as mock_get_completion:
+        result = batched_improve_translation(
+            "English", "Spanish", texts, translations, reflections, 3, independent=True
+        )
+
+    assert result == ["¿GANARÁS?", "GIROS GRATIS"]
+    assert mock_get_completion.call_count == 1
@@ -0,0 +1,112 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from translation_agent import cancellation
+from translation_agent.cancellation import (
+    CancelToken,
+    DeadlineExceededError,
+    SessionTokens,
+    TranslationCancelledError,
+)
+from translation_agent.utils import get_completion, translate
+
+
+def fake_raw_response(content):
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=None,
+    )
+    return SimpleNamespace(parse=lambda: response, retries_taken=0)
+
+
+@pytest.fixture
+def client():
+    client = MagicMock()
+    with patch("translation_agent.utils.client", client), patch(
+        "translation_agent.utils.num_tokens_in_string", return_value=3
+    ):
+        yield client
+
+
+def test_cancelled_job_stops_at_the_next_stage(client):
+    token = CancelToken()
+
+    def create(**request):
+        token.cancel("user left")
+        return fake_raw_response("hola")
+
+    client.chat.completions.with_raw_response.create.side_effect = create
+
+    with pytest.raises(TranslationCancelledError, match="user left"):
+        translate("English", "Spanish", "hello", 3, "Mexico", cancel_token=token)
+    assert client.chat.completions.with_raw_response.create.call_count == 1
+
+
+def test_deadline_times_out_the_request_in_flight(client):
+    def create(**request):
+        # A hung provider, cut off by the client timeout
+        time.sleep(request["timeout"])
+        raise TimeoutError("Request timed out.")
+
+    client.chat.completions.with_raw_response.create.side_effect = create
+    threads = threading.active_count()
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        translate("English", "Spanish", "hello", 3, "Mexico", timeout=0.3)
+    assert time.monotonic() - started < 1
+    assert threading.active_count() == threads
+
+    # The provider request itself was given no more time than the deadline
+    timeout = client.chat.completions.with_raw_response.create.call_args.kwargs[
+        "timeout"
+    ]
+    assert timeout <= 0.3
+
+
+def test_liveness_check_cancels(client):
+    client.chat.completions.with_raw_response.create.return_value = (
+        fake_raw_response("hola")
+    )
+    alive = [True]
+    with cancellation.scope(CancelToken(is_alive=lambda: alive[0])):
+        assert get_completion("hello") == "hola"
+        alive[0] = False
+        with pytest.raises(TranslationCancelledError, match="session closed"):
+            get_completion("hello again")
+
+
+def test_cancel_abandons_the_request_in_flight(client):
+    token = CancelToken()
+    release = threading.Event()
+
+    def create(**request):
+        token.cancel("user left")
+        release.wait(5)
+        return fake_raw_response("hola")
+
+    client.chat.completions.with_raw_response.create.side_effect = create
+
+    started = time.monotonic()
+    with pytest.raises(TranslationCancelledError, match="user left"):
+        with cancellation.scope(token):
+            get_completion("hello")
+    assert time.monotonic() - started < 1
+    release.set()
+
+
+def test_new_job_supersedes_the_session_previous_one():
+    sessions = SessionTokens()
+    first = sessions.start("session")
+    with sessions.job("session") as second:
+        assert first.cancelled
+        assert not second.cancelled
+        sessions.cancel("session")
+        with pytest.raises(TranslationCancelledError):
+            cancellation.checkpoint()
+    with sessions.job("session") as third:
+        assert not third.cancelled
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from translation_agent import instrumentation
+from translation_agent.cassette import CassetteMissError, requests, use_cassette
+from translation_agent.utils import get_completion
+
+
+def fake_raw_response(content):
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2),
+    )
+    return SimpleNamespace(parse=lambda: response, retries_taken=0)
+
+
+@pytest.mark.parametrize("name", ["traffic.jsonl", "traffic.jsonl.gz"])
+def test_recorded_calls_replay_without_the_client(tmp_path, name):
+    path = str(tmp_path / name)
+    client = MagicMock()
+    client.chat.completions.with_raw_response.create.side_effect = [
+        fake_raw_response("hola"),
+        fake_raw_response("adiós"),
+    ]
+    with patch("translation_agent.utils.client", client):
+        with use_cassette(path, mode="record"):
+            assert get_completion("hello") == "hola"
+            assert get_completion("bye") == "adiós"
+
+    assert [r["messages"][-1]["content"] for r in requests(path)] == [
+        "hello",
+        "bye",
+    ]
+
+    offline = MagicMock()
+    offline.chat.completions.with_raw_response.create.side_effect = (
+        AssertionError("no network in replay")
+    )
+    with patch("translation_agent.utils.client", offline):
+        with use_cassette(path), instrumentation.collect() as result:
+            assert get_completion("bye") == "adiós"
+            assert get_completion("hello") == "hola"
+
+    assert all(call.cache_hit for call in result.calls)
+    assert result.prompt_tokens == 20
+
+
+def test_replay_of_unrecorded_request_raises(tmp_path):
+    path = tmp_path / "empty.jsonl"
+    path.write_text("")
+    with use_cassette(str(path)), pytest.raises(CassetteMissError):
+        get_completion("hello")
+
+
+def test_replays_leave_the_adaptive_limit_alone(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    with use_cassette(str(path), mode="record"), patch(
+        "translation_agent.utils.client", MagicMock()
+    ) as client:
+        client.chat.completions.with_raw_response.create.return_value = (
+            fake_raw_response("hola")
+        )
+        get_completion("hello")
+
+    limiter = MagicMock(tpm=None)
+    with use_cassette(str(path)), patch(
+        "translation_agent.utils.rate_limiter", limiter
+    ):
+        for _ in range(3):
+            assert get_completion("hello") == "hola"
+    limiter.acquire.assert_called()
+    limiter.observe.assert_not_called()
@@ -0,0 +1,95 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from translation_agent.cli import iter_items, iter_json_array, main
+from translation_agent.instrumentation import CallRecord
+from translation_agent.instrumentation import TranslationResult
+from translation_agent.cli import run_batch
+
+
+DEFAULTS = {
+    "source_lang": "English",
+    "target_lang": "Spanish",
+    "country": "Mexico",
+    "tone": 3,
+    "max_tokens": 1000,
+    "batch_max_tokens": None,
+}
+
+
+def test_iter_items_jsonl_and_directory(tmp_path):
+    jsonl = tmp_path / "items.jsonl"
+    jsonl.write_text('{"text": "one"}\n\n{"id": "b", "source_text": "two"}\n')
+    assert [item["id"] for item in iter_items(str(jsonl))] == [0, "b"]
+
+    docs = tmp_path / "docs"
+    (docs / "sub").mkdir(parents=True)
+    (docs / "a.txt").write_text("hello")
+    (docs / "sub" / "b.md").write_text("world")
+    assert [item["id"] for item in iter_items(str(docs))] == ["a.txt", "sub/b.md"]
+
+
+def test_json_array_is_read_an_item_at_a_time(tmp_path):
+    items = [{"text": "one, [two]"}, {"id": "b", "text": "é " * 50}, {}]
+    array = tmp_path / "items.json"
+    array.write_text(" [\n" + ",\n".join(map(json.dumps, items)) + "\n] ")
+
+    with patch("translation_agent.cli.JSON_READ_SIZE", 7):
+        assert list(iter_items(str(array))) == [
+            {"text": "one, [two]", "id": 0},
+            {"id": "b", "text": "é " * 50},
+            {"id": 2},
+        ]
+        assert list(iter_json_array(io.StringIO(" [ ] "))) == []
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.StringIO('[{"text": "one"} {}]')))
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.StringIO('[{"text": "one"},')))
+
+
+def test_run_batch_writes_results_and_stats():
+    items = [{"id": i, "source_text": f"text {i}"} for i in range(5)]
+    items.append({"id": "empty", "source_text": ""})
+    output = io.StringIO()
+
+    with patch(
+        "translation_agent.utils.translate",
+        side_effect=lambda *args, **kwargs: TranslationResult(
+            args[2].upper(),
+            [CallRecord("initial", None, "gpt-4-turbo", prompt_tokens=7, completion_tokens=3)],
+        ),
+    ), patch("translation_agent.utils.num_tokens_in_string", return_value=2):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            stats = run_batch(iter(items), output, DEFAULTS, executor, max_in_flight=2)
+
+    records = {record["id"]: record for record in map(json.loads, output.getvalue().splitlines())}
+    assert records[3]["translation"] == "TEXT 3"
+    assert "error" in records["empty"]
+    assert stats["items"] == 6
+    assert stats["errors"] == 1
+    assert stats["source_tokens"] == 10
+    assert stats["prompt_tokens"] == 35
+    assert stats["completion_tokens"] == 15
+
+
+def test_stream_command_writes_chunks_as_they_are_translated(tmp_path):
+    source = tmp_path / "corpus.txt"
+    source.write_text("one two\n\nthree\n")
+    output = tmp_path / "corpus.es.txt"
+
+    with patch(
+        "translation_agent.streaming.translate_stream",
+        side_effect=lambda source_lang, target_lang, pieces, *args, **kwargs: (
+            piece.upper() for piece in pieces
+        ),
+    ) as translate_stream:
+        assert main(
+            ["stream", str(source), "-o", str(output), "--target-lang", "Spanish"]
+        ) == 0
+
+    assert output.read_text() == "ONE TWO\nTHREE\n"
+    assert translate_stream.call_args.kwargs["context_chunks"] == 1
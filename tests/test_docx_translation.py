@@ -0,0 +1,106 @@
+import json
+import re
+from unittest.mock import patch
+
+import docx
+
+from app import docx_translation
+
+
+def shout(source_lang, target_lang, texts, tone, max_batch_tokens):
+    # Upper-case the text but not the run tags
+    return [
+        re.sub(r"(?<=>)[^<]+|^[^<]+$", lambda m: m.group(0).upper(), text)
+        for text in texts
+    ]
+
+
+def make_docx(path):
+    document = docx.Document()
+    paragraph = document.add_paragraph("Hello ")
+    paragraph.add_run("bold").bold = True
+    paragraph.add_run(" wor")
+    paragraph.add_run("ld")  # same format as the run before, merged
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).merge(table.cell(0, 1)).text = "merged"
+    table.cell(1, 0).text = "Hello "
+    table.cell(1, 1).add_table(rows=1, cols=1).cell(0, 0).text = "nested"
+    document.sections[0].header.paragraphs[0].text = "header"
+    document.add_paragraph("")
+    document.save(path)
+
+
+def test_round_trip_keeps_structure_and_formatting(tmp_path):
+    source, output = tmp_path / "in.docx", tmp_path / "out.docx"
+    make_docx(source)
+    calls = []
+
+    def translate(*args):
+        calls.append(args[2])
+        return shout(*args)
+
+    count = docx_translation.translate_docx(
+        source, output, "English", "Spanish", translate=translate
+    )
+
+    assert count == 5
+    # "Hello " appears twice but is translated once
+    assert calls == [
+        ["<r0>Hello </r0><r1>bold</r1><r2> world</r2>", "merged", "Hello ",
+         "nested", "header"]
+    ]
+    translated = docx.Document(output)
+    runs = translated.paragraphs[0].runs
+    assert [run.text for run in runs] == ["HELLO ", "BOLD", " WORLD"]
+    assert runs[1].bold
+    table = translated.tables[0]
+    assert table.cell(0, 1).text == "MERGED"
+    assert table.cell(1, 1).tables[0].cell(0, 0).text == "NESTED"
+    assert translated.sections[0].header.paragraphs[0].text == "HEADER"
+    # The source document is left as it was
+    assert docx.Document(source).paragraphs[0].text == "Hello bold world"
+
+
+def test_reordered_and_lost_run_tags(tmp_path):
+    document = docx.Document()
+    paragraph = document.add_paragraph("red ")
+    paragraph.add_run("car").bold = True
+    segment, = docx_translation.extract_segments(document)
+
+    segment.write("<r1>coche</r1> <r0>rojo</r0>")
+    assert [run.text for run in paragraph.runs] == ["rojo", "coche "]
+
+    segment.write("coche rojo")
+    assert [run.text for run in paragraph.runs] == ["coche rojo", ""]
+
+
+def test_segments_go_through_the_batched_pipeline():
+    texts = ["one", "<r0>two</r0><r1>three</r1>"]
+    prompts = []
+
+    def get_completion(prompt, system_message=None, json_mode=False):
+        prompts.append(prompt)
+        if not json_mode:
+            return "ok"
+        if "improve" in prompt:
+            return json.dumps({"translations": {"0": "UNO", "1": "DOS"}})
+        return json.dumps({"translations": {"0": "uno"}})
+
+    batching = docx_translation.batching
+    with patch.object(
+        batching.utils, "num_tokens_in_string", return_value=1
+    ), patch.object(
+        batching.utils, "get_completion", side_effect=get_completion
+    ), patch.object(
+        batching.utils,
+        "one_chunk_initial_translation",
+        return_value="<r0>dos</r0><r1>tres</r1>",
+    ):
+        result = docx_translation.translate_texts(
+            "English", "Spanish", texts, max_batch_tokens=2
+        )
+
+    assert result == ["UNO", "DOS"]
+    # One initial batch, one reflection per segment, one improve batch
+    assert len(prompts) == 4
+    assert "<r0>...</r0>" in prompts[0] and "<r0>...</r0>" in prompts[-1]
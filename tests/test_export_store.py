@@ -0,0 +1,79 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docx
+import pytest
+
+from app.export_store import ExportStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    # No background cleanup, so tests that call cleanup() are not racing it
+    return ExportStore(
+        str(tmp_path / "outputs"), retention=60, cleanup_interval=None
+    )
+
+
+def test_exports_are_named_by_content(store):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        paths = list(
+            executor.map(store.write_text, [f"text {i % 4}" for i in range(32)])
+        )
+
+    assert len(set(paths)) == 4
+    for path in paths:
+        shard, key, name = path.split(os.sep)[-3:]
+        assert key.startswith(shard) and name == "translation.txt"
+    with open(paths[5], encoding="utf-8") as f:
+        assert f.read() == "text 1"
+    # Nothing is left half-written
+    assert not [
+        name
+        for _, _, names in os.walk(store.root)
+        for name in names
+        if name.endswith(".tmp")
+    ]
+
+
+def test_docx_and_jsonl_exports(store):
+    document = docx.Document(store.write_docx("Hola\nmundo"))
+    assert [p.text for p in document.paragraphs] == ["Hola", "mundo"]
+
+    path = store.write_jsonl([{"translation": "Hola"}, {"translation": "é"}])
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == [
+            {"translation": "Hola"},
+            {"translation": "é"},
+        ]
+
+
+def test_failed_export_leaves_no_file(store):
+    with pytest.raises(RuntimeError):
+        with store.open("doc.es.docx") as (temp_path, path):
+            with open(temp_path, "w") as f:
+                f.write("partial")
+            raise RuntimeError("cancelled")
+
+    assert not os.path.exists(path)
+    assert os.listdir(os.path.dirname(path)) == []
+
+
+def test_reexport_of_a_deleted_export_writes_it_again(store):
+    path = store.write_text("hola")
+    os.unlink(path)
+    assert store.write_text("hola") == path
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "hola"
+
+
+def test_cleanup_deletes_expired_exports(store):
+    old = store.write_text("old")
+    new = store.write_text("new")
+    past = time.time() - 120
+    os.utime(os.path.dirname(old), (past, past))
+
+    assert store.cleanup() == 1
+    assert not os.path.exists(old) and os.path.exists(new)
@@ -0,0 +1,33 @@
+from unittest.mock import patch
+
+import pymupdf
+
+from app import file_utils
+
+
+def make_pdf(path, pages):
+    doc = pymupdf.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(path)
+    doc.close()
+
+
+def test_pdf_pages_are_yielded_in_order(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path, [f"Page {i}" for i in range(5)])
+
+    pages = file_utils.iter_pdf_pages(path)
+    assert next(pages).strip() == "Page 0"
+    assert [page.strip() for page in pages] == [f"Page {i}" for i in range(1, 5)]
+
+
+def test_parallel_extraction_matches_sequential(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path, [f"Page {i}" for i in range(7)])
+
+    with patch.object(file_utils, "PARALLEL_PDF_MIN_PAGES", 1), patch.object(
+        file_utils, "PDF_PAGES_PER_TASK", 2
+    ):
+        parallel = file_utils.extract_pdf(path, workers=2)
+    assert parallel == file_utils.extract_pdf(path)
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from translation_agent import instrumentation
+from translation_agent.utils import translate
+
+
+def fake_raw_response(content, prompt_tokens, completion_tokens, retries=0):
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+        ),
+    )
+    return SimpleNamespace(parse=lambda: response, retries_taken=retries)
+
+
+@pytest.fixture
+def fake_client():
+    client = MagicMock()
+    client.chat.completions.with_raw_response.create.side_effect = [
+        fake_raw_response("hola", 100, 5, retries=1),
+        fake_raw_response("suggestions", 150, 40),
+        fake_raw_response("hola!", 200, 6),
+    ]
+    with patch("translation_agent.utils.client", client), patch(
+        "translation_agent.utils.num_tokens_in_string", return_value=3
+    ):
+        yield client
+
+
+class RecordingHook(instrumentation.Hook):
+    def __init__(self):
+        self.calls = []
+        self.results = []
+
+    def on_call(self, record):
+        self.calls.append(record)
+
+    def on_translation(self, result):
+        self.results.append(result)
+
+
+def test_translate_returns_result_with_per_stage_usage(fake_client):
+    hook = RecordingHook()
+    instrumentation.add_hook(hook)
+    try:
+        result = translate(
+            "English", "Spanish", "hello", 3, "Mexico", return_result=True
+        )
+    finally:
+        instrumentation.remove_hook(hook)
+
+    assert result.translation == "hola!"
+    assert [call.stage for call in result.calls] == [
+        "initial",
+        "reflection",
+        "improved",
+    ]
+    assert result.prompt_tokens == 450
+    assert result.completion_tokens == 51
+
+    stages = result.by_stage()
+    assert stages["initial"]["retries"] == 1
+    assert stages["reflection"]["completion_tokens"] == 40
+
+    assert hook.calls == result.calls
+    assert hook.results == [result]
+
+
+def test_failed_call_is_recorded(fake_client):
+    fake_client.chat.completions.with_raw_response.create.side_effect = RuntimeError("boom")
+
+    with instrumentation.collect() as result, pytest.raises(RuntimeError):
+        translate("English", "Spanish", "hello", 3, "Mexico")
+
+    assert len(result.calls) == 1
+    assert result.calls[0].error == "RuntimeError: boom"
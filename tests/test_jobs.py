@@ -0,0 +1,89 @@
+from unittest.mock import patch
+
+import pytest
+
+from translation_agent.jobs import JobStore
+from translation_agent.jobs import resumable_translation
+
+
+@pytest.fixture
+def store(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.db"))
+    yield job_store
+    job_store.close()
+
+
+def test_resumable_translation_skips_completed_cells(store):
+    chunks = ["First chunk. ", "Second chunk. ", "Third chunk."]
+    calls = []
+
+    def flaky_completion(prompt, system_message=None):
+        calls.append(prompt)
+        if len(calls) == 5:
+            raise RuntimeError("provider failure")
+        return f"output {len(calls)}"
+
+    with patch(
+        "translation_agent.utils.get_completion", side_effect=flaky_completion
+    ), pytest.raises(RuntimeError):
+        resumable_translation(store, "job-1", "English", "Spanish", chunks, 3)
+
+    # Three initial translations and one reflection survived the failure
+    assert len(store.load("job-1")) == 4
+
+    with patch(
+        "translation_agent.utils.get_completion", return_value="resumed"
+    ) as mock_get_completion:
+        result = resumable_translation(
+            store, "job-1", "English", "Spanish", chunks, 3
+        )
+
+    assert mock_get_completion.call_count == 5
+    assert result == ["resumed"] * 3
+    assert len(store.load("job-1")) == 9
+
+
+def test_resumable_translation_single_chunk(store):
+    with patch(
+        "translation_agent.utils.get_completion", return_value="hola"
+    ) as mock_get_completion:
+        result = resumable_translation(
+            store, "job-2", "English", "Spanish", ["hello"], 3, "Mexico"
+        )
+        assert result == ["hola"]
+        assert mock_get_completion.call_count == 3
+
+        # Nothing is left to run for a finished job
+        resumable_translation(
+            store, "job-2", "English", "Spanish", ["hello"], 3, "Mexico"
+        )
+        assert mock_get_completion.call_count == 3
+
+    store.delete("job-2")
+    assert store.load("job-2") == {}
+
+
+def test_translate_closes_the_store_it_opens(tmp_path):
+    from translation_agent.utils import translate
+
+    opened = []
+
+    class RecordingStore(JobStore):
+        def __init__(self):
+            super().__init__(str(tmp_path / "jobs.db"))
+            opened.append(self)
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    with patch("translation_agent.jobs.JobStore", RecordingStore), patch(
+        "translation_agent.utils.num_tokens_in_string", return_value=2
+    ), patch("translation_agent.utils.get_completion", return_value="hola"):
+        assert translate("English", "Spanish", "hi", 3, "", job_id="j") == "hola"
+    assert opened and opened[0].closed
+
+    with pytest.raises(ValueError):
+        translate(
+            "English", "Spanish", "hi", 3, "", job_id="j", batch_max_tokens=50
+        )
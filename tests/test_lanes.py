@@ -0,0 +1,106 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from translation_agent import lanes
+from translation_agent.lanes import LaneScheduler
+from translation_agent.ratelimit import RateLimiter
+from translation_agent.utils import get_completion
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def serve_queued(scheduler, queued):
+    """Queue callers behind a held turn, release it and return the serve order."""
+    served = []
+
+    def call(name):
+        with scheduler.turn(name):
+            served.append(name)
+
+    threads = []
+    with scheduler.turn("batch"):
+        for name in queued:
+            thread = threading.Thread(target=call, args=(name,))
+            thread.start()
+            threads.append(thread)
+            wait_for(lambda: sum(scheduler.waiting().values()) == len(threads))
+    for thread in threads:
+        thread.join()
+    return served
+
+
+def test_interactive_calls_overtake_a_queued_batch():
+    served = serve_queued(
+        LaneScheduler(), ["batch"] * 4 + ["interactive"] * 2
+    )
+    assert served == ["interactive", "interactive"] + ["batch"] * 4
+
+
+def test_busy_lanes_share_turns_by_weight():
+    served = serve_queued(
+        LaneScheduler({"interactive": 3, "batch": 1}),
+        ["batch"] * 4 + ["interactive"] * 12,
+    )
+    # After the held batch turn, interactive gets three turns per batch turn
+    assert served[6:14].count("interactive") == 6
+
+
+def test_lane_context():
+    assert lanes.current_lane() == lanes.DEFAULT_LANE
+    with lanes.lane("interactive"):
+        assert lanes.current_lane() == "interactive"
+    with pytest.raises(ValueError):
+        with lanes.lane("urgent"):
+            pass
+
+
+def test_get_completion_shares_slots_by_lane_weight():
+    served = []
+    count = iter(range(10**6))
+
+    def create(**request):
+        served.append(lanes.current_lane())
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+            usage=None,
+        )
+        return SimpleNamespace(parse=lambda: response, retries_taken=0)
+
+    client = MagicMock()
+    client.chat.completions.with_raw_response.create.side_effect = create
+    done = threading.Event()
+
+    def caller(lane):
+        with lanes.lane(lane):
+            while not done.is_set():
+                # Distinct prompts, so no two calls are coalesced
+                get_completion(f"text {next(count)}")
+
+    with patch("translation_agent.utils.client", client), patch(
+        "translation_agent.utils.rate_limiter", RateLimiter(3000)
+    ), patch("translation_agent.utils.scheduler", LaneScheduler()), patch(
+        "translation_agent.utils.single_flight", None
+    ), patch("translation_agent.utils.num_tokens_in_string", return_value=1):
+        threads = [
+            threading.Thread(target=caller, args=(lane,))
+            for lane in ["batch"] * 8 + ["interactive"]
+        ]
+        for thread in threads:
+            thread.start()
+        wait_for(lambda: len(served) >= 60)
+        done.set()
+        for thread in threads:
+            thread.join()
+
+    # With both lanes busy, interactive gets 8 slots per 2 batch slots, far
+    # more than the 1 in 9 its single caller would get first come first served
+    assert served[10:60].count("interactive") >= 25
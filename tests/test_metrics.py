@@ -0,0 +1,73 @@
+import json
+import urllib.request
+
+import pytest
+
+from translation_agent import instrumentation, metrics
+from translation_agent.instrumentation import CallRecord
+
+
+def test_histogram_and_counter_render():
+    histogram = metrics.Histogram("test_seconds", "Test latency", ["stage"], buckets=(1, 5))
+    histogram.observe(0.5, stage="initial")
+    histogram.observe(3, stage="initial")
+    counter = metrics.Counter("test_total", "Test counter", ["status"])
+    counter.inc(status="ok")
+
+    rendered = histogram.render() + "\n" + counter.render()
+    assert 'test_seconds_bucket{stage="initial",le="1"} 1' in rendered
+    assert 'test_seconds_bucket{stage="initial",le="5"} 2' in rendered
+    assert 'test_seconds_bucket{stage="initial",le="+Inf"} 2' in rendered
+    assert 'test_seconds_count{stage="initial"} 2' in rendered
+    assert 'test_total{status="ok"} 1' in rendered
+
+
+def test_track_request_and_spans():
+    before = metrics.REQUESTS.value(entry="test", status="ok")
+
+    @metrics.track_request("test")
+    def handler():
+        assert metrics.IN_FLIGHT.value(entry="test") == 1
+        with metrics.track_stage("initial"):
+            pass
+
+    handler()
+
+    assert metrics.REQUESTS.value(entry="test", status="ok") == before + 1
+    assert metrics.IN_FLIGHT.value(entry="test") == 0
+    stage_span, request_span = list(metrics.finished_spans)[-2:]
+    assert request_span["name"] == "test"
+    assert stage_span["parent_id"] == request_span["span_id"]
+    assert stage_span["trace_id"] == request_span["trace_id"]
+
+
+@pytest.fixture
+def server():
+    server = metrics.start_http_server(0)
+    yield server
+    metrics.stop_http_server()
+    assert not any(
+        isinstance(hook, metrics.MetricsHook) for hook in instrumentation.hooks
+    )
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter("test_escaped_total", "Escaping", ["path"])
+    counter.inc(path='C:\\docs\n"a"')
+    assert 'test_escaped_total{path="C:\\\\docs\\n\\"a\\""} 1' in (
+        counter.render()
+    )
+
+
+def test_http_endpoint_serves_metrics_and_traces(server):
+    metrics.MetricsHook().on_call(
+        CallRecord("reflection", 0, "gpt-4o", wall_seconds=1.2, prompt_tokens=10)
+    )
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    body = urllib.request.urlopen(f"{base}/metrics").read().decode()
+    assert 'llm_calls_total{stage="reflection",model="gpt-4o",status="ok"}' in body
+    assert 'llm_tokens_total{stage="reflection",kind="prompt"} 10' in body
+
+    traces = json.loads(urllib.request.urlopen(f"{base}/traces").read())
+    assert isinstance(traces, list)
@@ -0,0 +1,46 @@
+import json
+
+import openai
+import pytest
+
+from bench.mock_llm import MockLLMServer
+from bench.mock_llm import echo
+
+
+@pytest.fixture
+def server():
+    with MockLLMServer(latency="fixed:0") as mock:
+        yield mock
+
+
+def test_echo_returns_the_part_to_translate():
+    prompt = "Context\n<TRANSLATE_THIS>\nHello\n</TRANSLATE_THIS>\n\nOutput only the translation."
+    assert echo(prompt, json_mode=False) == "Hello"
+
+    batch = 'given below as a JSON object mapping segment IDs to source text:\n{"0": "a", "1": "b"}\n\nRespond only with JSON.'
+    assert json.loads(echo(batch, json_mode=True)) == {"translations": {"0": "a", "1": "b"}}
+
+
+def test_openai_client_against_mock(server):
+    client = openai.OpenAI(api_key="mock", base_url=server.base_url)
+    response = client.chat.completions.create(
+        model="mock",
+        messages=[
+            {"role": "system", "content": "You are a translator."},
+            {"role": "user", "content": "<TRANSLATE_THIS>\nHola\n</TRANSLATE_THIS>\nOutput it."},
+        ],
+    )
+
+    assert response.choices[0].message.content == "Hola"
+    assert response.usage.prompt_tokens > 0
+    assert server.stats["requests"] == 1
+
+
+def test_rate_limit_injection():
+    with MockLLMServer(rpm=1) as mock:
+        client = openai.OpenAI(api_key="mock", base_url=mock.base_url, max_retries=0)
+        messages = [{"role": "user", "content": "Output: hi"}]
+        client.chat.completions.create(model="mock", messages=messages)
+        with pytest.raises(openai.RateLimitError):
+            client.chat.completions.create(model="mock", messages=messages)
+    assert mock.stats["rate_limited"] == 1
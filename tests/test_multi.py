@@ -0,0 +1,40 @@
+from unittest.mock import patch
+
+from translation_agent.multi import analyze_source
+from translation_agent.multi import translate_multi
+
+
+def fake_completion(prompt, system_message=None):
+    # The system message names the language pair, so echo the target back
+    return system_message.split(" to ")[1].split(".")[0]
+
+
+def test_translate_multi_analyzes_source_once():
+    with patch(
+        "translation_agent.utils.num_tokens_in_string", return_value=10
+    ) as mock_num_tokens, patch(
+        "translation_agent.utils.get_completion", side_effect=fake_completion
+    ) as mock_get_completion:
+        result = translate_multi(
+            "English",
+            "Hello there",
+            ["Spanish", ("French", "France"), "Spanish"],
+        )
+
+    assert result == {"Spanish": "Spanish", ("French", "France"): "French"}
+    mock_num_tokens.assert_called_once_with("Hello there")
+    # Three stages for each of the two distinct targets
+    assert mock_get_completion.call_count == 6
+
+
+def test_analyze_source_splits_long_text():
+    with patch(
+        "translation_agent.utils.num_tokens_in_string", return_value=2500
+    ), patch(
+        "translation_agent.utils.split_source_text", return_value=["a", "b", "c"]
+    ) as mock_split:
+        analysis = analyze_source("a b c", max_tokens=1000)
+
+    assert analysis.chunks == ["a", "b", "c"]
+    assert not analysis.single_chunk
+    mock_split.assert_called_once_with("a b c", 2500, 1000)
@@ -0,0 +1,44 @@
+import json
+import os
+
+import src.translation_agent.utils as utils
+from app import patch as app_patch
+
+
+def test_model_load_keeps_the_router_until_its_config_changes(
+    tmp_path, monkeypatch
+):
+    routes = tmp_path / "routes.json"
+    routes.write_text(json.dumps([{"endpoint": "Ollama", "model": "llama3"}]))
+    monkeypatch.setenv("TRANSLATION_AGENT_ROUTES", str(routes))
+    for name in ("client", "rate_limiter", "router"):
+        monkeypatch.setattr(utils, name, None)
+    monkeypatch.setattr(app_patch, "_router_config", None)
+
+    app_patch.model_load("Ollama", "", "llama3")
+    router = utils.router
+    app_patch.model_load("Ollama", "", "llama3")
+    assert router is not None and utils.router is router
+
+    os.utime(routes, (0, 0))
+    app_patch.model_load("Ollama", "", "llama3")
+    assert utils.router is not router
+
+
+def test_model_load_keeps_the_limiter_while_the_rpm_is_unchanged(
+    monkeypatch,
+):
+    monkeypatch.delenv("TRANSLATION_AGENT_ROUTES", raising=False)
+    for name in ("client", "rate_limiter", "router"):
+        monkeypatch.setattr(utils, name, None)
+
+    app_patch.model_load("Ollama", "", "llama3", rpm=60)
+    limiter = utils.rate_limiter
+    limiter.observe({}, throttled=True)
+    app_patch.model_load("Ollama", "", "llama3", rpm=60)
+    # The backoff the limiter learned survives the next request
+    assert utils.rate_limiter is limiter and limiter.rpm == 30
+
+    app_patch.model_load("Ollama", "", "llama3", rpm=120)
+    assert utils.rate_limiter is not limiter
+    assert utils.rate_limiter.max_rpm == 120
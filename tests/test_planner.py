@@ -0,0 +1,43 @@
+from unittest.mock import patch
+
+import pytest
+
+from translation_agent.planner import plan
+
+
+@pytest.fixture(autouse=True)
+def word_tokens():
+    with patch(
+        "translation_agent.utils.num_tokens_in_string",
+        side_effect=lambda text: len(text.split()),
+    ):
+        yield
+
+
+def test_plan_single_chunk():
+    estimated = plan("one two three", max_tokens=100)
+
+    assert estimated.chunks == 1
+    assert {name: stage.calls for name, stage in estimated.stages.items()} == {
+        "initial": 1,
+        "reflection": 1,
+        "improved": 1,
+    }
+    assert estimated.input_tokens > 3 * 3
+
+
+def test_plan_multichunk_counts_repeated_context_and_rate_limit():
+    chunks = ["a b c d", "e f g h", "i j k l"]
+    with patch("translation_agent.utils.split_source_text", return_value=chunks):
+        estimated = plan(" ".join(chunks), max_tokens=5, rpm=6)
+        batched = plan(" ".join(chunks), max_tokens=5, batch_max_tokens=8)
+
+    assert estimated.calls == 9
+    # Every initial-translation prompt carries the whole text as context
+    assert estimated.stages["initial"].input_tokens >= 3 * (12 + 4)
+    # Nine calls at six per minute take at least 90 seconds
+    assert estimated.seconds >= 90
+
+    assert batched.stages["initial"].calls == 2
+    assert batched.stages["reflection"].calls == 3
+    assert batched.stages["improved"].calls == 3
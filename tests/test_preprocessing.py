@@ -0,0 +1,38 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from translation_agent import preprocessing
+from translation_agent.utils import count_and_split
+
+
+@pytest.fixture
+def pool():
+    preprocessing.set_workers(2)
+    yield
+    preprocessing.set_workers(None)
+
+
+def test_steps_run_inline_without_workers():
+    assert not preprocessing.offloads(10**9)
+    assert preprocessing.run(os.getpid) == os.getpid()
+
+
+def test_large_inputs_go_to_the_pool(pool):
+    size = preprocessing.MIN_OFFLOAD_SIZE
+    assert preprocessing.offloads(size) and not preprocessing.offloads(size - 1)
+    assert preprocessing.run(os.getpid, size=size) != os.getpid()
+    assert preprocessing.run(os.getpid, size=size - 1) == os.getpid()
+    assert preprocessing.run(divmod, 7, 2) == (3, 1)
+
+
+def test_only_long_texts_are_split():
+    with patch(
+        "translation_agent.utils.num_tokens_in_string", return_value=2
+    ), patch("translation_agent.utils.split_source_text") as split:
+        split.return_value = ["one ", "two"]
+        assert count_and_split("one two", max_tokens=10) == (2, ["one two"])
+        split.assert_not_called()
+        assert count_and_split("one two", max_tokens=2) == (2, ["one ", "two"])
+        split.assert_called_once_with("one two", 2, 2)
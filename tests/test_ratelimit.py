@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from translation_agent.ratelimit import (
+    AdaptiveRateLimiter,
+    RateLimiter,
+    RateStore,
+    SQLiteRateStore,
+    parse_duration,
+    store_from_url,
+)
+from translation_agent.utils import get_completion
+
+
+def test_parse_duration():
+    assert parse_duration("1s") == 1
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == 0.02
+    assert parse_duration("1.5") == 1.5
+    assert parse_duration("") is None
+
+
+def test_aimd_within_bounds_and_provider_limit():
+    limiter = AdaptiveRateLimiter(100, tpm=10_000, min_rpm=10, max_rpm=1000)
+
+    limiter.observe({}, throttled=True)
+    assert limiter.rpm == 50
+    assert limiter.tpm == 5000
+    for _ in range(5):
+        limiter.observe({}, throttled=True)
+    assert limiter.rpm == 10
+
+    limiter.observe({})
+    assert limiter.rpm == 11
+
+    limiter.observe({"x-ratelimit-limit-requests": "500"})
+    limiter.rpm = 499.5
+    limiter.observe({})
+    assert limiter.rpm == 500
+
+
+def test_exhausted_budget_waits_for_reset():
+    limiter = AdaptiveRateLimiter(600)
+    limiter.observe(
+        {
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "2s",
+        }
+    )
+    assert 1.5 < limiter.delay() <= 2
+
+
+def test_get_completion_feeds_response_headers_to_the_limiter():
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="hola"))],
+        usage=None,
+    )
+    client = MagicMock()
+    client.chat.completions.with_raw_response.create.return_value = (
+        SimpleNamespace(
+            parse=lambda: response,
+            retries_taken=1,
+            headers={"x-ratelimit-limit-requests": "30", "server": "x"},
+        )
+    )
+    limiter = AdaptiveRateLimiter(40)
+
+    with patch("translation_agent.utils.client", client), patch(
+        "translation_agent.utils.rate_limiter", limiter
+    ):
+        assert get_completion("hello") == "hola"
+
+    # A call the client retried, e.g. after a 502, is not a 429: the budget
+    # only drops to the reported 30
+    assert limiter.rpm == 30
+
+
+def test_rate_limit_error_halves_the_budget():
+    import httpx
+    import openai
+
+    response = httpx.Response(
+        429, request=httpx.Request("POST", "https://example.test")
+    )
+    client = MagicMock()
+    client.chat.completions.with_raw_response.create.side_effect = (
+        openai.RateLimitError("slow down", response=response, body=None)
+    )
+    limiter = AdaptiveRateLimiter(40)
+
+    with patch("translation_agent.utils.client", client), patch(
+        "translation_agent.utils.rate_limiter", limiter
+    ), pytest.raises(openai.RateLimitError):
+        get_completion("hello")
+
+    assert limiter.rpm == 20
+
+
+def test_sqlite_store_shares_one_budget_between_limiters(tmp_path):
+    url = f"sqlite://{tmp_path / 'rate.db'}"
+    # Separate stores on one file stand in for separate processes
+    first = RateLimiter(60, store_from_url(url))
+    second = RateLimiter(60, store_from_url(url))
+
+    assert first.acquire() == 0
+    assert 0.9 < second.delay() <= 1.0
+    assert RateLimiter(60, store_from_url(url), key="other").delay() == 0
+
+    second.store.defer("requests", 5)
+    assert 4.5 < first.delay() <= 5
+
+
+def test_rate_store_is_abstract():
+    with pytest.raises(TypeError):
+        RateStore()
+
+
+def test_unknown_store_url():
+    assert store_from_url("") is None
+    assert isinstance(store_from_url("sqlite://rate.db"), SQLiteRateStore)
+    with pytest.raises(ValueError):
+        store_from_url("redis://localhost")
@@ -0,0 +1,125 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from translation_agent.jobs import JobStore
+from translation_agent.resources import (
+    protect,
+    restore,
+    translate_json,
+    translate_po,
+)
+
+
+@pytest.fixture
+def completion():
+    # Upper-case every string of a batch, leaving the tokens alone
+    def complete(prompt, system_message=None, json_mode=False):
+        start = prompt.index("{", prompt.index("string IDs"))
+        strings, _ = json.JSONDecoder().raw_decode(prompt[start:])
+        return json.dumps(
+            {"translations": {k: v.upper() for k, v in strings.items()}}
+        )
+
+    with patch(
+        "translation_agent.utils.num_tokens_in_string", return_value=1
+    ), patch(
+        "translation_agent.utils.get_completion", side_effect=complete
+    ) as get_completion:
+        yield get_completion
+
+
+def test_placeholders_are_protected():
+    text = "{count, plural, one {# file by {user}} other {# files}} %(n)d"
+    masked, placeholders = protect(text)
+    assert masked == "⟦0⟧ file by ⟦1⟧ files⟦2⟧ ⟦3⟧"
+    assert restore(masked, placeholders) == text
+    assert protect("100% <b>sure</b>") == ("100% ⟦0⟧sure⟦1⟧", ["<b>", "</b>"])
+    # A lost or repeated token is rejected
+    assert restore("⟦0⟧ files", placeholders) is None
+    assert restore("⟦0⟧⟦0⟧⟦1⟧⟦2⟧⟦3⟧", placeholders) is None
+
+
+def test_json_values_are_translated_once(completion):
+    source = json.dumps(
+        {
+            "title": "Hello {name}",
+            "menu": {"save": "Save", "items": ["Save", "Quit"], "count": 3},
+            "id": "{id}",
+        },
+        indent=2,
+    )
+    translated = json.loads(translate_json("English", "Spanish", source))
+
+    assert translated == {
+        "title": "HELLO {name}",
+        "menu": {"save": "SAVE", "items": ["SAVE", "QUIT"], "count": 3},
+        "id": "{id}",
+    }
+    prompt = completion.call_args.args[0]
+    assert prompt.count('"Save"') == 1 and "{name}" not in prompt
+
+
+def test_unchanged_strings_are_reused_between_runs(completion, tmp_path):
+    store = JobStore(str(tmp_path / "strings.db"))
+    translate_json("English", "Spanish", '{"a": "Open", "b": "Close"}', store=store)
+    assert completion.call_count == 1
+
+    translated = translate_json(
+        "English", "Spanish", '{"a": "Open", "b": "Exit"}', store=store
+    )
+    assert json.loads(translated) == {"a": "OPEN", "b": "EXIT"}
+    assert '"Open"' not in completion.call_args.args[0]
+
+
+def test_po_fills_untranslated_and_fuzzy_entries(completion):
+    source = """msgid ""
+msgstr ""
+"Plural-Forms: nplurals=3; plural=n%10==1 ? 0 : 1;\\n"
+
+msgid "Save"
+msgstr "Guardar"
+
+#, fuzzy, python-format
+#| msgid "Open %s"
+msgid "Open %(name)s"
+msgstr "Abrir %s"
+
+msgid "One file"
+msgid_plural "%d files"
+msgstr[0] ""
+msgstr[1] ""
+msgstr[2] ""
+
+msgid ""
+"Line one\\n"
+"Line two"
+msgstr ""
+"""
+    translated = translate_po("English", "Spanish", source)
+
+    assert translated == """msgid ""
+msgstr ""
+"Plural-Forms: nplurals=3; plural=n%10==1 ? 0 : 1;\\n"
+
+msgid "Save"
+msgstr "Guardar"
+
+#, python-format
+msgid "Open %(name)s"
+msgstr "OPEN %(name)s"
+
+msgid "One file"
+msgid_plural "%d files"
+msgstr[0] "ONE FILE"
+msgstr[1] "%d FILES"
+msgstr[2] "%d FILES"
+
+msgid ""
+"Line one\\n"
+"Line two"
+msgstr ""
+"LINE ONE\\n"
+"LINE TWO"
+"""
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import httpx
+import openai
+import pytest
+
+from translation_agent import instrumentation
+from translation_agent.router import Backend, NoBackendError, Router
+from translation_agent.utils import get_completion
+
+
+def fake_client(*outcomes):
+    client = MagicMock()
+    effects = []
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            effects.append(outcome)
+            continue
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=outcome))],
+            usage=None,
+        )
+        effects.append(SimpleNamespace(parse=lambda r=response: r))
+    client.chat.completions.with_raw_response.create.side_effect = effects
+    return client
+
+
+def connection_error():
+    request = httpx.Request("POST", "http://backend/v1/chat/completions")
+    return openai.APIConnectionError(request=request)
+
+
+def test_fails_over_and_takes_a_failing_backend_out_of_rotation():
+    primary = Backend("primary", fake_client(connection_error()), "big")
+    secondary = Backend("secondary", fake_client("hola", "adiós"), "small")
+    router = Router([primary, secondary], alpha=0.5, error_threshold=0.5)
+
+    with patch("translation_agent.utils.router", router), patch(
+        "translation_agent.utils.single_flight", None
+    ), instrumentation.collect() as result:
+        assert get_completion("hello", model="ignored") == "hola"
+        assert get_completion("bye") == "adiós"
+
+    create = secondary.client.chat.completions.with_raw_response.create
+    assert [call.kwargs["model"] for call in create.call_args_list] == [
+        "small",
+        "small",
+    ]
+    assert primary.client.chat.completions.with_raw_response.create.call_count == 1
+    assert not router.snapshot()[0]["healthy"]
+    assert [call.model for call in result.calls] == [
+        "secondary/small",
+        "secondary/small",
+    ]
+
+
+def test_prefers_lower_latency_and_respects_stage_allow_lists():
+    slow = Backend("slow", MagicMock(), "a", latency=2.0)
+    fast = Backend("fast", MagicMock(), "b", latency=0.5)
+    strong = Backend("strong", MagicMock(), "c", stages=["reflection"])
+    router = Router([slow, fast, strong])
+
+    assert router.candidates("initial") == [fast, slow]
+    assert router.candidates("reflection")[0] is strong
+
+    with pytest.raises(NoBackendError):
+        Router([strong]).candidates("initial")
+
+
+def test_errors_that_would_fail_everywhere_are_not_retried():
+    response = httpx.Response(
+        400, request=httpx.Request("POST", "http://backend/v1")
+    )
+    bad_request = openai.BadRequestError("bad", response=response, body=None)
+    first = Backend("first", fake_client(bad_request), "a")
+    second = Backend("second", fake_client("hola"), "b")
+
+    with pytest.raises(openai.BadRequestError):
+        Router([first, second]).send({"model": "x", "messages": []})
+    assert second.client.chat.completions.with_raw_response.create.call_count == 0
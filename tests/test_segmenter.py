@@ -0,0 +1,125 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from translation_agent.segmenter import segment, translate_segmented
+
+
+PYTHON = '''#!/usr/bin/env python
+"""Tools for the demo."""
+import os  # noqa: F401
+
+
+def area(width, height):
+    """
+    Return the area.
+
+    Args:
+        width: in metres
+    """
+    # Multiply the sides,
+    # then return
+    return width * height  # square metres
+'''
+
+CPP = """/**
+ * Add two numbers.
+ *
+ * Never overflows.
+ */
+int add(int a, int b) {
+    // Plain sum
+    const char* s = "// not a comment";
+    return a + b; /* done */
+}
+"""
+
+MARKDOWN = """# Install
+
+Run `pip install x` and open [the docs](https://example.com).
+
+```bash
+pip install x  # a comment in code
+```
+
+- First step
+| Name | Value |
+|------|-------|
+| size | 3 |
+"""
+
+
+def translatable(spans):
+    return [span.text for span in spans if span.translatable]
+
+
+@pytest.mark.parametrize(
+    "source, file_format", [(PYTHON, "py"), (CPP, "cpp"), (MARKDOWN, "md")]
+)
+def test_spans_add_up_to_the_source(source, file_format):
+    spans = segment(source, file_format)
+    assert "".join(span.render() for span in spans) == source
+
+
+def test_python_comments_and_docstrings():
+    assert translatable(segment(PYTHON, "py")) == [
+        "Tools for the demo.",
+        "Return the area.\n\nArgs:\n    width: in metres",
+        "Multiply the sides,\nthen return",
+        "square metres",
+    ]
+
+
+def test_cpp_comments():
+    assert translatable(segment(CPP, "cpp")) == [
+        "Add two numbers.\n\nNever overflows.",
+        "Plain sum",
+        "done",
+    ]
+
+
+def test_markdown_prose():
+    assert translatable(segment(MARKDOWN, "md")) == [
+        "Install",
+        "Run `pip install x` and open [the docs](https://example.com).",
+        "First step",
+        "Name",
+        "Value",
+        "size",
+    ]
+
+
+def test_only_prose_is_sent_and_code_is_untouched():
+    def complete(prompt, system_message=None, json_mode=False):
+        start = prompt.index("{", prompt.index("string IDs"))
+        strings, _ = json.JSONDecoder().raw_decode(prompt[start:])
+        # Rewrap a multi-line comment onto one line
+        return json.dumps(
+            {
+                "translations": {
+                    k: v.upper().replace("\n", " ") for k, v in strings.items()
+                }
+            }
+        )
+
+    with patch(
+        "translation_agent.utils.num_tokens_in_string", return_value=1
+    ), patch(
+        "translation_agent.utils.get_completion", side_effect=complete
+    ) as get_completion:
+        translated = translate_segmented(
+            "English", "Spanish", PYTHON, file_format="py"
+        )
+
+    assert "import os" not in get_completion.call_args.args[0]
+    assert translated == PYTHON.replace(
+        "Tools for the demo.", "TOOLS FOR THE DEMO."
+    ).replace(
+        "Return the area.\n\n    Args:\n        width: in metres",
+        "RETURN THE AREA.  ARGS:     WIDTH: IN METRES",
+    ).replace(
+        "# Multiply the sides,\n    # then return", "# MULTIPLY THE SIDES, THEN RETURN"
+    ).replace(
+        "# square metres", "# SQUARE METRES"
+    )
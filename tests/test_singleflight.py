@@ -0,0 +1,77 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from translation_agent import instrumentation
+from translation_agent.singleflight import SingleFlight
+from translation_agent.utils import get_completion
+
+
+def fake_raw_response(content):
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2),
+    )
+    return SimpleNamespace(parse=lambda: response, retries_taken=0)
+
+
+def test_concurrent_identical_calls_share_one_request():
+    release = threading.Event()
+    calls = []
+
+    def create(**request):
+        calls.append(request)
+        release.wait(5)
+        return fake_raw_response("hola")
+
+    client = MagicMock()
+    client.chat.completions.with_raw_response.create.side_effect = create
+    flight = SingleFlight()
+
+    def call():
+        with instrumentation.collect() as result:
+            content = get_completion("hello")
+        return content, result.calls[0]
+
+    with patch("translation_agent.utils.client", client), patch(
+        "translation_agent.utils.single_flight", flight
+    ):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(call) for _ in range(4)]
+            time.sleep(0.2)  # let every caller join the flight
+            release.set()
+            outcomes = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert [content for content, _ in outcomes] == ["hola"] * 4
+    records = [record for _, record in outcomes]
+    assert sum(record.prompt_tokens for record in records) == 10
+    assert sum(record.cache_hit for record in records) == 3
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        leader = executor.submit(flight.do, "key", failing)
+        started.wait(5)
+        waiters = [executor.submit(flight.do, "key", failing) for _ in range(2)]
+        time.sleep(0.2)
+        release.set()
+        for future in [leader, *waiters]:
+            with pytest.raises(RuntimeError, match="upstream down"):
+                future.result()
+
+    assert flight.in_flight() == 0
+    assert flight.do("key", lambda: "ok") == ("ok", False)
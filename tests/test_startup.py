@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_package_is_cheap():
+    # No API key is needed, and no heavy dependency is loaded, until a
+    # translation actually needs one
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = os.pathsep.join([ROOT, os.path.join(ROOT, "src")])
+    probe = (
+        "import sys, translation_agent, translation_agent.cli, app.process\n"
+        "heavy = ('openai', 'tiktoken', 'langchain_text_splitters', 'pandas',"
+        " 'gradio', 'streamlit', 'pymupdf', 'docx')\n"
+        "print(','.join(m for m in heavy if m in sys.modules))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip() == ""
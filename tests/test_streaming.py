@@ -0,0 +1,79 @@
+from unittest.mock import patch
+
+import re
+
+from translation_agent.streaming import (
+    drop_blank_lines,
+    iter_chunks,
+    iter_file,
+    iter_file_chunks,
+    translate_stream,
+)
+
+
+def count_words(text):
+    return len(text.split())
+
+
+@patch("translation_agent.utils.num_tokens_in_string", side_effect=count_words)
+def test_pieces_are_packed_into_token_budgeted_chunks(_):
+    pieces = ["one two ", "three ", "four five six ", "seven "]
+    chunks = list(iter_chunks(pieces, max_tokens=3))
+    assert chunks == ["one two three ", "four five six ", "seven "]
+
+
+@patch("translation_agent.utils.num_tokens_in_string", side_effect=count_words)
+def test_translate_stream_yields_chunks_before_the_input_ends(_):
+    read = []
+
+    def pages():
+        for page in ["a b ", "c d ", "e f "]:
+            read.append(page)
+            yield page
+
+    prompts = []
+
+    def fake_completion(prompt, *args, **kwargs):
+        prompts.append(prompt)
+        return "translated"
+
+    with patch(
+        "translation_agent.utils.get_completion", side_effect=fake_completion
+    ):
+        stream = translate_stream("English", "Spanish", pages(), 3, max_tokens=2)
+        assert next(stream) == "translated"
+        # The first chunk only needed the next one as context
+        assert read == ["a b ", "c d "]
+        assert list(stream) == ["translated", "translated"]
+
+    assert len(prompts) == 9
+    assert "<TRANSLATE_THIS>a b </TRANSLATE_THIS>c d " in prompts[0]
+
+
+def test_blank_lines_are_dropped_across_pieces():
+    text = "one\n\n  \ntwo  \n\t\nthree\n \n"
+    pieces = ["one\n\n ", " \ntw", "o  \n\t", "\nthree\n", " \n"]
+    assert "".join(drop_blank_lines(pieces)) == re.sub(
+        r"(?m)^\s*$\n?", "", text
+    )
+    # Whitespace at the start of a line is kept once the line has text
+    assert "".join(drop_blank_lines(["  ", " x\n"])) == "   x\n"
+
+
+def test_iter_file_reads_in_blocks(tmp_path):
+    path = tmp_path / "corpus.txt"
+    path.write_bytes("día uno\r\n\r\nday two\n".encode("utf-8") * 50)
+    pieces = list(iter_file(str(path), block_size=16))
+    assert "".join(pieces) == "día uno\n\nday two\n" * 50
+    assert all(len(piece.encode("utf-8")) <= 16 for piece in pieces)
+    assert len(list(iter_file(str(path)))) == 1
+
+
+@patch("translation_agent.utils.num_tokens_in_string", side_effect=count_words)
+def test_iter_file_chunks(_, tmp_path):
+    path = tmp_path / "corpus.txt"
+    path.write_text("a b\n\nc d\ne\n\n")
+    assert list(iter_file_chunks(str(path), max_tokens=3)) == [
+        "a b\n",
+        "c d\ne\n",
+    ]
@@ -0,0 +1,101 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from translation_agent.subtitles import translate_cues, translate_srt
+
+
+SRT = """1
+00:00:01,000 --> 00:00:02,500
+Where are you
+going?
+
+2
+00:00:03,000 --> 00:00:04,000
+<i>Home.</i>
+
+3
+00:01:00,000 --> 00:01:02,000
+See you tomorrow.
+"""
+
+
+@pytest.fixture(autouse=True)
+def word_tokens():
+    with patch(
+        "translation_agent.utils.num_tokens_in_string",
+        side_effect=lambda text: len(text.split()),
+    ):
+        yield
+
+
+def cues_in(prompt, marker):
+    start = prompt.index("{", prompt.index(marker))
+    cues, _ = json.JSONDecoder().raw_decode(prompt[start:])
+    return cues
+
+
+def fake_completion(prompt, system_message=None, json_mode=False):
+    if not json_mode:
+        return "Make it shorter."
+    if "initial translation" in prompt:
+        cues = cues_in(prompt, "initial translation")
+        return json.dumps(
+            {"translations": {k: v + "!" for k, v in cues.items()}}
+        )
+    cues = cues_in(prompt, "cue IDs to text")
+    return json.dumps({"translations": {k: v.upper() for k, v in cues.items()}})
+
+
+def test_srt_keeps_cues_and_timecodes():
+    with patch(
+        "translation_agent.utils.get_completion", side_effect=fake_completion
+    ) as get_completion:
+        translated = translate_srt("English", "Spanish", SRT)
+
+    expected = (
+        SRT.replace("Where are you\ngoing?", "WHERE ARE YOU\nGOING?!")
+        .replace("<i>Home.</i>", "<I>HOME.</I>!")
+        .replace("See you tomorrow.", "SEE YOU TOMORROW.!")
+    )
+    assert translated == expected
+    # One batch: translate, reflect and improve
+    assert get_completion.call_count == 3
+
+
+def test_cues_are_batched_with_neighbouring_context():
+    cues = [f"line {i}" for i in range(10)]
+    prompts = []
+
+    def complete(prompt, system_message=None, json_mode=False):
+        prompts.append(prompt)
+        return fake_completion(prompt, system_message, json_mode)
+
+    with patch("translation_agent.utils.get_completion", side_effect=complete):
+        result = translate_cues(
+            "English", "Spanish", cues, max_batch_tokens=8, reflect=False
+        )
+
+    assert result == [f"LINE {i}" for i in range(10)]
+    assert len(prompts) == 3
+    second = prompts[1]
+    assert list(cues_in(second, "cue IDs to text")) == ["4", "5", "6", "7"]
+    assert list(cues_in(second, "Before:")) == ["1", "2", "3"]
+    assert list(cues_in(second, "After:")) == ["8", "9"]
+
+
+def test_missing_cue_falls_back_to_a_single_call():
+    def complete(prompt, system_message=None, json_mode=False):
+        return json.dumps({"translations": {"0": "uno"}})
+
+    with patch(
+        "translation_agent.utils.get_completion", side_effect=complete
+    ), patch(
+        "translation_agent.utils.one_chunk_initial_translation",
+        return_value="dos",
+    ):
+        result = translate_cues(
+            "English", "Spanish", ["one", "two"], reflect=False
+        )
+    assert result == ["uno", "dos"]
@@ -0,0 +1,77 @@
+import random
+
+from app.text_diff import diff_texts, iter_diff, myers_diff
+
+
+def sides(highlighted):
+    old = "".join(w for w, c in highlighted if c != "added")
+    new = "".join(w for w, c in highlighted if c != "removed")
+    return old, new
+
+
+def test_myers_diff_is_a_shortest_edit_script():
+    rng = random.Random(0)
+    for _ in range(300):
+        a = [rng.randrange(4) for _ in range(rng.randrange(12))]
+        b = [rng.randrange(4) for _ in range(rng.randrange(12))]
+        script = list(myers_diff(a, b))
+        assert [a[i] for op, i in script if op != "insert"] == a
+        assert [
+            b[i] if op == "insert" else a[i]
+            for op, i in script
+            if op != "delete"
+        ] == b
+        # The longest common subsequence, by dynamic programming
+        lcs = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+        for i in range(len(a)):
+            for j in range(len(b)):
+                lcs[i + 1][j + 1] = (
+                    lcs[i][j] + 1
+                    if a[i] == b[j]
+                    else max(lcs[i][j + 1], lcs[i + 1][j])
+                )
+        equal = sum(op == "equal" for op, _ in script)
+        assert equal == lcs[len(a)][len(b)]
+
+
+def test_changed_words_are_marked_per_paragraph():
+    init = "The cat sat.\nUnchanged line.\nThe end."
+    final = "The dog sat.\nUnchanged line.\nA new line.\nThe end."
+    highlighted = diff_texts(init, final)
+
+    assert sides(highlighted) == (
+        "The cat sat .\nUnchanged line .\nThe end .",
+        "The dog sat .\nUnchanged line .\nA new line .\nThe end .",
+    )
+    assert [(w, c) for w, c in highlighted if c] == [
+        ("cat", "removed"),
+        ("dog", "added"),
+        ("\n", "added"),
+        ("A", "added"),
+        (" ", "added"),
+        ("new", "added"),
+        (" ", "added"),
+        ("line", "added"),
+        (" ", "added"),
+        (".", "added"),
+    ]
+
+
+def test_chunks_are_diffed_lazily():
+    init = ["Chunk one.", "Chunk two."]
+    final = ["Chunk one.", "Chunk 2."]
+    diff = iter_diff(init, final)
+
+    assert next(diff) == ("Chunk", None)
+    rest = list(diff)
+    assert ("two", "removed") in rest and ("2", "added") in rest
+    assert "\n" not in [w for w, _ in rest]
+
+
+def test_unchanged_text_has_no_edits():
+    text = "Alpha beta.\n\nGamma delta, epsilon."
+    highlighted = diff_texts(text, text)
+    assert all(c is None for _, c in highlighted)
+    assert sides(highlighted) == (
+        "Alpha beta .\n\nGamma delta , epsilon .",
+    ) * 2